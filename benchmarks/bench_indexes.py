@@ -0,0 +1,149 @@
+"""
+Benchmark of the identifier and year lookups, with and without the indexes
+added by the migration 0007_identifier_and_year_indexes.
+
+A synthetic dataset is loaded, then each lookup is timed and explained with the
+indexes, then again after the migration is unapplied.
+
+Usage:
+    python -m benchmarks.bench_indexes [--scale 1] [--repeat 20] [--output report.json]
+"""
+import argparse
+
+from benchmarks.utils import (
+    analyze_database,
+    benchmark_database,
+    setup_django,
+    time_call,
+    write_report,
+)
+
+INDEXES_MIGRATION = ("francedata", "0007_identifier_and_year_indexes")
+YEARS = [2020, 2021]
+DATACODES = ["pop_muni", "pop_tot", "superficie", "densite", "tcam"]
+
+
+def get_queries(dataset, year: int) -> dict:
+    """
+    The lookups done by the API endpoints and the importers
+    """
+    from francedata.models import (
+        Commune,
+        CommuneData,
+        Departement,
+        Epci,
+        Region,
+    )
+
+    commune = dataset.communes[len(dataset.communes) // 2]
+    departement = dataset.departements[len(dataset.departements) // 2]
+    epci = dataset.epcis[len(dataset.epcis) // 2]
+    region = dataset.regions[len(dataset.regions) // 2]
+
+    return {
+        "commune_by_siren": Commune.objects.filter(siren=commune["siren"]),
+        "commune_by_insee": Commune.objects.filter(insee=commune["insee"]),
+        "commune_by_insee_and_year": Commune.objects.filter(
+            insee=commune["insee"], years__year=year
+        ),
+        "communes_of_year": Commune.objects.filter(years__year=year).only("id"),
+        "epci_by_siren_and_year": Epci.objects.filter(
+            siren=epci["siren"], years__year=year
+        ),
+        "departement_by_insee_and_year": Departement.objects.filter(
+            insee=departement["insee"], years__year=year
+        ),
+        "departement_by_siren": Departement.objects.filter(siren=departement["siren"]),
+        "region_by_siren": Region.objects.filter(siren=region["siren"]),
+        "commune_data_by_datacode_and_year": CommuneData.objects.filter(
+            datacode="superficie", year__year=year
+        ).only("id"),
+    }
+
+
+def measure(queries: dict, repeat: int) -> dict:
+    from django.db import connection
+
+    results = {}
+    for name, queryset in queries.items():
+        if connection.vendor == "postgresql":
+            plan = queryset.explain(analyze=True)
+        else:
+            plan = queryset.explain()
+        results[name] = {
+            **time_call(lambda: list(queryset.all()), repeat),
+            "plan": plan.splitlines(),
+        }
+    return results
+
+
+def unapply_indexes_migration():
+    """
+    Rolls back only the indexes migration, without touching the later ones,
+    and returns a function restoring it
+    """
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    loader = MigrationExecutor(connection).loader
+    migration = loader.get_migration(*INDEXES_MIGRATION)
+    # Both apply() and unapply() expect the state preceding the migration
+    state = loader.project_state(INDEXES_MIGRATION, at_end=False)
+
+    with connection.schema_editor() as schema_editor:
+        migration.unapply(state.clone(), schema_editor)
+
+    def restore():
+        with connection.schema_editor() as schema_editor:
+            migration.apply(state.clone(), schema_editor)
+
+    return restore
+
+
+def run(scale: float, repeat: int) -> dict:
+    from francedata.tests.testdata.generator import SyntheticFrance, populate_database
+
+    dataset = SyntheticFrance(scale)
+    populate_database(dataset, years=YEARS, datacodes=DATACODES)
+    analyze_database()
+
+    queries = get_queries(dataset, YEARS[-1])
+    after = measure(queries, repeat)
+
+    restore = unapply_indexes_migration()
+    analyze_database()
+    before = measure(queries, repeat)
+    restore()
+
+    return {
+        "benchmark": "indexes",
+        "scale": scale,
+        "communes": len(dataset.communes),
+        "commune_data_rows": len(dataset.communes) * len(YEARS) * len(DATACODES),
+        "queries": {
+            name: {"before": before[name], "after": after[name]} for name in queries
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", type=str, help="Path of the JSON report")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        report = run(args.scale, args.repeat)
+
+    for name, result in report["queries"].items():
+        print(
+            f"{name:40} before: {result['before']['median_ms']:>9.3f} ms"
+            f"   after: {result['after']['median_ms']:>9.3f} ms"
+        )
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of the startup time of the app, measured with python -X importtime.
+
+Each run starts a new interpreter that sets Django up, which imports the models of
+all the installed apps. The import time of the francedata modules loaded at that point
+is reported, along with the heavy dependencies of the importers found loaded.
+
+Django imports francedata.models with importlib, which -X importtime does not trace,
+so its time is the sum of the cumulative times of the outermost francedata modules.
+
+Usage:
+    python -m benchmarks.bench_startup [--repeat 10] [--budget-ms 150] [--output report.json]
+"""
+
+import argparse
+import re
+import statistics
+import sys
+
+from benchmarks.utils import setup_django, write_report
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Returns the cumulative import time of each outermost francedata module, in ms
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and not match.group(3) and match.group(4).startswith("francedata"):
+            timings[match.group(4)] = int(match.group(2)) / 1000
+    return timings
+
+
+def measure_startup() -> dict:
+    from francedata.tests.startup import run_startup
+
+    result = run_startup("-X", "importtime", check=True)
+    timings = parse_importtime(result.stderr)
+    return {
+        "models_ms": round(sum(timings.values()), 3),
+        "modules_ms": timings,
+        "heavy_modules": result.stdout.split(),
+    }
+
+
+def run(repeat: int) -> dict:
+    runs = [measure_startup() for _ in range(repeat)]
+    models_ms = [run["models_ms"] for run in runs]
+    heavy_modules = sorted({name for run in runs for name in run["heavy_modules"]})
+
+    return {
+        "benchmark": "startup",
+        "francedata.models": {
+            "min_ms": round(min(models_ms), 3),
+            "median_ms": round(statistics.median(models_ms), 3),
+            "max_ms": round(max(models_ms), 3),
+        },
+        "heavy_modules_loaded": heavy_modules,
+        "modules_ms": runs[-1]["modules_ms"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="Fails if the median import time of francedata.models exceeds it",
+    )
+    parser.add_argument("--output", type=str, help="Path of the JSON report")
+    args = parser.parse_args()
+
+    setup_django()
+    report = run(args.repeat)
+    write_report(report, args.output)
+
+    median = report["francedata.models"]["median_ms"]
+    print(f"{'francedata.models':40} median: {median:>9.3f} ms")
+
+    errors = []
+    if report["heavy_modules_loaded"]:
+        errors.append(
+            "Loaded with the models: " + ", ".join(report["heavy_modules_loaded"])
+        )
+    if args.budget_ms is not None and median > args.budget_ms:
+        errors.append(f"Import time above the budget of {args.budget_ms} ms")
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
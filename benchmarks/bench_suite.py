@@ -0,0 +1,288 @@
+"""
+Benchmark of the importers and of the main API endpoints, at national scale.
+
+The source files are generated from a synthetic dataset and served by a local HTTP
+server standing in for data.gouv.fr and Banatic. The cog_import, banatic_import and
+files_import commands are timed level by level, then the API endpoints are timed
+on the imported data, with the response cache cleared before each call.
+
+Usage:
+    python -m benchmarks.bench_suite [--scale 1] [--year 2021] [--repeat 20] [--output report.json]
+
+The command exits with an error status if an import fails or an endpoint returns
+an error, after writing the report.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.utils import (
+    benchmark_database,
+    count_queries,
+    serve_directory,
+    setup_django,
+    time_call,
+    write_report,
+)
+
+API_ROOT = "/api/france"
+
+
+def write_source_files(dataset, directory: str, year: int) -> dict:
+    from francedata.tests.testdata.generator import (
+        write_banatic_files,
+        write_cog_files,
+        write_communes_data_file,
+    )
+
+    return {
+        **write_cog_files(dataset, directory, year),
+        **write_banatic_files(dataset, directory, year),
+        "communes_data": write_communes_data_file(dataset, directory, year),
+    }
+
+
+def write_datagouv_dataset(directory: str, dataset_id: str, resources: dict) -> None:
+    """
+    Writes the data.gouv.fr API response for a dataset, listing the given resources
+    (title: url). It is served as the index of the dataset folder.
+    """
+    dataset_directory = os.path.join(directory, "api", "1", "datasets", dataset_id)
+    os.makedirs(dataset_directory, exist_ok=True)
+    with open(os.path.join(dataset_directory, "index.html"), "w") as response_file:
+        json.dump(
+            {
+                "resources": [
+                    {"title": title, "url": url} for title, url in resources.items()
+                ]
+            },
+            response_file,
+        )
+
+
+def point_importers_to(base_url: str, directory: str, files: dict, year: int) -> None:
+    from francedata.services import banatic, cog, datagouv
+
+    def url(path: str) -> str:
+        return base_url + os.path.relpath(path, directory)
+
+    write_datagouv_dataset(
+        directory,
+        cog.COG_ID,
+        {
+            f"Millésime {year} : Liste des régions": url(files["regions"]),
+            f"Millésime {year} : Liste des départements": url(files["departements"]),
+            f"Millésime {year} : Liste des communes": url(files["communes"]),
+        },
+    )
+    write_datagouv_dataset(
+        directory,
+        banatic.BANATIC_ID,
+        {f"Périmètre des EPCI à fiscalité propre - année {year}": url(files["epcis"])},
+    )
+    datagouv.API_BASE = f"{base_url}api/1/"
+    banatic.BANATIC_SIREN_INSEE_URL = url(files["siren_insee"])
+
+
+def create_data_source_file(path: str, year: int):
+    from django.core.files import File
+
+    from francedata.models import DataMapping, DataSource, DataSourceFile, DataYear
+    from francedata.tests.testdata.generator import COMMUNES_DATA_MAPPING
+
+    year_entry, _created = DataYear.objects.get_or_create(year=year)
+    source_file = DataSourceFile(
+        data_mapping=DataMapping.objects.create(
+            name="Synthetic commune data",
+            file_format="csv",
+            mapping=COMMUNES_DATA_MAPPING,
+        ),
+        source=DataSource.objects.create(
+            title="Synthetic commune data", year=year_entry
+        ),
+    )
+    with open(path, "rb") as data_file:
+        source_file.data_file.save(os.path.basename(path), File(data_file))
+    return source_file
+
+
+def time_command(name: str, **options) -> dict:
+    """
+    Runs a management command, and returns its duration and number of queries
+    """
+    from django.core.management import call_command
+
+    with count_queries() as counter, redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        try:
+            call_command(name, **options)
+            error = None
+        except Exception as e:
+            error = repr(e)
+        duration = time.perf_counter() - start
+
+    result = {"duration_s": round(duration, 3), "queries": counter["queries"]}
+    if error:
+        result["error"] = error
+    return result
+
+
+def run_imports(files: dict, year: int) -> dict:
+    results = {}
+    for level in ["regions", "departements", "communes"]:
+        results[f"cog_import {level}"] = time_command(
+            "cog_import", level=level, year=year
+        )
+    for level in ["communes", "epci"]:
+        results[f"banatic_import {level}"] = time_command(
+            "banatic_import", level=level, year=year
+        )
+
+    create_data_source_file(files["communes_data"], year)
+    results["files_import"] = time_command("files_import")
+    return results
+
+
+def count_rows() -> dict:
+    from francedata.models import Commune, CommuneData, Departement, Epci, Region
+
+    return {
+        model.__name__: model.objects.count()
+        for model in [Region, Departement, Epci, Commune, CommuneData]
+    }
+
+
+def get_endpoints(dataset, year: int) -> dict:
+    """
+    The API calls to time: (method, path, params)
+    """
+    commune = dataset.communes[len(dataset.communes) // 2]
+    sirens = [item["siren"] for item in dataset.communes[::100][:100]]
+
+    return {
+        "search": ("get", f"/subdivisions/{commune['name'][:5]}", {"year": year}),
+        "list_regions": ("get", "/regions", {}),
+        "list_departements": ("get", "/departements", {}),
+        "get_commune_by_siren": ("get", f"/communes/siren/{commune['siren']}", {}),
+        "get_commune_by_insee": ("get", f"/communes/insee/{commune['insee']}", {}),
+        "communes_batch": ("post", "/communes/batch", {"codes": sirens}),
+        "commune_data": ("get", f"/communedata/{commune['siren']}", {}),
+        "latest_commune_data": (
+            "get",
+            f"/communedata/{commune['siren']}/latest",
+            {},
+        ),
+        "export_commune_data": (
+            "get",
+            "/export/communedata",
+            {"year": year, "datacode": "pop_tot"},
+        ),
+    }
+
+
+def run_endpoints(endpoints: dict, repeat: int) -> dict:
+    from django.test import Client
+
+    from francedata.services.api_router import get_api_cache
+
+    client = Client()
+    cache = get_api_cache()
+
+    def call(method: str, path: str, params: dict):
+        cache.clear()
+        if method == "post":
+            response = client.post(
+                API_ROOT + path, json.dumps(params), content_type="application/json"
+            )
+        else:
+            response = client.get(API_ROOT + path, params)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    results = {}
+    for name, endpoint in endpoints.items():
+        with count_queries() as counter:
+            status, size = call(*endpoint)
+        results[name] = {
+            "status": status,
+            "size": size,
+            "queries": counter["queries"],
+            **time_call(lambda: call(*endpoint), repeat),
+        }
+    return results
+
+
+def run(scale: float, year: int, repeat: int) -> dict:
+    from django.test.utils import override_settings, setup_test_environment
+
+    from francedata.tests.testdata.generator import SyntheticFrance
+
+    dataset = SyntheticFrance(scale)
+    setup_test_environment()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_source_files(dataset, directory, year)
+        with serve_directory(directory) as base_url, override_settings(
+            MEDIA_ROOT=os.path.join(directory, "media")
+        ):
+            point_importers_to(base_url, directory, files, year)
+            imports = run_imports(files, year)
+
+    return {
+        "benchmark": "suite",
+        "scale": scale,
+        "year": year,
+        "communes": len(dataset.communes),
+        "epcis": len(dataset.epcis),
+        "imports": imports,
+        "rows": count_rows(),
+        "endpoints": run_endpoints(get_endpoints(dataset, year), repeat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--year", type=int, default=2021)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", type=str, help="Path of the JSON report")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        report = run(args.scale, args.year, args.repeat)
+
+    for name, result in report["imports"].items():
+        print(
+            f"{name:40} {result['duration_s']:>9.3f} s"
+            f"   {result['queries']:>9} queries   {result.get('error', '')}"
+        )
+    for name, result in report["endpoints"].items():
+        print(
+            f"{name:40} {result['median_ms']:>9.3f} ms"
+            f"   {result['queries']:>9} queries   status {result['status']}"
+        )
+    write_report(report, args.output)
+
+    # A failed step makes the timings meaningless
+    failed = [
+        name for name, result in report["imports"].items() if "error" in result
+    ] + [
+        name for name, result in report["endpoints"].items() if result["status"] >= 400
+    ]
+    if failed:
+        sys.exit(f"Failed steps: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
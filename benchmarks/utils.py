@@ -0,0 +1,120 @@
+"""
+Shared helpers for the benchmarks.
+
+The benchmarks run against a throwaway test database, created from the settings
+of the example project (or of the DJANGO_SETTINGS_MODULE environment variable),
+so they never touch the development data.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+def setup_django() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(keepdb: bool = False):
+    """
+    Creates the test database, with all migrations applied, and destroys it afterwards
+    """
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@contextmanager
+def serve_directory(directory: str):
+    """
+    Serves the files of a directory on a local HTTP server, standing in for
+    data.gouv.fr and Banatic. Yields the base URL of the server.
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(QuietHandler, directory=directory)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def analyze_database() -> None:
+    """
+    Refreshes the planner statistics after a bulk load or an index change
+    """
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the SQL queries run in the block, without storing them.
+    Yields a dict whose "queries" key is updated as the queries are executed.
+    """
+    from django.db import connection
+
+    counter = {"queries": 0}
+
+    def wrapper(execute, sql, params, many, context):
+        counter["queries"] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+def time_call(func: Callable, repeat: int = 10) -> dict:
+    """
+    Calls func repeat times, and returns its timings in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def write_report(report: dict, output: str = None) -> None:
+    """
+    Writes the report as JSON, to a file or to the standard output
+    """
+    content = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w") as output_file:
+            output_file.write(content + "\n")
+        print(f"Report written to {output}")
+    else:
+        print(content)
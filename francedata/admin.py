@@ -1,6 +1,10 @@
 from django.db.models import JSONField
 from django.contrib import admin
+from django.http import JsonResponse
 from django.http.response import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from django.utils.html import format_html_join
 from django_json_widget.widgets import JSONEditorWidget
 from simple_history.admin import SimpleHistoryAdmin
 
@@ -33,16 +37,53 @@ class CommuneDataInline(admin.TabularInline):
     extra = 0
 
 
+class CommuneEpciMembershipInline(admin.TabularInline):
+    model = models.CommuneEpciMembership
+    fields = ("year", "epci")
+    readonly_fields = ("year", "epci")
+    ordering = ["-year__year"]
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("epci", "year")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class SubdivisionCountsMixin:
+    """
+    Adds the precomputed counts of subdivisions to the collectivities,
+    instead of counting them with one query per row of the list
+    """
+
+    def get_queryset(self, request):
+        return models.SubdivisionCount.annotate_queryset(super().get_queryset(request))
+
+    def counts_filters(self, obj) -> dict:
+        # The linked subdivisions are those of the counted year
+        year_id = getattr(obj, "counts_year_id", None)
+        return {"years__id__exact": year_id} if year_id else {}
+
+
 # Templates
 @admin.register(models.Region)
-class RegionAdmin(CollectivityModelAdmin):
+class RegionAdmin(SubdivisionCountsMixin, CollectivityModelAdmin):
     search_fields = ("name__startswith", "slug", "insee", "siren")
     list_display = ("name", "slug", "insee", "siren", "view_departements_link")
     ordering = ["name"]
     inlines = [RegionDataInline]
 
     def view_departements_link(self, obj):
-        return view_reverse_changelink(obj, "francedata", "region", "departement")
+        return view_reverse_changelink(
+            obj,
+            "francedata",
+            "region",
+            "departement",
+            count=getattr(obj, "departements_count", None),
+            filters=self.counts_filters(obj),
+        )
 
     view_departements_link.short_description = "Départements"
 
@@ -74,7 +115,7 @@ class RegionAdmin(CollectivityModelAdmin):
 
 
 @admin.register(models.Departement)
-class DepartementAdmin(CollectivityModelAdmin):
+class DepartementAdmin(SubdivisionCountsMixin, CollectivityModelAdmin):
     search_fields = ("name__startswith", "slug", "insee", "siren")
     list_display = ("name", "slug", "insee", "siren", "view_communes_link")
     list_filter = ("years", "region")
@@ -82,7 +123,14 @@ class DepartementAdmin(CollectivityModelAdmin):
     inlines = [DepartementDataInline]
 
     def view_communes_link(self, obj):
-        return view_reverse_changelink(obj, "francedata", "departement", "commune")
+        return view_reverse_changelink(
+            obj,
+            "francedata",
+            "departement",
+            "commune",
+            count=getattr(obj, "communes_count", None),
+            filters=self.counts_filters(obj),
+        )
 
     view_communes_link.short_description = "Communes"
 
@@ -121,18 +169,39 @@ class DepartementAdmin(CollectivityModelAdmin):
 
 
 @admin.register(models.Epci)
-class EpciAdmin(TimeStampModelAdmin):
+class EpciAdmin(SubdivisionCountsMixin, TimeStampModelAdmin):
     search_fields = ("name", "slug", "siren")
     list_display = ("name", "slug", "siren", "view_communes_link")
     ordering = ["name"]
     inlines = [EpciDataInline]
 
     def view_communes_link(self, obj):
-        return view_reverse_changelink(obj, "francedata", "epci", "commune")
+        return view_reverse_changelink(
+            obj,
+            "francedata",
+            "epci",
+            "commune",
+            count=getattr(obj, "communes_count", None),
+            filters=self.counts_filters(obj),
+        )
 
     view_communes_link.short_description = "Communes"
 
-    readonly_fields = ["id", "slug", "created_at", "updated_at", "view_communes_link"]
+    def view_memberships_link(self, obj):
+        return view_reverse_changelink(
+            obj, "francedata", "epci", "communeepcimembership"
+        )
+
+    view_memberships_link.short_description = "Historique des membres"
+
+    readonly_fields = [
+        "id",
+        "slug",
+        "created_at",
+        "updated_at",
+        "view_communes_link",
+        "view_memberships_link",
+    ]
 
     fieldsets = [
         (
@@ -145,6 +214,7 @@ class EpciAdmin(TimeStampModelAdmin):
                     "years",
                     "siren",
                     "view_communes_link",
+                    "view_memberships_link",
                 ]
             },
         ),
@@ -167,7 +237,7 @@ class CommuneAdmin(TimeStampModelAdmin):
         "departement_link",
         "region_link",
     ]
-    inlines = [CommuneDataInline]
+    inlines = [CommuneEpciMembershipInline, CommuneDataInline]
 
     fieldsets = [
         (
@@ -204,6 +274,15 @@ class CommuneAdmin(TimeStampModelAdmin):
     region_link.short_description = "région"
 
 
+@admin.register(models.CommuneEpciMembership)
+class CommuneEpciMembershipAdmin(TimeStampModelAdmin):
+    search_fields = ("commune__name", "commune__insee", "epci__name", "epci__siren")
+    list_display = ("commune", "epci", "year")
+    list_filter = ("year",)
+    list_select_related = ("commune__departement", "epci", "year")
+    raw_id_fields = ("commune", "epci")
+
+
 @admin.register(models.DataSource)
 class DataSourceAdmin(TimeStampModelAdmin):
     fieldsets = [
@@ -235,6 +314,90 @@ class DataSourceFileAdmin(TimeStampModelAdmin):
         return super().response_change(request, obj)
 
     list_display = ("__str__", "is_imported")
+    readonly_fields = [
+        "id",
+        "created_at",
+        "updated_at",
+        "checkpoint_offset",
+        "checkpoint_hash",
+        "content_hash",
+        "data_mapping_version",
+        "same_content_files",
+    ]
+
+    def same_content_files(self, obj):
+        """
+        The other files with the same content, whose import is skipped
+        if one of them was imported for the same year and mapping version
+        """
+        if not obj.content_hash:
+            return "-"
+        files = models.DataSourceFile.objects.filter(
+            content_hash=obj.content_hash
+        ).exclude(pk=obj.pk)
+        links = [
+            related_object_link(
+                file,
+                f"{file} ({'importé' if file.is_imported else 'non importé'}, "
+                f"version {file.data_mapping_version})",
+            )
+            for file in files
+        ]
+        return format_html_join(", ", "{}", ((link,) for link in links)) or "-"
+
+    same_content_files.short_description = "fichiers au contenu identique"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<path:object_id>/import-progress/",
+                self.admin_site.admin_view(self.import_progress_view),
+                name="francedata_datasourcefile_import_progress",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_progress_view(self, request, object_id):
+        """
+        The state of the last import job of the file, polled by the change form
+        """
+        source_file = get_object_or_404(models.DataSourceFile, pk=object_id)
+        if not self.has_view_or_change_permission(request, source_file):
+            return JsonResponse({}, status=403)
+
+        job = source_file.import_jobs.order_by("-created_at").first()
+        return JsonResponse({"job": job.get_progress() if job else None})
+
+
+@admin.register(models.ImportJob)
+class ImportJobAdmin(TimeStampModelAdmin):
+    list_display = (
+        "source_file",
+        "status",
+        "rows_done",
+        "rows_total",
+        "worker",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    list_select_related = ("source_file",)
+    readonly_fields = [
+        "id",
+        "status",
+        "rows_done",
+        "rows_total",
+        "messages",
+        "worker",
+        "started_at",
+        "finished_at",
+        "created_at",
+        "updated_at",
+    ]
+
+    def has_add_permission(self, request):
+        # The jobs are queued from the source files
+        return False
 
 
 @admin.register(models.DataMapping)
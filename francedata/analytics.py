@@ -0,0 +1,159 @@
+"""
+Bulk access to the collectivity data, as pandas DataFrames.
+
+The data is read with one values_list query per chunk of rows, without creating
+model instances, then pivoted to a wide table: one row per collectivity (indexed
+by Insee id, or Siren id for the EPCIs) and one column per datacode.
+
+The numeric datacodes are read from the typed value columns and returned as NumPy
+columns: int64 for the int datatypes, read from the integer column (float64 if some
+values are missing), float64 for the others. The other datacodes are returned as
+strings.
+
+pandas is only needed by this module, it is not loaded with the models.
+"""
+from typing import List
+
+import numpy
+import pandas
+from django.db.models import FloatField, Max
+from django.db.models.functions import Cast
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    DataYear,
+    Departement,
+    DepartementData,
+    Epci,
+    EpciData,
+    INT_DATATYPES,
+    NUMERIC_DATATYPES,
+    Region,
+    RegionData,
+)
+
+# Rows read per query
+FRAME_CHUNK_SIZE = 100000
+
+# The collectivity and data models of each level, with the identifier of the index
+FRAME_LEVELS = {
+    "region": (Region, RegionData, "insee"),
+    "departement": (Departement, DepartementData, "insee"),
+    "epci": (Epci, EpciData, "siren"),
+    "commune": (Commune, CommuneData, "insee"),
+}
+
+
+def read_rows(queryset, fields: List[str], chunk_size: int) -> list:
+    """
+    Reads the fields of the queryset, by chunks of rows on the id
+    """
+    rows = []
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", *fields)[:chunk_size]
+        )
+        rows += chunk
+        if len(chunk) < chunk_size:
+            return rows
+        last_id = chunk[-1][0]
+
+
+def column_dtype(datatype: str, column: pandas.Series):
+    if datatype in INT_DATATYPES and not column.isna().any():
+        return numpy.int64
+    if datatype in NUMERIC_DATATYPES:
+        return numpy.float64
+    return object
+
+
+def to_frame(
+    level: str,
+    year: int = None,
+    datacodes: List[str] = None,
+    years: List[int] = None,
+    chunk_size: int = FRAME_CHUNK_SIZE,
+) -> pandas.DataFrame:
+    """
+    Returns the data of all the collectivities of a level, as a wide DataFrame.
+
+    level: region, departement, epci or commune
+    year: the year of the data, by default the latest one available for the level
+    datacodes: the datacodes to return as columns, by default all of them
+    years: if provided, the data of these years is returned instead, indexed by
+    (identifier, year)
+    """
+    if level not in FRAME_LEVELS:
+        raise ValueError(f"Level {level} is not valid")
+    collectivity_model, data_model, identifier = FRAME_LEVELS[level]
+    collectivity_id = f"{data_model.collectivity_field}_id"
+
+    if years is None:
+        if year is None:
+            year = data_model.objects.aggregate(Max("year__year"))["year__year__max"]
+        years = [year]
+    years_by_id = dict(
+        DataYear.objects.filter(year__in=years).values_list("id", "year")
+    )
+
+    queryset = data_model.objects.filter(year_id__in=years_by_id)
+    if datacodes:
+        queryset = queryset.filter(datacode__in=datacodes)
+    datatypes = dict(
+        queryset.exclude(datatype=None)
+        .order_by()
+        .values_list("datacode", "datatype")
+        .distinct()
+    )
+
+    rows = read_rows(
+        queryset.annotate(number=Cast("value_numeric", FloatField())),
+        [collectivity_id, "year_id", "datacode", "value", "value_int", "number"],
+        chunk_size,
+    )
+    index_names = [identifier, "year"] if len(years) > 1 else [identifier]
+    if not rows:
+        empty = pandas.DataFrame(columns=index_names + list(datacodes or []))
+        return empty.set_index(index_names)
+
+    # The object dtype keeps the integers exact, as the missing values would make
+    # the column a float one
+    data = pandas.DataFrame(
+        rows,
+        columns=["id", identifier, "year", "datacode", "value", "value_int", "number"],
+        dtype=object,
+    )
+    data["year"] = data["year"].map(years_by_id)
+
+    # The collectivities are identified by their Insee or Siren id
+    identifiers = dict(collectivity_model.objects.values_list("id", identifier))
+    data[identifier] = data[identifier].map(identifiers)
+    duplicates = data[data.duplicated(index_names + ["datacode"])]
+    if not duplicates.empty:
+        codes = ", ".join(sorted(set(duplicates[identifier].astype(str))))
+        raise ValueError(f"Several {level} entries have the {identifier} {codes}")
+
+    # The numeric datacodes take their values from the typed columns
+    numeric = data["datacode"].map(datatypes).isin(NUMERIC_DATATYPES)
+    data["cell"] = (
+        data["value"]
+        .where(~numeric, data["number"])
+        .where(data["value_int"].isna(), data["value_int"])
+    )
+
+    frame = data.pivot(index=index_names, columns="datacode", values="cell")
+    frame.columns.name = None
+    if datacodes:
+        frame = frame.reindex(columns=list(dict.fromkeys(datacodes)))
+    else:
+        frame = frame.reindex(columns=sorted(frame.columns))
+
+    for datacode in frame.columns:
+        frame[datacode] = frame[datacode].astype(
+            column_dtype(datatypes.get(datacode), frame[datacode])
+        )
+    return frame.sort_index()
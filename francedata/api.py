@@ -1,10 +1,12 @@
-from ninja import Router
-from unidecode import unidecode
-from typing import List
+import logging
+from decimal import Decimal
+from typing import Dict, List
 from django.shortcuts import get_object_or_404
 
 from django.db.models import Max
-from django.db.models import Q
+from django.db.models import FilteredRelation, Q, Subquery
+from django.db.models.fields.json import KeyTransform
+from django.db.models.query import QuerySet
 
 from francedata.models import (
     Metadata,
@@ -13,36 +15,179 @@ from francedata.models import (
     Epci,
     Commune,
     DataYear,
+    SNAPSHOT_MODELS,
+    snapshots_enabled,
 )
 from francedata.models.collectivity import (
     CommuneData,
     DepartementData,
     EpciData,
     RegionData,
+    normalize_search_name,
+    read_value,
 )
 
 from francedata.schemas import (
+    BatchQuerySchema,
+    CommuneBatchSchema,
     CommuneDataSchema,
+    DepartementBatchSchema,
     DepartementDataSchema,
+    EpciBatchSchema,
     EpciDataSchema,
+    HierarchyBatchSchema,
+    HierarchySchema,
+    RegionBatchSchema,
     RegionDataSchema,
+    RankingSchema,
     RegionSchema,
+    SnapshotSchema,
+    TimeseriesBatchSchema,
+    TimeseriesQuerySchema,
+    TimeseriesSchema,
     DepartementSchema,
     EpciSchema,
     CommuneSchema,
 )
+from francedata.services.api_router import VersionedRouter, cache_response
+from francedata.services.export import EXPORT_FORMATS, streaming_export
+
+router = VersionedRouter()
+
+RANKING_MAX_LIMIT = 1000
+
+# Related objects serialized with each collectivity level:
+# (select_related lookups, prefetch_related lookups)
+COLLECTIVITY_RELATIONS = {
+    "region": ([], ["years"]),
+    "departement": (["region"], ["years", "region__years"]),
+    "epci": ([], ["years"]),
+    "commune": (
+        ["epci", "departement__region"],
+        ["years", "epci__years", "departement__years", "departement__region__years"],
+    ),
+}
+
+# Identifier fields of each collectivity level, with the code lengths they accept
+COLLECTIVITY_IDENTIFIERS = {
+    "region": {"insee": (2,), "siren": (9,)},
+    "departement": {"insee": (2, 3), "siren": (9,)},
+    "epci": {"siren": (9,)},
+    "commune": {"insee": (5,), "siren": (9,)},
+}
+
+DATA_MODELS = {
+    "region": RegionData,
+    "departement": DepartementData,
+    "epci": EpciData,
+    "commune": CommuneData,
+}
+
+
+def with_relations(queryset: QuerySet, collectivity: str, prefix: str = "") -> QuerySet:
+    """
+    Fetches the related objects serialized with the collectivities of the queryset,
+    in a number of queries that does not depend on the number of results.
+
+    prefix is the path to the collectivity from the model of the queryset.
+    """
+    select_related, prefetch_related = COLLECTIVITY_RELATIONS[collectivity]
+    if prefix:
+        select_related = [prefix] + [f"{prefix}__{item}" for item in select_related]
+        prefetch_related = [f"{prefix}__{item}" for item in prefetch_related]
+    return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
 
-router = Router()
+
+def data_queryset(model) -> QuerySet:
+    """
+    The queryset of a collectivity data model, with the related objects it serializes
+    """
+    collectivity = model.collectivity_field
+    queryset = model.objects.select_related("year", "source__year")
+    return with_relations(queryset, collectivity, prefix=collectivity)
+
+
+def codes_lookup(
+    codes: List[str], identifiers: Dict[str, tuple], prefix: str = ""
+) -> tuple:
+    """
+    Dispatches the codes to the identifier fields by length, and returns them
+    by field with the matching lookup: one `IN` clause per identifier type.
+
+    prefix is the path to the collectivity from the model of the lookup.
+    """
+    codes_by_field = {}
+    lookup = Q()
+    for field, lengths in identifiers.items():
+        field_codes = {code for code in codes if len(code) in lengths}
+        if field_codes:
+            codes_by_field[field] = field_codes
+            path = f"{prefix}__{field}" if prefix else field
+            lookup |= Q(**{f"{path}__in": field_codes})
+    return codes_by_field, lookup
+
+
+def resolve_codes(
+    queryset: QuerySet,
+    codes: List[str],
+    identifiers: Dict[str, tuple],
+    year: int = None,
+) -> dict:
+    """
+    Resolves a list of mixed identifiers against a collectivity queryset
+
+    identifiers maps each identifier field (insee, siren) to the code lengths it accepts:
+    the codes are dispatched by length, then resolved with one `IN` clause per identifier type.
+    Returns the matched items keyed by input code, and the list of codes that were not found.
+    """
+    if year:
+        queryset = queryset.filter(years__year=year)
+
+    codes = list(dict.fromkeys(code.strip() for code in codes))
+    codes_by_field, lookup = codes_lookup(codes, identifiers)
+
+    results = {}
+    if codes_by_field:
+        # Ordered by id so that when a code matches several entries (e.g. across years),
+        # the most recently created one is kept
+        for item in queryset.filter(lookup).order_by("id"):
+            for field, field_codes in codes_by_field.items():
+                value = getattr(item, field)
+                if value in field_codes:
+                    results[value] = item
+
+    missing = [code for code in codes if code not in results]
+    return {"results": results, "missing": missing}
+
+
+def search_queryset(model, year_entry: DataYear) -> QuerySet:
+    """
+    The collectivities of a level for the year, read from the snapshot table of
+    the level when the snapshots are enabled and were built for the year.
+
+    Only the search reads the snapshots: the detail endpoints serialize the ids,
+    years and nested upper levels of the collectivities, which they do not hold.
+    """
+    if snapshots_enabled():
+        level = model._meta.model_name
+        snapshots = SNAPSHOT_MODELS[level].objects.filter(year=year_entry)
+        if snapshots.exists():
+            return snapshots
+        logging.warning(
+            f"No {level} snapshot for {year_entry}, the collectivities are read instead"
+        )
+    return model.objects.filter(years__exact=year_entry)
 
 
 @router.get("/subdivisions/{query}", tags=["subdivisions"])
+@cache_response()
 def search_subdivisions(request, query: str, category: str = None, year: int = None):
     """
     Search within all categories
 
     Allowed values for category parameter : all, communes, epcis, departements, regions
     """
-    query = unidecode(query).lower()
+    query = normalize_search_name(query)
 
     # Check type optional parameter:
     if category in ["communes", "epcis", "departements", "regions"]:
@@ -112,8 +257,8 @@ def search_subdivisions(request, query: str, category: str = None, year: int = N
                 "y",
             ]
             if query in shortnamed_communes:
-                communes_raw = Commune.objects.filter(
-                    name__unaccent__iexact=query, years__exact=communes_year_entry
+                communes_raw = search_queryset(Commune, communes_year_entry).filter(
+                    search_name=query
                 )
         if query.isnumeric() and (category == "departements" or return_all_categories):
             departements_raw = Departement.objects.filter(insee=query)
@@ -121,34 +266,34 @@ def search_subdivisions(request, query: str, category: str = None, year: int = N
             regions_raw = Region.objects.filter(insee=query)
     else:
         if category == "regions" or return_all_categories:
-            regions_raw = Region.objects.filter(
-                Q(name__unaccent__istartswith=query)
-                | Q(siren__startswith=query)
-                | Q(insee__startswith=query),
-                years__exact=regions_year_entry,
-            ).exclude(
-                siren__exact=""
+            regions_raw = (
+                search_queryset(Region, regions_year_entry)
+                .filter(
+                    Q(search_name__startswith=query)
+                    | Q(siren__startswith=query)
+                    | Q(insee__startswith=query),
+                )
+                .exclude(siren__exact="")
             )  # Exclude Mayotte that has no region-level Siren
         if category == "departements" or return_all_categories:
-            departements_raw = Departement.objects.filter(
-                Q(name__unaccent__istartswith=query)
-                | Q(siren__startswith=query)
-                | Q(insee__startswith=query),
-                years__exact=departements_year_entry,
-            ).exclude(
-                siren__exact=""
+            departements_raw = (
+                search_queryset(Departement, departements_year_entry)
+                .filter(
+                    Q(search_name__startswith=query)
+                    | Q(siren__startswith=query)
+                    | Q(insee__startswith=query),
+                )
+                .exclude(siren__exact="")
             )  # Exclude Haute-Corse, Corse-du-Sud, Martinique and Guyane that have no departement-level Siren
         if category == "epcis" or return_all_categories:
-            epcis_raw = Epci.objects.filter(
-                Q(name__unaccent__icontains=query) | Q(siren__startswith=query),
-                years__exact=epcis_year_entry,
+            epcis_raw = search_queryset(Epci, epcis_year_entry).filter(
+                Q(search_name__contains=query) | Q(siren__startswith=query),
             )
         if category == "communes" or return_all_categories:
-            communes_raw = Commune.objects.filter(
-                Q(name__unaccent__istartswith=query)
+            communes_raw = search_queryset(Commune, communes_year_entry).filter(
+                Q(search_name__startswith=query)
                 | Q(siren__startswith=query)
                 | Q(insee__startswith=query),
-                years__exact=communes_year_entry,
             )
 
     if len(regions_raw):
@@ -227,98 +372,264 @@ def search_subdivisions(request, query: str, category: str = None, year: int = N
 
 
 @router.get("/regions", response=List[RegionSchema], tags=["subdivisions"])
+@cache_response()
 def list_regions(request):
-    queryset = Region.objects.all()
+    queryset = with_relations(Region.objects.all(), "region")
     return queryset
 
 
+@router.post("/regions/batch", response=RegionBatchSchema, tags=["subdivisions"])
+def get_regions_batch(request, payload: BatchQuerySchema):
+    """
+    Retrieves several regions at once, by Insee (2 characters) or Siren (9 characters) id.
+    """
+    queryset = with_relations(Region.objects.all(), "region")
+    return resolve_codes(
+        queryset, payload.codes, COLLECTIVITY_IDENTIFIERS["region"], payload.year
+    )
+
+
 @router.get("/regions/{siren_id}", response=RegionSchema, tags=["subdivisions"])
+@cache_response()
 def get_region(request, siren_id):
-    item = get_object_or_404(Region, siren=siren_id)
+    item = get_object_or_404(
+        with_relations(Region.objects.all(), "region"), siren=siren_id
+    )
     return item
 
 
 @router.get("/departements", response=List[DepartementSchema], tags=["subdivisions"])
+@cache_response()
 def list_departements(request):
-    queryset = Departement.objects.all()
+    queryset = with_relations(Departement.objects.all(), "departement")
     return queryset
 
 
+@router.post(
+    "/departements/batch", response=DepartementBatchSchema, tags=["subdivisions"]
+)
+def get_departements_batch(request, payload: BatchQuerySchema):
+    """
+    Retrieves several départements at once, by Insee (2 or 3 characters) or Siren (9 characters) id.
+    """
+    queryset = with_relations(Departement.objects.all(), "departement")
+    return resolve_codes(
+        queryset, payload.codes, COLLECTIVITY_IDENTIFIERS["departement"], payload.year
+    )
+
+
 @router.get(
     "/departements/{siren_id}", response=DepartementSchema, tags=["subdivisions"]
 )
+@cache_response()
 def get_departement(request, siren_id):
-    item = get_object_or_404(Departement, siren=siren_id)
+    item = get_object_or_404(
+        with_relations(Departement.objects.all(), "departement"), siren=siren_id
+    )
     return item
 
 
 @router.get("/epcis", response=List[EpciSchema], tags=["subdivisions"])
+@cache_response()
 def list_epcis(request):
-    queryset = Epci.objects.all()
+    queryset = with_relations(Epci.objects.all(), "epci")
     return queryset
 
 
+@router.post("/epcis/batch", response=EpciBatchSchema, tags=["subdivisions"])
+def get_epcis_batch(request, payload: BatchQuerySchema):
+    """
+    Retrieves several EPCIs at once, by Siren id.
+    """
+    queryset = with_relations(Epci.objects.all(), "epci")
+    return resolve_codes(
+        queryset, payload.codes, COLLECTIVITY_IDENTIFIERS["epci"], payload.year
+    )
+
+
 @router.get("/epcis/{siren_id}", response=EpciSchema, tags=["subdivisions"])
+@cache_response()
 def get_epci(request, siren_id):
-    item = get_object_or_404(Epci, siren=siren_id)
+    item = get_object_or_404(with_relations(Epci.objects.all(), "epci"), siren=siren_id)
     return item
 
 
 @router.get("/communes", response=List[CommuneSchema], tags=["subdivisions"])
 def list_communes(request):
-    queryset = Epci.objects.all()
+    queryset = with_relations(Commune.objects.all(), "commune")
     return queryset
 
 
+@router.post("/communes/batch", response=CommuneBatchSchema, tags=["subdivisions"])
+def get_communes_batch(request, payload: BatchQuerySchema):
+    """
+    Retrieves several communes at once, by Insee (5 characters) or Siren (9 characters) id.
+    """
+    queryset = with_relations(Commune.objects.all(), "commune")
+    return resolve_codes(
+        queryset, payload.codes, COLLECTIVITY_IDENTIFIERS["commune"], payload.year
+    )
+
+
 @router.get(
     "/communes/{commune_id}",
     response={200: CommuneSchema, 404: dict},
     tags=["subdivisions"],
 )
+@cache_response()
 def get_commune(request, commune_id):
     """
     Depending if commune_id is 5 or 9 characters long, retrieves the commune by Insee or Siren id.
     """
+    queryset = with_relations(Commune.objects.all(), "commune")
     if len(commune_id) == 9:
-        item = get_object_or_404(Commune, siren=commune_id)
+        item = get_object_or_404(queryset, siren=commune_id)
     elif len(commune_id) == 5:
-        item = get_object_or_404(Commune, insee=commune_id)
+        item = get_object_or_404(queryset, insee=commune_id)
     else:
         return 404, {"message": "value is not a siren or insee id"}
     return 200, item
 
 
 @router.get("/communes/siren/{siren_id}", response=CommuneSchema, tags=["subdivisions"])
+@cache_response()
 def get_commune_by_siren(request, siren_id):
-    item = get_object_or_404(Commune, siren=siren_id)
+    item = get_object_or_404(
+        with_relations(Commune.objects.all(), "commune"), siren=siren_id
+    )
     return item
 
 
 @router.get("/communes/insee/{insee_id}", response=CommuneSchema, tags=["subdivisions"])
+@cache_response()
 def get_commune_by_insee(request, insee_id):
-    item = get_object_or_404(Commune, insee=insee_id)
+    item = get_object_or_404(
+        with_relations(Commune.objects.all(), "commune"), insee=insee_id
+    )
     return item
 
 
+# Hierarchy
+def read_hierarchies(codes: List[str], year_entry: DataYear = None) -> dict:
+    """
+    Returns the ancestry of the communes (EPCI, département and région), by code,
+    read with one query: the EPCI of the year comes from the memberships,
+    or the current EPCI of the communes if no year is specified.
+    """
+    codes_by_field, lookup = codes_lookup(codes, COLLECTIVITY_IDENTIFIERS["commune"])
+    if not codes_by_field:
+        return {}
+
+    queryset = Commune.objects.filter(lookup).select_related("departement__region")
+    if year_entry is not None:
+        queryset = (
+            queryset.filter(years=year_entry)
+            .annotate(
+                membership=FilteredRelation(
+                    "communeepcimembership",
+                    condition=Q(communeepcimembership__year=year_entry),
+                )
+            )
+            .select_related("membership__epci")
+        )
+    else:
+        queryset = queryset.select_related("epci")
+
+    results = {}
+    # Ordered by id so that when a code matches several communes (e.g. across years),
+    # the most recently created one is kept
+    for commune in queryset.order_by("id"):
+        if year_entry is not None:
+            # Not set on the communes without membership for the year
+            membership = getattr(commune, "membership", None)
+            epci = membership.epci if membership else None
+        else:
+            epci = commune.epci
+        hierarchy = {
+            "year": year_entry.year if year_entry is not None else None,
+            "commune": commune,
+            "epci": epci,
+            "departement": commune.departement,
+            "region": commune.departement.region,
+        }
+        for field, field_codes in codes_by_field.items():
+            value = getattr(commune, field)
+            if value in field_codes:
+                results[value] = hierarchy
+    return results
+
+
+@router.post(
+    "/hierarchy/batch",
+    response={200: HierarchyBatchSchema, 404: dict},
+    tags=["subdivisions"],
+)
+def get_hierarchy_batch(request, payload: BatchQuerySchema):
+    """
+    Returns the ancestry of several communes at once, by Insee or Siren id.
+    """
+    year_entry = None
+    if payload.year:
+        year_entry = DataYear.objects.filter(year=payload.year).first()
+        if year_entry is None:
+            return 404, {"message": f"year {payload.year} not found"}
+
+    codes = list(dict.fromkeys(code.strip() for code in payload.codes))
+    results = read_hierarchies(codes, year_entry)
+    missing = [code for code in codes if code not in results]
+    return 200, {"results": results, "missing": missing}
+
+
+@router.get(
+    "/hierarchy/{code}",
+    response={200: HierarchySchema, 404: dict},
+    tags=["subdivisions"],
+)
+@cache_response()
+def get_hierarchy(request, code: str, year: int = None):
+    """
+    Returns a commune with its EPCI, département and région, with their identifiers
+    and slugs. The EPCI is the one of the year, or the current one by default.
+
+    The commune is retrieved by Insee or Siren id.
+    """
+    year_entry = None
+    if year:
+        year_entry = DataYear.objects.filter(year=year).first()
+        if year_entry is None:
+            return 404, {"message": f"year {year} not found"}
+
+    hierarchy = read_hierarchies([code], year_entry).get(code)
+    if hierarchy is None:
+        return 404, {"message": f"commune {code} not found"}
+    return 200, hierarchy
+
+
 # Region data
 @router.get("/regiondata/{siren_id}", response=List[RegionDataSchema], tags=["data"])
 def get_region_data(request, siren_id):
     """
     Return all data for the given region
     """
-    queryset = RegionData.objects.filter(region__siren=siren_id)
+    queryset = data_queryset(RegionData).filter(region__siren=siren_id)
     return queryset
 
 
 @router.get(
     "/regiondata/{siren_id}/latest", response=List[RegionDataSchema], tags=["data"]
 )
-def get_latest_region_data(request, siren_id):
+def get_latest_region_data(request, siren_id, per_datacode: bool = False):
     """
     Return the latest data for the given region
+
+    By default, returns the data of the latest year available for it.
+    If per_datacode is set, returns the latest available value of each datacode.
     """
-    max_year = RegionData.objects.latest("year__year").year
-    queryset = RegionData.objects.filter(region__siren=siren_id, year=max_year)
+    queryset = (
+        data_queryset(RegionData)
+        .filter(region__siren=siren_id)
+        .latest_year(per_datacode)
+    )
     return queryset
 
 
@@ -329,7 +640,7 @@ def get_region_data_by_year(request, siren_id, year):
     """
     Return data for the given region and the given year
     """
-    queryset = RegionData.objects.filter(region__siren=siren_id, year__year=year)
+    queryset = data_queryset(RegionData).filter(region__siren=siren_id, year__year=year)
     return queryset
 
 
@@ -341,7 +652,7 @@ def get_departement_data(request, siren_id):
     """
     Return all data for the given département
     """
-    queryset = DepartementData.objects.filter(departement__siren=siren_id)
+    queryset = data_queryset(DepartementData).filter(departement__siren=siren_id)
     return queryset
 
 
@@ -350,13 +661,17 @@ def get_departement_data(request, siren_id):
     response=List[DepartementDataSchema],
     tags=["data"],
 )
-def get_latest_departement_data(request, siren_id):
+def get_latest_departement_data(request, siren_id, per_datacode: bool = False):
     """
     Return the latest data for the given département
+
+    By default, returns the data of the latest year available for it.
+    If per_datacode is set, returns the latest available value of each datacode.
     """
-    max_year = DepartementData.objects.latest("year__year").year
-    queryset = DepartementData.objects.filter(
-        departement__siren=siren_id, year=max_year
+    queryset = (
+        data_queryset(DepartementData)
+        .filter(departement__siren=siren_id)
+        .latest_year(per_datacode)
     )
     return queryset
 
@@ -370,7 +685,7 @@ def get_departement_data_by_year(request, siren_id, year):
     """
     Return data for the given département and the given year
     """
-    queryset = DepartementData.objects.filter(
+    queryset = data_queryset(DepartementData).filter(
         departement__siren=siren_id, year__year=year
     )
     return queryset
@@ -382,17 +697,21 @@ def get_epci_data(request, siren_id):
     """
     Return all data for the given EPCI
     """
-    queryset = EpciData.objects.filter(epci__siren=siren_id)
+    queryset = data_queryset(EpciData).filter(epci__siren=siren_id)
     return queryset
 
 
 @router.get("/epcidata/{siren_id}/latest", response=List[EpciDataSchema], tags=["data"])
-def get_latest_epci_data(request, siren_id):
+def get_latest_epci_data(request, siren_id, per_datacode: bool = False):
     """
     Return latest data for the given EPCI
+
+    By default, returns the data of the latest year available for it.
+    If per_datacode is set, returns the latest available value of each datacode.
     """
-    max_year = EpciData.objects.latest("year__year").year
-    queryset = EpciData.objects.filter(epci__siren=siren_id, year=max_year)
+    queryset = (
+        data_queryset(EpciData).filter(epci__siren=siren_id).latest_year(per_datacode)
+    )
     return queryset
 
 
@@ -401,7 +720,7 @@ def get_epci_data_by_year(request, siren_id, year):
     """
     Return data for the given EPCI and the given year
     """
-    queryset = EpciData.objects.filter(epci__siren=siren_id, year__year=year)
+    queryset = data_queryset(EpciData).filter(epci__siren=siren_id, year__year=year)
     return queryset
 
 
@@ -411,19 +730,25 @@ def get_commune_data(request, siren_id):
     """
     Return all data for the given commune
     """
-    queryset = CommuneData.objects.filter(commune__siren=siren_id)
+    queryset = data_queryset(CommuneData).filter(commune__siren=siren_id)
     return queryset
 
 
 @router.get(
     "/communedata/{siren_id}/latest", response=List[CommuneDataSchema], tags=["data"]
 )
-def get_latest_commune_data(request, siren_id):
+def get_latest_commune_data(request, siren_id, per_datacode: bool = False):
     """
     Return the latest data for the given commune
+
+    By default, returns the data of the latest year available for it.
+    If per_datacode is set, returns the latest available value of each datacode.
     """
-    max_year = CommuneData.objects.latest("year__year").year
-    queryset = CommuneData.objects.filter(commune__siren=siren_id, year=max_year)
+    queryset = (
+        data_queryset(CommuneData)
+        .filter(commune__siren=siren_id)
+        .latest_year(per_datacode)
+    )
     return queryset
 
 
@@ -434,5 +759,344 @@ def get_commune_data_by_year(request, siren_id, year):
     """
     Return data for the given commune and the given year
     """
-    queryset = CommuneData.objects.filter(commune__siren=siren_id, year__year=year)
+    queryset = data_queryset(CommuneData).filter(
+        commune__siren=siren_id, year__year=year
+    )
     return queryset
+
+
+# Time series
+def read_timeseries(level: str, codes: List[str], datacodes: List[str] = None) -> dict:
+    """
+    Returns the values of the collectivities across the years, by input code then
+    datacode, as [year, value] pairs sorted by year.
+
+    The data of all the codes is read in one query, on the (collectivity, datacode,
+    year) index. The numeric values are read from the typed columns.
+    """
+    model = DATA_MODELS[level]
+    collectivity = model.collectivity_field
+    identifiers = COLLECTIVITY_IDENTIFIERS[level]
+    codes_by_field, lookup = codes_lookup(codes, identifiers, prefix=collectivity)
+    if not codes_by_field:
+        return {}
+
+    queryset = model.objects.filter(lookup)
+    if datacodes:
+        queryset = queryset.filter(datacode__in=datacodes)
+    rows = queryset.order_by(f"{collectivity}_id").values_list(
+        *[f"{collectivity}__{field}" for field in identifiers],
+        "datacode",
+        "year__year",
+        "value",
+        "value_int",
+        "value_numeric",
+    )
+
+    values_by_code = {}
+    for *row_codes, datacode, year, value, value_int, value_numeric in rows:
+        value = read_value(value, value_int, value_numeric)
+        for field, code in zip(identifiers, row_codes):
+            if code in codes_by_field.get(field, ()):
+                series = values_by_code.setdefault(code, {})
+                series.setdefault(datacode, {})[year] = value
+
+    return {
+        code: {
+            datacode: [[year, value] for year, value in sorted(values.items())]
+            for datacode, values in series.items()
+        }
+        for code, series in values_by_code.items()
+    }
+
+
+@router.post(
+    "/timeseries/{level}/batch",
+    response={200: TimeseriesBatchSchema, 404: dict},
+    tags=["data"],
+)
+def get_timeseries_batch(request, level: str, payload: TimeseriesQuerySchema):
+    """
+    Returns the time series of several collectivities at once, by Insee or Siren id.
+
+    The codes without any data are listed as missing.
+    """
+    if level not in DATA_MODELS:
+        return 404, {"message": f"level must be one of {', '.join(DATA_MODELS)}"}
+
+    codes = list(dict.fromkeys(code.strip() for code in payload.codes))
+    results = read_timeseries(level, codes, payload.datacodes)
+    missing = [code for code in codes if code not in results]
+    return 200, {"results": results, "missing": missing}
+
+
+@router.get(
+    "/timeseries/{level}/{code}",
+    response={200: TimeseriesSchema, 404: dict},
+    tags=["data"],
+)
+@cache_response()
+def get_timeseries(request, level: str, code: str, datacodes: str = None):
+    """
+    Returns the values of a collectivity across the years: {datacode: [[year, value], ...]}
+
+    The collectivity is retrieved by Insee or Siren id. Multiple datacodes must
+    be separated by a comma; by default, all of them are returned.
+    """
+    if level not in DATA_MODELS:
+        return 404, {"message": f"level must be one of {', '.join(DATA_MODELS)}"}
+
+    if datacodes:
+        datacodes = [datacode.strip() for datacode in datacodes.split(",")]
+    series = read_timeseries(level, [code], datacodes).get(code)
+    if series is None:
+        # Either the collectivity does not exist or it has no data
+        model = DATA_MODELS[level]
+        collectivity = model._meta.get_field(model.collectivity_field).related_model
+        codes_by_field, lookup = codes_lookup([code], COLLECTIVITY_IDENTIFIERS[level])
+        if not (codes_by_field and collectivity.objects.filter(lookup).exists()):
+            return 404, {"message": f"{level} {code} not found"}
+        series = {}
+    return 200, series
+
+
+# Rankings
+@router.get(
+    "/ranking/{level}/{datacode}",
+    response={200: List[RankingSchema], 400: dict, 404: dict},
+    tags=["data"],
+)
+@cache_response()
+def get_ranking(
+    request,
+    level: str,
+    datacode: str,
+    year: int = None,
+    region: str = None,
+    departement: str = None,
+    epci: str = None,
+    order: str = "desc",
+    limit: int = 50,
+    min_value: float = None,
+    max_value: float = None,
+):
+    """
+    Ranks the collectivities of a level by the value of a numeric datacode
+
+    By default, the latest year with values for the datacode is used. The ranking
+    can be restricted to the subdivisions of a région, département (Insee or
+    Siren id) or EPCI (Siren id), and to the values between min_value and max_value.
+    """
+    if level not in DATA_MODELS:
+        return 404, {"message": f"level must be one of {', '.join(DATA_MODELS)}"}
+    if order not in ["asc", "desc"]:
+        return 400, {"message": "order must be one of asc, desc"}
+    if not 0 < limit <= RANKING_MAX_LIMIT:
+        return 400, {"message": f"limit must be between 1 and {RANKING_MAX_LIMIT}"}
+
+    model = DATA_MODELS[level]
+    queryset = model.objects.ranking(
+        datacode,
+        year,
+        descending=order == "desc",
+        min_value=None if min_value is None else Decimal(str(min_value)),
+        max_value=None if max_value is None else Decimal(str(max_value)),
+    )
+
+    parents = {"region": region, "departement": departement, "epci": epci}
+    for parent_level, code in parents.items():
+        if code is None:
+            continue
+        if parent_level not in model.parent_fields:
+            return 400, {"message": f"{level} cannot be ranked within a {parent_level}"}
+        codes_by_field, lookup = codes_lookup(
+            [code],
+            COLLECTIVITY_IDENTIFIERS[parent_level],
+            prefix=model.parent_fields[parent_level],
+        )
+        if not codes_by_field:
+            return 400, {"message": f"{code} is not a {parent_level} id"}
+        queryset = queryset.filter(lookup)
+
+    collectivity = model.collectivity_field
+    identifiers = list(COLLECTIVITY_IDENTIFIERS[level])
+    rows = queryset.values_list(
+        *[f"{collectivity}__{field}" for field in identifiers + ["name", "slug"]],
+        "year__year",
+        "value_int",
+        "value_numeric",
+    )[:limit]
+
+    ranking = []
+    for rank, (*fields, year, value_int, value_numeric) in enumerate(rows, start=1):
+        item = dict(zip(identifiers + ["name", "slug"], fields))
+        value = read_value(None, value_int, value_numeric)
+        ranking.append({"rank": rank, **item, "year": year, "value": value})
+    return 200, ranking
+
+
+# Snapshots
+@router.get(
+    "/snapshots/{level}/{code}",
+    response={200: SnapshotSchema, 404: dict},
+    tags=["subdivisions"],
+)
+@cache_response()
+def get_snapshot(request, level: str, code: str, year: int = None):
+    """
+    Returns a collectivity with all its data for a year (by default, the latest one),
+    read from the snapshot table of its level.
+
+    The collectivity is retrieved by Insee or Siren id.
+    """
+    if level not in SNAPSHOT_MODELS:
+        return 404, {"message": f"level must be one of {', '.join(SNAPSHOT_MODELS)}"}
+
+    codes_by_field, lookup = codes_lookup([code], COLLECTIVITY_IDENTIFIERS[level])
+    queryset = SNAPSHOT_MODELS[level].objects.select_related("year")
+    if year:
+        queryset = queryset.filter(year__year=year)
+    item = queryset.filter(lookup).order_by("-year__year").first()
+    if not codes_by_field or item is None:
+        return 404, {"message": f"no snapshot of {level} {code}"}
+    return 200, item
+
+
+# Bulk exports
+def export_collectivity_data(
+    queryset: QuerySet,
+    collectivity: str,
+    identifiers: List[str],
+    year: int = None,
+    datacode: str = None,
+    format: str = "csv",
+):
+    """
+    Streams the data of a collectivity level, optionally filtered by year and datacode
+    """
+    if format not in EXPORT_FORMATS:
+        return 400, {"message": f"format must be one of {', '.join(EXPORT_FORMATS)}"}
+
+    if year:
+        queryset = queryset.filter(year__year=year)
+    if datacode:
+        queryset = queryset.filter(datacode=datacode)
+
+    fields = {key: f"{collectivity}__{key}" for key in identifiers}
+    fields.update(
+        {
+            "year": "year__year",
+            "datacode": "datacode",
+            "value": "value",
+            "label": "label",
+            "datatype": "datatype",
+        }
+    )
+
+    filename = "-".join(
+        [str(part) for part in [f"{collectivity}data", year, datacode] if part]
+    )
+    return streaming_export(queryset, fields, format, filename)
+
+
+@router.get("/export/regiondata", response={400: dict}, tags=["export"])
+def export_region_data(
+    request, year: int = None, datacode: str = None, format: str = "csv"
+):
+    """
+    Export all region data, as a streamed csv or ndjson file
+    """
+    return export_collectivity_data(
+        RegionData.objects.all(), "region", ["insee", "siren"], year, datacode, format
+    )
+
+
+@router.get("/export/departementdata", response={400: dict}, tags=["export"])
+def export_departement_data(
+    request, year: int = None, datacode: str = None, format: str = "csv"
+):
+    """
+    Export all département data, as a streamed csv or ndjson file
+    """
+    return export_collectivity_data(
+        DepartementData.objects.all(),
+        "departement",
+        ["insee", "siren"],
+        year,
+        datacode,
+        format,
+    )
+
+
+@router.get("/export/epcidata", response={400: dict}, tags=["export"])
+def export_epci_data(
+    request, year: int = None, datacode: str = None, format: str = "csv"
+):
+    """
+    Export all EPCI data, as a streamed csv or ndjson file
+    """
+    return export_collectivity_data(
+        EpciData.objects.all(), "epci", ["siren"], year, datacode, format
+    )
+
+
+@router.get("/export/communedata", response={400: dict}, tags=["export"])
+def export_commune_data(
+    request, year: int = None, datacode: str = None, format: str = "csv"
+):
+    """
+    Export all commune data, as a streamed csv or ndjson file
+    """
+    return export_collectivity_data(
+        CommuneData.objects.all(),
+        "commune",
+        ["insee", "siren"],
+        year,
+        datacode,
+        format,
+    )
+
+
+@router.get(
+    "/export/snapshots/{level}", response={400: dict, 404: dict}, tags=["export"]
+)
+def export_snapshots(
+    request, level: str, year: int = None, datacodes: str = None, format: str = "csv"
+):
+    """
+    Export the snapshots of a level for a year (by default, the latest one), with one
+    column per datacode, as a streamed csv or ndjson file
+
+    Multiple datacodes must be separated by a comma; by default, all of them are exported.
+    """
+    if level not in SNAPSHOT_MODELS:
+        return 404, {"message": f"level must be one of {', '.join(SNAPSHOT_MODELS)}"}
+    if format not in EXPORT_FORMATS:
+        return 400, {"message": f"format must be one of {', '.join(EXPORT_FORMATS)}"}
+
+    model = SNAPSHOT_MODELS[level]
+    if year:
+        year_entry = DataYear.objects.filter(year=year).first()
+    else:
+        latest = model.objects.order_by("-year__year").values("year_id")[:1]
+        year_entry = DataYear.objects.filter(id=Subquery(latest)).first()
+    if year_entry is None:
+        return 404, {"message": f"no snapshot of the {level} level for that year"}
+
+    if datacodes:
+        datacodes = [datacode.strip() for datacode in datacodes.split(",")]
+    else:
+        datacodes = list(
+            model.data_model.objects.filter(year=year_entry)
+            .order_by("datacode")
+            .values_list("datacode", flat=True)
+            .distinct()
+        )
+
+    fields = {key: key for key in model.copied_fields}
+    fields.update({"name": "name", "slug": "slug"})
+    fields.update({datacode: KeyTransform(datacode, "data") for datacode in datacodes})
+    filename = f"{level}-snapshot-{year_entry.year}"
+    return streaming_export(
+        model.objects.filter(year=year_entry), fields, format, filename
+    )
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from francedata.models import (
+    CommuneData,
+    DepartementData,
+    EpciData,
+    RegionData,
+    NUMERIC_DATATYPES,
+    typed_values,
+)
+from francedata.services.utils import IMPORT_BATCH_SIZE
+
+"""
+Fills the value_int and value_numeric columns of the data imported before they existed.
+"""
+
+DATA_MODELS = [RegionData, DepartementData, EpciData, CommuneData]
+
+
+class Command(BaseCommand):
+    help = "Fill the typed value columns of the existing collectivity data"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Number of rows read and updated together",
+        )
+
+    def handle(self, *args, **options):
+        for model in DATA_MODELS:
+            updated = backfill_typed_values(model, options["batch_size"])
+            print(f"{model._meta.verbose_name_plural}: {updated} entrées mises à jour")
+
+
+def backfill_typed_values(model, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """
+    Fills the typed columns of the numeric entries where they are empty,
+    reading the rows by id ranges. Returns the number of entries updated.
+    """
+    queryset = (
+        model.objects.filter(
+            datatype__in=NUMERIC_DATATYPES,
+            value__isnull=False,
+            value_numeric__isnull=True,
+        )
+        .only("id", "datatype", "value")
+        .order_by("id")
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        entries = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not entries:
+            return updated
+        last_id = entries[-1].id
+
+        changed = []
+        for entry in entries:
+            values = typed_values(entry.datatype, entry.value)
+            if values["value_numeric"] is not None:
+                for field, value in values.items():
+                    setattr(entry, field, value)
+                changed.append(entry)
+        model.objects.bulk_update(changed, ["value_int", "value_numeric"])
+        updated += len(changed)
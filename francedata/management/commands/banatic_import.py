@@ -6,6 +6,10 @@ from francedata.services.banatic import (
     import_epci_data_from_banatic,
 )
 from django.core.management.base import BaseCommand
+from francedata.models import SubdivisionCount, rebuild_snapshots
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.profiling import add_profiling_arguments, profiling
+from francedata.services.rollup import refresh_rollups
 
 """
 Import de divers fichiers pour récupérer les données extraites de Banatic
@@ -33,8 +37,13 @@ class Command(BaseCommand):
         parser.add_argument(
             "--year", type=int, help="If specified, only that year will be parsed"
         )
+        add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
+        with profiling(options, "banatic_import"):
+            self.import_levels(options)
+
+    def import_levels(self, options):
         message = "📥 Importing data from Banatic"
 
         if options["level"]:
@@ -58,7 +67,15 @@ class Command(BaseCommand):
         # Import of the Siren <-> Insee table for Communes
         # That file also has population data
         if all_levels or level == "communes":
-            import_commune_data_from_banatic(year)
+            response = import_commune_data_from_banatic(year)
 
         if all_levels or level == "epci":
-            import_epci_data_from_banatic(year)
+            response = import_epci_data_from_banatic(year)
+
+        # The population and the EPCI members changed: the roll-ups
+        # and the subdivisions of each collectivity are computed again
+        print("🧮   Rolling up the communes data")
+        refresh_rollups(response["year_entry"])
+        SubdivisionCount.refresh(response["year_entry"])
+        rebuild_snapshots(response["year_entry"])
+        bump_dataset_version()
@@ -2,13 +2,21 @@
 # -*- coding: utf-8 -*-
 
 from django.core.management.base import BaseCommand
-from francedata.models import Departement, Region
+from francedata.models import (
+    Departement,
+    Region,
+    SubdivisionCount,
+    rebuild_snapshots,
+)
 
 from francedata.services.cog import (
     import_communes_from_cog,
     import_departements_from_cog,
     import_regions_from_cog,
 )
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.profiling import add_profiling_arguments, profiling
+from francedata.services.rollup import refresh_rollups
 from francedata.services.utils import add_sirens_and_categories
 
 """
@@ -36,8 +44,13 @@ class Command(BaseCommand):
         parser.add_argument(
             "--year", type=int, help="If specified, only that year will be parsed"
         )
+        add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
+        with profiling(options, "cog_import"):
+            self.import_levels(options)
+
+    def import_levels(self, options):
         if options["level"]:
             level = options["level"]
             all_levels = False
@@ -73,3 +86,12 @@ class Command(BaseCommand):
         # Communes
         if all_levels or level == "communes":
             response = import_communes_from_cog(year)
+
+            # The communes of the départements changed: the roll-ups are computed again
+            print("🧮   Rolling up the communes data")
+            refresh_rollups(response["year_entry"])
+
+        # Then the subdivisions of each collectivity are counted again
+        SubdivisionCount.refresh(response["year_entry"])
+        rebuild_snapshots(response["year_entry"])
+        bump_dataset_version()
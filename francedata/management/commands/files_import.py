@@ -2,8 +2,75 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Set
+
+import django
+from django.apps import apps
 from django.core.management.base import BaseCommand
-from francedata.models import DataSourceFile
+from django.db import connections
+from francedata.models import (
+    SNAPSHOT_MODELS,
+    DataSourceFile,
+    DataYear,
+    rebuild_snapshots,
+)
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.profiling import add_profiling_arguments, profiling
+
+# The order of creation of the levels within a year
+CREATION_ORDER = {"region": 0, "departement": 1, "commune": 2, "epci": 3}
+
+
+def plan_import_stages(files: List[DataSourceFile]) -> List[List[DataSourceFile]]:
+    """
+    Orders the files by dependency, as a list of stages to run one after another.
+
+    The files creating collectivities come first, by year then by level (the
+    EPCIs after the communes they group), each in its own stage as they write the
+    same collectivities. The other files only add data to existing collectivities,
+    so they are all independent and form the last stage.
+    """
+    creating = []
+    data_only = []
+    for file in files:
+        if file.get_mapping_value("collectivity_create", False):
+            creating.append(file)
+        else:
+            data_only.append(file)
+
+    creating.sort(
+        key=lambda file: (
+            file.source.year.year,
+            CREATION_ORDER.get(file.get_mapping_value("collectivity_type"), 0),
+        )
+    )
+    stages = [[file] for file in creating]
+    if data_only:
+        stages.append(data_only)
+    return stages
+
+
+def init_worker() -> None:
+    # Spawned processes start from a new interpreter, forked ones from the
+    # command whose connections were closed, so they open their own
+    if not apps.ready:
+        django.setup()
+
+
+def import_file(file_id: int, restart: bool = False) -> dict:
+    """
+    Imports one file, in the current process or in a worker process
+    """
+    file = DataSourceFile.objects.select_related("data_mapping", "source__year").get(
+        id=file_id
+    )
+    try:
+        response = file.import_file_data(restart=restart)
+    except Exception as e:
+        logging.exception(f"Import of {file} failed")
+        response = {"success": False, "messages": [f"{type(e).__name__}: {e}"]}
+    return {"id": file_id, "name": str(file), **response}
 
 
 class Command(BaseCommand):
@@ -17,7 +84,25 @@ class Command(BaseCommand):
             Multiple file IDs must be separated by a comma
             """
         )
-
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="""
+            Number of processes importing the independent files in parallel.
+            The profiling options only cover the main process.
+            """,
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="""
+            Import the files from the first row, even if an import was interrupted.
+            It also bypasses the check of the content hash, so the files whose
+            content was already imported for the year are read again.
+            """,
+        )
+        add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
         # Manage output
@@ -28,24 +113,76 @@ class Command(BaseCommand):
         else:
             logging.basicConfig(level=logging.INFO, format=FORMAT)
 
+        with profiling(options, "files_import"):
+            self.import_files(options)
+
+    def import_files(self, options):
         force_files = options["files"]
         if force_files:
             files_to_import = [int(x) for x in force_files.split(',')]
             files = DataSourceFile.objects.filter(id__in=files_to_import)
         else:
             files = DataSourceFile.objects.filter(is_imported=False).order_by("created_at")
+        files = list(files.select_related("data_mapping", "source__year"))
 
         if not files:
             logging.info("Pas de fichier à importer.")
+            return
 
-        for file in files:
-            logging.info(f"Import du fichier {file}.")
-            response = file.import_file_data()
-            result = response["success"]
-            if result:
-                file.mark_imported()
-                logging.info("L’import a été effectué avec succès.")
+        workers = max(options["workers"], 1)
+        restart = options["restart"]
+        # The snapshot levels touched by the imported files, by year
+        self.snapshot_levels: Dict[DataYear, Set[str]] = {}
+        for stage in plan_import_stages(files):
+            if workers == 1 or len(stage) == 1:
+                for file in stage:
+                    logging.info(f"Import du fichier {file}.")
+                    self.record_result(import_file(file.id, restart))
             else:
-                logging.error("Erreur lors de l’import.")
-                for message in response["messages"]:
-                    logging.error(message)
+                ids = [file.id for file in stage]
+                for result in self.import_in_parallel(ids, workers, restart):
+                    self.record_result(result)
+        self.rebuild_snapshots()
+
+    def import_in_parallel(
+        self, ids: List[int], workers: int, restart: bool
+    ) -> List[dict]:
+        logging.info(f"Import de {len(ids)} fichiers avec {workers} processus.")
+        # The worker processes must not share the connections of this one
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(ids)),
+            initializer=init_worker,
+        ) as executor:
+            return list(executor.map(import_file, ids, [restart] * len(ids)))
+
+    def record_result(self, result: dict) -> None:
+        if result["success"]:
+            file = DataSourceFile.objects.select_related(
+                "data_mapping", "source__year"
+            ).get(id=result["id"])
+            skipped = result.get("skipped", False)
+            file.mark_imported(snapshots=False, skipped=skipped)
+            if not skipped:
+                self.snapshot_levels.setdefault(file.source.year, set()).update(
+                    file.snapshot_levels()
+                )
+            for message in result["messages"]:
+                logging.info(message)
+            logging.info(f"L’import de {result['name']} a été effectué avec succès.")
+        else:
+            logging.error(f"Erreur lors de l’import de {result['name']}.")
+            for message in result["messages"]:
+                logging.error(message)
+
+    def rebuild_snapshots(self) -> None:
+        """
+        Rebuilds the snapshots once for the whole batch, for the levels touched
+        by the imported files of each year
+        """
+        for year_entry, levels in self.snapshot_levels.items():
+            rebuild_snapshots(
+                year_entry, [level for level in SNAPSHOT_MODELS if level in levels]
+            )
+        if self.snapshot_levels:
+            bump_dataset_version()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from francedata.models import ImportJob
+
+"""
+Worker running the imports queued from the admin interface.
+
+Several workers can run at the same time: each job is claimed with a row lock,
+skipped by the other workers.
+"""
+
+
+class Command(BaseCommand):
+    help = "Run the queued imports of DataSourceFile files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, instead of waiting for new jobs",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking the queue again when it is empty",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            type=int,
+            help="If specified, exit after running that number of jobs",
+        )
+
+    def handle(self, *args, **options):
+        FORMAT = "%(asctime)s %(message)s"
+        verbosity = int(options["verbosity"])
+        if verbosity > 1:
+            logging.basicConfig(level=logging.DEBUG, format=FORMAT)
+        else:
+            logging.basicConfig(level=logging.INFO, format=FORMAT)
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        jobs_run = 0
+        logging.info(f"Worker {worker} started.")
+
+        while options["max_jobs"] is None or jobs_run < options["max_jobs"]:
+            # Long-running workers must not keep broken or expired connections
+            close_old_connections()
+            job = ImportJob.claim_next(worker)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            logging.info(f"Import du fichier {job.source_file}.")
+            if job.run():
+                logging.info("L’import a été effectué avec succès.")
+            else:
+                logging.error("Erreur lors de l’import.")
+                for message in job.messages:
+                    logging.error(message)
+            jobs_run += 1
+
+        logging.info(f"Worker {worker} stopped after {jobs_run} job(s).")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from francedata.models import DataYear
+from francedata.services.partitions import (
+    MIN_PG_VERSION,
+    PARTITIONED_MODELS,
+    detach_partition,
+    partition_data_table,
+    partitioning_supported,
+)
+
+"""
+Partitionne les tables de données des collectivités par millésime (une partition
+par DataYear, créée automatiquement pour chaque nouveau millésime), ou détache
+la partition d'un millésime pour l'archiver.
+"""
+
+
+class Command(BaseCommand):
+    help = "Partition the collectivity data tables by year"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--levels",
+            type=str,
+            help=f"""
+            The levels whose data table is partitioned ({', '.join(PARTITIONED_MODELS)}),
+            by default all of them. Multiple levels must be separated by a comma
+            """,
+        )
+        parser.add_argument(
+            "--detach",
+            type=int,
+            help="If specified, the partitions of that year are detached from the data tables",
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            raise CommandError(
+                f"Le partitionnement nécessite PostgreSQL {MIN_PG_VERSION // 10000} "
+                "ou une version ultérieure"
+            )
+
+        if options["levels"]:
+            levels = [level.strip() for level in options["levels"].split(",")]
+        else:
+            levels = list(PARTITIONED_MODELS)
+        for level in levels:
+            if level not in PARTITIONED_MODELS:
+                raise CommandError(f"Échelon {level} non reconnu")
+
+        if options["detach"]:
+            year_entry = DataYear.objects.filter(year=options["detach"]).first()
+            if year_entry is None:
+                raise CommandError("Millésime non trouvé")
+            for level in levels:
+                if detach_partition(PARTITIONED_MODELS[level], year_entry):
+                    print(f"{level}: partition {year_entry} détachée")
+                else:
+                    print(f"{level}: pas de partition pour {year_entry}")
+            return
+
+        for level in levels:
+            if partition_data_table(PARTITIONED_MODELS[level]):
+                print(f"{level}: table partitionnée par millésime")
+            else:
+                print(f"{level}: table déjà partitionnée")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from francedata.models import SNAPSHOT_MODELS, DataYear
+from francedata.services.dataset_version import bump_dataset_version
+
+"""
+Reconstruit les instantanés des collectivités (une table par échelon, avec
+toutes leurs données de l'année), même si FRANCEDATA_SNAPSHOTS n'est pas activé.
+"""
+
+
+class Command(BaseCommand):
+    help = "Rebuild the collectivity snapshots of a year"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            type=int,
+            help="If specified, only that year will be rebuilt, by default the latest one",
+        )
+        parser.add_argument(
+            "--levels",
+            type=str,
+            help=f"""
+            The levels to rebuild ({', '.join(SNAPSHOT_MODELS)}), by default all of them.
+            Multiple levels must be separated by a comma
+            """,
+        )
+
+    def handle(self, *args, **options):
+        if options["year"]:
+            year_entry = DataYear.objects.filter(year=options["year"]).first()
+        else:
+            year_entry = DataYear.objects.order_by("-year").first()
+        if year_entry is None:
+            raise CommandError("Millésime non trouvé")
+
+        if options["levels"]:
+            levels = [level.strip() for level in options["levels"].split(",")]
+        else:
+            levels = list(SNAPSHOT_MODELS)
+        for level in levels:
+            if level not in SNAPSHOT_MODELS:
+                raise CommandError(f"Échelon {level} non reconnu")
+
+        for level in levels:
+            count = SNAPSHOT_MODELS[level].rebuild(year_entry)
+            print(f"{level}: {count} instantanés créés pour {year_entry}")
+        bump_dataset_version()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from francedata.models import DataYear, rebuild_snapshots
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.rollup import (
+    ROLLUP_AGGREGATES,
+    refresh_rollups,
+    rollup_commune_data,
+)
+
+"""
+Agrège les données numériques des communes aux EPCI, départements et régions.
+
+Sans l'option --datacodes, la population et les codes déjà agrégés pour le millésime
+sont recalculés.
+"""
+
+
+class Command(BaseCommand):
+    help = "Roll up the numeric communes data to the EPCIs, départements and régions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            type=int,
+            help="If specified, only that year will be rolled up, by default the latest one",
+        )
+        parser.add_argument(
+            "--datacodes",
+            type=str,
+            help=f"""
+            The datacodes to roll up, with their aggregate function
+            ({', '.join(ROLLUP_AGGREGATES)}), e.g. pop_tot:sum,densite:avg.
+            Multiple datacodes must be separated by a comma
+            """,
+        )
+
+    def handle(self, *args, **options):
+        if options["year"]:
+            year_entry = DataYear.objects.filter(year=options["year"]).first()
+        else:
+            year_entry = DataYear.objects.order_by("-year").first()
+        if year_entry is None:
+            raise CommandError("Millésime non trouvé")
+
+        if options["datacodes"]:
+            aggregates = {}
+            for item in options["datacodes"].split(","):
+                datacode, _separator, aggregate = item.strip().partition(":")
+                aggregates[datacode] = aggregate or "sum"
+            try:
+                counts = rollup_commune_data(year_entry, aggregates)
+            except ValueError as e:
+                raise CommandError(str(e))
+        else:
+            counts = refresh_rollups(year_entry)
+
+        for level, count in counts.items():
+            print(f"{level}: {count} entrées agrégées pour {year_entry}")
+        rebuild_snapshots(year_entry, list(counts))
+        bump_dataset_version()
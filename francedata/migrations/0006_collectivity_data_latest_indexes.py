@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0005_auto_20230111_1734'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='communedata',
+            index=models.Index(fields=['commune', 'datacode', 'year'], name='fd_communedata_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departementdata',
+            index=models.Index(fields=['departement', 'datacode', 'year'], name='fd_departementdata_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='epcidata',
+            index=models.Index(fields=['epci', 'datacode', 'year'], name='fd_epcidata_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regiondata',
+            index=models.Index(fields=['region', 'datacode', 'year'], name='fd_regiondata_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:23
+
+import django.core.validators
+from django.db import migrations, models
+import francedata.services.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0006_collectivity_data_latest_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commune',
+            name='insee',
+            field=models.CharField(db_index=True, max_length=5, validators=[django.core.validators.RegexValidator('^([0-1]\\d{4}|2[AB1-9]\\d{3}|[3-8]\\d{4}|9[0-5]\\d{3}|97[12346]\\d{2})$')], verbose_name='identifiant Insee'),
+        ),
+        migrations.AlterField(
+            model_name='commune',
+            name='siren',
+            field=models.CharField(blank=True, db_index=True, max_length=9, validators=[francedata.services.validators.validate_siren], verbose_name='numéro Siren'),
+        ),
+        migrations.AlterField(
+            model_name='departement',
+            name='insee',
+            field=models.CharField(db_index=True, max_length=3, validators=[django.core.validators.RegexValidator('^([0-1]\\d|2[AB1-9]|[3-8]\\d|9[0-5]|97[12346])$')], verbose_name='identifiant Insee'),
+        ),
+        migrations.AlterField(
+            model_name='departement',
+            name='siren',
+            field=models.CharField(blank=True, db_index=True, max_length=9, null=True, validators=[francedata.services.validators.validate_siren], verbose_name='numéro Siren'),
+        ),
+        migrations.AlterField(
+            model_name='epci',
+            name='siren',
+            field=models.CharField(db_index=True, max_length=9, validators=[francedata.services.validators.validate_siren], verbose_name='numéro Siren'),
+        ),
+        migrations.AlterField(
+            model_name='region',
+            name='insee',
+            field=models.CharField(db_index=True, max_length=2, validators=[django.core.validators.RegexValidator('^\\d\\d$')], verbose_name='identifiant Insee'),
+        ),
+        migrations.AlterField(
+            model_name='region',
+            name='siren',
+            field=models.CharField(blank=True, db_index=True, max_length=9, null=True, validators=[francedata.services.validators.validate_siren], verbose_name='numéro Siren'),
+        ),
+        migrations.AddIndex(
+            model_name='communedata',
+            index=models.Index(fields=['datacode', 'year'], name='fd_communedata_code_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departementdata',
+            index=models.Index(fields=['datacode', 'year'], name='fd_deptdata_code_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='epcidata',
+            index=models.Index(fields=['datacode', 'year'], name='fd_epcidata_code_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regiondata',
+            index=models.Index(fields=['datacode', 'year'], name='fd_regiondata_code_year_idx'),
+        ),
+        # The many-to-many tables have a (collectivity, year) unique index: this adds
+        # the (year, collectivity) one, for the lookups of all collectivities of a year
+        migrations.RunSQL(
+            sql="CREATE INDEX fd_region_years_year_idx ON francedata_region_years (datayear_id, region_id);",
+            reverse_sql="DROP INDEX fd_region_years_year_idx;",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX fd_departement_years_year_idx ON francedata_departement_years (datayear_id, departement_id);",
+            reverse_sql="DROP INDEX fd_departement_years_year_idx;",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX fd_epci_years_year_idx ON francedata_epci_years (datayear_id, epci_id);",
+            reverse_sql="DROP INDEX fd_epci_years_year_idx;",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX fd_commune_years_year_idx ON francedata_commune_years (datayear_id, commune_id);",
+            reverse_sql="DROP INDEX fd_commune_years_year_idx;",
+        ),
+    ]
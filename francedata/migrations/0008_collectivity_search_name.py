@@ -0,0 +1,67 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:27
+
+from itertools import islice
+
+from django.db import migrations, models
+from unidecode import unidecode
+
+
+def fill_search_names(apps, schema_editor):
+    # The names are read and updated by batches, without holding all the rows
+    for model_name in ["Region", "Departement", "Epci", "Commune"]:
+        model = apps.get_model("francedata", model_name)
+        items = model.objects.only("id", "name").iterator(chunk_size=2000)
+        while True:
+            batch = list(islice(items, 2000))
+            if not batch:
+                break
+            for item in batch:
+                item.search_name = unidecode(item.name).lower()[:100]
+            model.objects.bulk_update(batch, ["search_name"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0007_identifier_and_year_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commune',
+            name='search_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé'),
+        ),
+        migrations.AddField(
+            model_name='departement',
+            name='search_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé'),
+        ),
+        migrations.AddField(
+            model_name='epci',
+            name='search_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé'),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='search_name',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé'),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='commune',
+            index=models.Index(fields=['search_name'], name='fd_commune_search_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='departement',
+            index=models.Index(fields=['search_name'], name='fd_departement_search_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='epci',
+            index=models.Index(fields=['search_name'], name='fd_epci_search_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(fields=['search_name'], name='fd_region_search_name_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0008_collectivity_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('status', models.CharField(choices=[('pending', 'en attente'), ('running', 'en cours'), ('success', 'terminé'), ('failed', 'échec')], default='pending', max_length=10, verbose_name='statut')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='lignes traitées')),
+                ('rows_total', models.PositiveIntegerField(blank=True, null=True, verbose_name='lignes à traiter')),
+                ('messages', models.JSONField(blank=True, default=list, verbose_name='messages')),
+                ('worker', models.CharField(blank=True, max_length=255, verbose_name='worker')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='date de début')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='date de fin')),
+                ('source_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='francedata.datasourcefile', verbose_name='fichier source')),
+            ],
+            options={
+                'verbose_name': 'tâche d’import',
+                'verbose_name_plural': 'tâches d’import',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['status', 'created_at'], name='importjob_status_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0009_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasourcefile',
+            name='checkpoint_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='empreinte du fichier en cours d’import'),
+        ),
+        migrations.AddField(
+            model_name='datasourcefile',
+            name='checkpoint_offset',
+            field=models.PositiveIntegerField(default=0, help_text='Position de reprise d’un import interrompu', verbose_name='lignes déjà importées'),
+        ),
+    ]
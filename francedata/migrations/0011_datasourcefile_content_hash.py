@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0010_datasourcefile_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasourcefile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='empreinte du fichier'),
+        ),
+        migrations.AddField(
+            model_name='datasourcefile',
+            name='data_mapping_version',
+            field=models.PositiveIntegerField(blank=True, help_text='Version utilisée lors de l’envoi du fichier, puis lors de son import', null=True, verbose_name='version de la table de correspondance'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0011_datasourcefile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communedata',
+            name='value_int',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='valeur entière'),
+        ),
+        migrations.AddField(
+            model_name='communedata',
+            name='value_numeric',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=20, null=True, verbose_name='valeur numérique'),
+        ),
+        migrations.AddField(
+            model_name='departementdata',
+            name='value_int',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='valeur entière'),
+        ),
+        migrations.AddField(
+            model_name='departementdata',
+            name='value_numeric',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=20, null=True, verbose_name='valeur numérique'),
+        ),
+        migrations.AddField(
+            model_name='epcidata',
+            name='value_int',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='valeur entière'),
+        ),
+        migrations.AddField(
+            model_name='epcidata',
+            name='value_numeric',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=20, null=True, verbose_name='valeur numérique'),
+        ),
+        migrations.AddField(
+            model_name='regiondata',
+            name='value_int',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='valeur entière'),
+        ),
+        migrations.AddField(
+            model_name='regiondata',
+            name='value_numeric',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=20, null=True, verbose_name='valeur numérique'),
+        ),
+        migrations.AddIndex(
+            model_name='communedata',
+            index=models.Index(fields=['datacode', 'year', 'value_numeric'], name='fd_communedata_numeric_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departementdata',
+            index=models.Index(fields=['datacode', 'year', 'value_numeric'], name='fd_deptdata_numeric_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='epcidata',
+            index=models.Index(fields=['datacode', 'year', 'value_numeric'], name='fd_epcidata_numeric_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regiondata',
+            index=models.Index(fields=['datacode', 'year', 'value_numeric'], name='fd_regiondata_numeric_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:22
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_subdivision_counts(apps, schema_editor):
+    DataYear = apps.get_model("francedata", "DataYear")
+    Departement = apps.get_model("francedata", "Departement")
+    Commune = apps.get_model("francedata", "Commune")
+    SubdivisionCount = apps.get_model("francedata", "SubdivisionCount")
+
+    Region = apps.get_model("francedata", "Region")
+    Epci = apps.get_model("francedata", "Epci")
+
+    for year_entry in DataYear.objects.all():
+        counts = {}
+        for level, model in [("region", Region), ("departement", Departement), ("epci", Epci)]:
+            for collectivity_id in model.objects.filter(years=year_entry).values_list("id", flat=True):
+                counts[(level, collectivity_id)] = {}
+        for row in (
+            Departement.objects.filter(years=year_entry, region__isnull=False)
+            .values("region_id")
+            .annotate(departements=Count("id"))
+            .order_by()
+        ):
+            counts.setdefault(("region", row["region_id"]), {}).update(departements=row["departements"])
+
+        communes = Commune.objects.filter(years=year_entry)
+        for level, parent, epcis in [
+            ("region", "departement__region_id", True),
+            ("departement", "departement_id", True),
+            ("epci", "epci_id", False),
+        ]:
+            annotations = {"communes": Count("id")}
+            if epcis:
+                annotations["epcis"] = Count("epci", distinct=True)
+            for row in communes.values(parent).annotate(**annotations).order_by():
+                if row[parent] is not None:
+                    collectivity_id = row.pop(parent)
+                    counts.setdefault((level, collectivity_id), {}).update(row)
+
+        SubdivisionCount.objects.bulk_create(
+            [
+                SubdivisionCount(
+                    year=year_entry, level=level, collectivity_id=collectivity_id, **values
+                )
+                for (level, collectivity_id), values in counts.items()
+            ],
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0012_collectivity_data_typed_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubdivisionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('level', models.CharField(choices=[('region', 'région'), ('departement', 'département'), ('epci', 'EPCI')], max_length=11, verbose_name='échelon')),
+                ('collectivity_id', models.BigIntegerField(verbose_name='identifiant de la collectivité')),
+                ('departements', models.PositiveIntegerField(default=0, verbose_name='départements')),
+                ('epcis', models.PositiveIntegerField(default=0, verbose_name='EPCI')),
+                ('communes', models.PositiveIntegerField(default=0, verbose_name='communes')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'nombre de subdivisions',
+                'verbose_name_plural': 'nombres de subdivisions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='subdivisioncount',
+            constraint=models.UniqueConstraint(fields=('level', 'collectivity_id', 'year'), name='fd_unique_subdivision_count'),
+        ),
+        migrations.RunPython(fill_subdivision_counts, migrations.RunPython.noop),
+    ]
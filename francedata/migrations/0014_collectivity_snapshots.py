@@ -0,0 +1,159 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0013_subdivisioncount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('name', models.CharField(max_length=100, verbose_name='nom')),
+                ('slug', models.CharField(blank=True, default='', max_length=100)),
+                ('search_name', models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='données')),
+                ('insee', models.CharField(max_length=2, verbose_name='identifiant Insee')),
+                ('siren', models.CharField(blank=True, max_length=9, null=True, verbose_name='numéro Siren')),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.region', verbose_name='région')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'instantané région',
+                'verbose_name_plural': 'instantanés région',
+            },
+        ),
+        migrations.CreateModel(
+            name='EpciSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('name', models.CharField(max_length=100, verbose_name='nom')),
+                ('slug', models.CharField(blank=True, default='', max_length=100)),
+                ('search_name', models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='données')),
+                ('siren', models.CharField(max_length=9, verbose_name='numéro Siren')),
+                ('epci_type', models.CharField(blank=True, choices=[('CA', 'Communauté d’agglomération'), ('CC', 'Communauté de communes'), ('CU', 'Communauté urbaine'), ('MET69', 'Métropole de Lyon'), ('METRO', 'Métropole')], max_length=5, null=True, verbose_name='type d’EPCI')),
+                ('epci', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.epci', verbose_name='EPCI')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'instantané EPCI',
+                'verbose_name_plural': 'instantanés EPCI',
+            },
+        ),
+        migrations.CreateModel(
+            name='DepartementSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('name', models.CharField(max_length=100, verbose_name='nom')),
+                ('slug', models.CharField(blank=True, default='', max_length=100)),
+                ('search_name', models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='données')),
+                ('insee', models.CharField(max_length=3, verbose_name='identifiant Insee')),
+                ('siren', models.CharField(blank=True, max_length=9, null=True, verbose_name='numéro Siren')),
+                ('region_insee', models.CharField(blank=True, max_length=2, null=True, verbose_name='identifiant Insee de la région')),
+                ('departement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.departement', verbose_name='département')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'instantané département',
+                'verbose_name_plural': 'instantanés département',
+            },
+        ),
+        migrations.CreateModel(
+            name='CommuneSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('name', models.CharField(max_length=100, verbose_name='nom')),
+                ('slug', models.CharField(blank=True, default='', max_length=100)),
+                ('search_name', models.CharField(blank=True, default='', max_length=100, verbose_name='nom normalisé')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='données')),
+                ('insee', models.CharField(max_length=5, verbose_name='identifiant Insee')),
+                ('siren', models.CharField(blank=True, max_length=9, verbose_name='numéro Siren')),
+                ('departement_insee', models.CharField(max_length=3, verbose_name='identifiant Insee du département')),
+                ('region_insee', models.CharField(blank=True, max_length=2, null=True, verbose_name='identifiant Insee de la région')),
+                ('epci_siren', models.CharField(blank=True, max_length=9, null=True, verbose_name='numéro Siren de l’EPCI')),
+                ('population', models.IntegerField(blank=True, null=True)),
+                ('commune', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.commune', verbose_name='commune')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'instantané commune',
+                'verbose_name_plural': 'instantanés commune',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='regionsnapshot',
+            index=models.Index(fields=['insee', 'year'], name='fd_regionsnap_insee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regionsnapshot',
+            index=models.Index(fields=['siren', 'year'], name='fd_regionsnap_siren_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regionsnapshot',
+            index=models.Index(fields=['search_name'], name='fd_regionsnap_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='regionsnapshot',
+            constraint=models.UniqueConstraint(fields=('region', 'year'), name='fd_unique_region_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='epcisnapshot',
+            index=models.Index(fields=['siren', 'year'], name='fd_epcisnap_siren_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='epcisnapshot',
+            index=models.Index(fields=['search_name'], name='fd_epcisnap_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='epcisnapshot',
+            constraint=models.UniqueConstraint(fields=('epci', 'year'), name='fd_unique_epci_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='departementsnapshot',
+            index=models.Index(fields=['insee', 'year'], name='fd_deptsnap_insee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departementsnapshot',
+            index=models.Index(fields=['siren', 'year'], name='fd_deptsnap_siren_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departementsnapshot',
+            index=models.Index(fields=['search_name'], name='fd_deptsnap_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='departementsnapshot',
+            constraint=models.UniqueConstraint(fields=('departement', 'year'), name='fd_unique_departement_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='communesnapshot',
+            index=models.Index(fields=['insee', 'year'], name='fd_communesnap_insee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='communesnapshot',
+            index=models.Index(fields=['siren', 'year'], name='fd_communesnap_siren_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='communesnapshot',
+            index=models.Index(fields=['search_name'], name='fd_communesnap_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddConstraint(
+            model_name='communesnapshot',
+            constraint=models.UniqueConstraint(fields=('commune', 'year'), name='fd_unique_commune_snapshot'),
+        ),
+    ]
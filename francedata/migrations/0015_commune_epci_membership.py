@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_epci_memberships(apps, schema_editor):
+    # The current memberships belong to the year of the latest EPCI import
+    Metadata = apps.get_model("francedata", "Metadata")
+    DataYear = apps.get_model("francedata", "DataYear")
+    Commune = apps.get_model("francedata", "Commune")
+    CommuneEpciMembership = apps.get_model("francedata", "CommuneEpciMembership")
+
+    years = Metadata.objects.filter(prop="banatic_epci_year").values_list("value", flat=True)
+    if not years:
+        return
+    year_entry = DataYear.objects.filter(year=max(int(year) for year in years)).first()
+    if year_entry is None:
+        return
+
+    CommuneEpciMembership.objects.bulk_create(
+        [
+            CommuneEpciMembership(commune_id=commune_id, epci_id=epci_id, year=year_entry)
+            for commune_id, epci_id in Commune.objects.filter(
+                years=year_entry, epci__isnull=False
+            ).values_list("id", "epci_id")
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0014_collectivity_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommuneEpciMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='date de modification')),
+                ('commune', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.commune', verbose_name='commune')),
+                ('epci', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.epci', verbose_name='EPCI')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='francedata.datayear', verbose_name='millésime')),
+            ],
+            options={
+                'verbose_name': 'appartenance à un EPCI',
+                'verbose_name_plural': 'appartenances à un EPCI',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='communeepcimembership',
+            index=models.Index(fields=['epci', 'year'], name='fd_epcimember_epci_year_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='communeepcimembership',
+            constraint=models.UniqueConstraint(fields=('commune', 'year'), name='fd_unique_epci_membership'),
+        ),
+        migrations.RunPython(fill_epci_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import DatabaseError, migrations, transaction
+
+# The EPCI names are searched anywhere in the name, which the varchar_pattern_ops
+# indexes do not cover: trigram indexes do, on PostgreSQL with pg_trgm
+TRIGRAM_INDEXES = {
+    "fd_epci_search_trgm_idx": "francedata_epci",
+    "fd_epcisnap_search_trgm_idx": "francedata_epcisnapshot",
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic():
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    except DatabaseError:
+        # Without the pg_trgm contrib module (or the right to enable it),
+        # the EPCI search works without index
+        return
+    for name, table in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {name} ON {table} USING gin (search_name gin_trgm_ops);"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('francedata', '0015_commune_epci_membership'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,3 +1,4 @@
 from .collectivity import *
 from .meta import *
+from .snapshot import *
 from .sources import *
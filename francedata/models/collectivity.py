@@ -3,14 +3,19 @@ from django.db import models
 
 from francedata.models.meta import DataYear
 
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Tuple
+
 from unidecode import unidecode
 from django.db import models
-from django.db.models import Max
+from django.db import transaction
+from django.db.models import Count, F, FilteredRelation, Max, OuterRef, Q, Subquery
 from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.utils.text import slugify
 
 from francedata.services.django_admin import TimeStampModel
+from francedata.services.utils import IMPORT_BATCH_SIZE
 from francedata.services.validators import (
     validate_insee_region,
     validate_insee_departement,
@@ -22,6 +27,18 @@ from francedata.services.validators import (
 # France administrative structure models
 
 
+# The transliteration can lengthen the names, which are cut to fit the field
+SEARCH_NAME_MAX_LENGTH = 100
+
+
+def normalize_search_name(value: str) -> str:
+    """
+    Returns the name in the form used for searches: lowercase, without accents,
+    and at most SEARCH_NAME_MAX_LENGTH characters long
+    """
+    return unidecode(value).lower()[:SEARCH_NAME_MAX_LENGTH]
+
+
 class CollectivityModel(TimeStampModel):
     """
     Abstract model for common methods used by the following ones
@@ -37,7 +54,9 @@ class CollectivityModel(TimeStampModel):
         """
         if not year:
             year = self.years.aggregate(Max("year"))["year__max"]
-        data = self.regiondata_set.filter(year__year=year)
+        data = getattr(self, f"{self._meta.model_name}data_set").filter(
+            year__year=year
+        )
 
         if datacode:
             data = data.filter(datacode=datacode)
@@ -56,13 +75,79 @@ class CollectivityModel(TimeStampModel):
     def create_slug(self):
         self.slug = slugify(unidecode(self.name))
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def create_search_name(self):
+        self.search_name = normalize_search_name(self.name)
+
+    def prepare(self, bulk: bool = False):
+        """
+        Validates the entry and fills its computed fields, before it is saved.
+
+        For the bulk imports, bulk=True skips the checks run with one query per entry
+        (existence of the related entries, uniqueness), as the importers match the
+        entries with the database for the whole batch beforehand.
+        """
+        if bulk:
+            exclude = [field.name for field in self._meta.fields if field.is_relation]
+            self.full_clean(exclude=exclude, validate_unique=False)
+        else:
+            self.full_clean()
         self.create_slug()
+        self.create_search_name()
+
+    def save(self, *args, **kwargs):
+        self.prepare()
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def add_year_to_entries(cls, entries: list, year_entry: DataYear) -> set:
+        """
+        Adds a year to several entries at once, and returns the ids
+        of the entries which did not have it yet
+        """
+        through = cls.years.through
+        fk_name = f"{cls._meta.model_name}_id"
+        ids = {entry.id for entry in entries}
+
+        existing = set(
+            through.objects.filter(
+                **{f"{fk_name}__in": ids, "datayear": year_entry}
+            ).values_list(fk_name, flat=True)
+        )
+        through.objects.bulk_create(
+            [
+                through(**{fk_name: id, "datayear_id": year_entry.id})
+                for id in ids - existing
+            ],
+            ignore_conflicts=True,
+        )
+        return ids - existing
 
-class Region(CollectivityModel):
+
+class SubdivisionsMixin:
+    """
+    Subdivision counts of the régions, départements and EPCIs
+    """
+
+    def subdivisions_count(self, year: int = None) -> dict:
+        """
+        Returns the number of subdivisions of the collectivity for the given year
+        (by default, the most recent one), as computed after the imports.
+        Without precomputed counts, they are counted live: for the given year,
+        or across all years if no year is specified.
+        """
+        counts = SubdivisionCount.objects.filter(
+            level=self._meta.model_name, collectivity_id=self.id
+        )
+        if year:
+            counts = counts.filter(year__year=year)
+        fields = SubdivisionCount.FIELDS[self._meta.model_name]
+        entry = counts.order_by("-year__year").values(*fields).first()
+        if entry is None:
+            entry = self.count_subdivisions(year)
+        return entry
+
+
+class Region(SubdivisionsMixin, CollectivityModel):
     """
     A French région
     """
@@ -74,10 +159,18 @@ class Region(CollectivityModel):
     name = models.CharField("nom", max_length=100)
     years = models.ManyToManyField(DataYear, verbose_name="millésimes")
     insee = models.CharField(
-        "identifiant Insee", max_length=2, validators=[validate_insee_region]
+        "identifiant Insee",
+        max_length=2,
+        validators=[validate_insee_region],
+        db_index=True,
     )
     siren = models.CharField(
-        "numéro Siren", max_length=9, validators=[validate_siren], blank=True, null=True
+        "numéro Siren",
+        max_length=9,
+        validators=[validate_siren],
+        blank=True,
+        null=True,
+        db_index=True,
     )
     category = models.CharField(
         max_length=3,
@@ -87,22 +180,40 @@ class Region(CollectivityModel):
         verbose_name="catégorie",
     )
     slug = models.CharField(max_length=100, blank=True, default="")
+    search_name = models.CharField(
+        "nom normalisé", max_length=SEARCH_NAME_MAX_LENGTH, blank=True, default=""
+    )
 
     class Meta:
         verbose_name = "région"
         unique_together = (("name", "insee"),)
+        indexes = [
+            models.Index(
+                fields=["search_name"],
+                name="fd_region_search_name_idx",
+                opclasses=["varchar_pattern_ops"],
+            )
+        ]
 
     def __str__(self):
         return self.name
 
-    def subdivisions_count(self):
-        return {
-            "departements": self.departement_set.all().count(),
-            "communes": Commune.objects.filter(departement__region=self).count(),
-        }
+    def count_subdivisions(self, year: int = None) -> dict:
+        departements = self.departement_set.all()
+        communes = Commune.objects.filter(departement__region=self)
+        if year:
+            departements = departements.filter(years__year=year)
+            communes = communes.filter(years__year=year)
+        communes, epci_field = CommuneEpciMembership.annotate_epci(
+            communes, DataYear.objects.filter(year=year).first() if year else None
+        )
+        counts = communes.aggregate(
+            communes=Count("id"), epcis=Count(epci_field, distinct=True)
+        )
+        return {"departements": departements.count(), **counts}
 
 
-class Departement(CollectivityModel):
+class Departement(SubdivisionsMixin, CollectivityModel):
     """
     A French département
     """
@@ -118,10 +229,18 @@ class Departement(CollectivityModel):
         "Region", on_delete=models.CASCADE, verbose_name="région", blank=True, null=True
     )
     insee = models.CharField(
-        "identifiant Insee", max_length=3, validators=[validate_insee_departement]
+        "identifiant Insee",
+        max_length=3,
+        validators=[validate_insee_departement],
+        db_index=True,
     )
     siren = models.CharField(
-        "numéro Siren", max_length=9, validators=[validate_siren], blank=True, null=True
+        "numéro Siren",
+        max_length=9,
+        validators=[validate_siren],
+        blank=True,
+        null=True,
+        db_index=True,
     )
     category = models.CharField(
         max_length=5,
@@ -131,25 +250,51 @@ class Departement(CollectivityModel):
         verbose_name="catégorie",
     )
     slug = models.CharField(max_length=100, blank=True, default="")
+    search_name = models.CharField(
+        "nom normalisé", max_length=SEARCH_NAME_MAX_LENGTH, blank=True, default=""
+    )
 
     class Meta:
         verbose_name = "département"
+        indexes = [
+            models.Index(
+                fields=["search_name"],
+                name="fd_departement_search_name_idx",
+                opclasses=["varchar_pattern_ops"],
+            )
+        ]
 
     def __str__(self):
         return f"{self.insee} - {self.name}"
 
-    def list_epcis(self) -> QuerySet:
-        epci_ids = list(
-            self.commune_set.all().values_list("epci__id", flat=True).distinct()
+    def count_subdivisions(self, year: int = None) -> dict:
+        communes = self.commune_set.all()
+        if year:
+            communes = communes.filter(years__year=year)
+        communes, epci_field = CommuneEpciMembership.annotate_epci(
+            communes, DataYear.objects.filter(year=year).first() if year else None
+        )
+        return communes.aggregate(
+            communes=Count("id"), epcis=Count(epci_field, distinct=True)
         )
-        if None in epci_ids:
-            # It happens for departements that have isolated communes
-            epci_ids.remove(None)
+
+    def list_epcis(self, year: DataYear = None) -> QuerySet:
+        """
+        Returns the EPCIs of the communes of the département for the year,
+        or their current EPCIs if no year is specified
+        """
+        if year is not None:
+            epci_ids = CommuneEpciMembership.objects.filter(
+                year=year, commune__departement=self
+            ).values("epci_id")
+        else:
+            # The departements that have isolated communes have null values
+            epci_ids = self.commune_set.filter(epci__isnull=False).values("epci_id")
 
         return Epci.objects.filter(id__in=epci_ids)
 
 
-class Epci(CollectivityModel):
+class Epci(SubdivisionsMixin, CollectivityModel):
     """
     A French établissement public de coopération intercommunale
     à fiscalité propre
@@ -171,11 +316,23 @@ class Epci(CollectivityModel):
         verbose_name="type d’EPCI",
         blank=True,
     )
-    siren = models.CharField("numéro Siren", max_length=9, validators=[validate_siren])
+    siren = models.CharField(
+        "numéro Siren", max_length=9, validators=[validate_siren], db_index=True
+    )
     slug = models.CharField(max_length=100, blank=True, default="")
+    search_name = models.CharField(
+        "nom normalisé", max_length=SEARCH_NAME_MAX_LENGTH, blank=True, default=""
+    )
 
     class Meta:
         verbose_name = "EPCI"
+        indexes = [
+            models.Index(
+                fields=["search_name"],
+                name="fd_epci_search_name_idx",
+                opclasses=["varchar_pattern_ops"],
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -183,6 +340,27 @@ class Epci(CollectivityModel):
     def create_slug(self):
         self.slug = slugify(f"{unidecode(self.name)}-{self.siren}")
 
+    def count_subdivisions(self, year: int = None) -> dict:
+        communes = self.commune_set.all()
+        if year:
+            year_entry = DataYear.objects.filter(year=year).first()
+            if CommuneEpciMembership.objects.filter(year=year_entry).exists():
+                communes = self.list_communes(year_entry)
+            else:
+                communes = communes.filter(years__year=year)
+        return {"communes": communes.count()}
+
+    def list_communes(self, year: DataYear = None) -> QuerySet:
+        """
+        Returns the member communes of the EPCI for the year,
+        or its current members if no year is specified
+        """
+        if year is None:
+            return self.commune_set.all()
+        return Commune.objects.filter(
+            communeepcimembership__epci=self, communeepcimembership__year=year
+        )
+
 
 class Commune(CollectivityModel):
     """
@@ -198,16 +376,33 @@ class Commune(CollectivityModel):
         "Epci", on_delete=models.CASCADE, null=True, verbose_name="EPCI", blank=True
     )
     insee = models.CharField(
-        "identifiant Insee", max_length=5, validators=[validate_insee_commune]
+        "identifiant Insee",
+        max_length=5,
+        validators=[validate_insee_commune],
+        db_index=True,
     )
     siren = models.CharField(
-        "numéro Siren", max_length=9, validators=[validate_siren], blank=True
+        "numéro Siren",
+        max_length=9,
+        validators=[validate_siren],
+        blank=True,
+        db_index=True,
     )
     population = models.IntegerField(null=True, blank=True)
     slug = models.CharField(max_length=100, blank=True, default="")
+    search_name = models.CharField(
+        "nom normalisé", max_length=SEARCH_NAME_MAX_LENGTH, blank=True, default=""
+    )
 
     class Meta:
         verbose_name = "commune"
+        indexes = [
+            models.Index(
+                fields=["search_name"],
+                name="fd_commune_search_name_idx",
+                opclasses=["varchar_pattern_ops"],
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.departement})"
@@ -215,6 +410,17 @@ class Commune(CollectivityModel):
     def create_slug(self):
         self.slug = slugify(f"{unidecode(self.name)}-{self.insee}")
 
+    def get_epci(self, year: DataYear = None) -> Optional["Epci"]:
+        """
+        Returns the EPCI of the commune for the year,
+        or its current EPCI if no year is specified
+        """
+        if year is None:
+            return self.epci
+        return Epci.objects.filter(
+            communeepcimembership__commune=self, communeepcimembership__year=year
+        ).first()
+
     @classmethod
     def get_prefectures(cls) -> QuerySet:
         """
@@ -243,13 +449,332 @@ class Commune(CollectivityModel):
         return prefectures | most_populated
 
 
+class CommuneEpciMembership(TimeStampModel):
+    """
+    The EPCI a commune belongs to for a year, filled by the EPCI import.
+    Commune.epci only holds the membership of the latest import.
+    """
+
+    commune = models.ForeignKey(
+        "Commune", on_delete=models.CASCADE, verbose_name="commune"
+    )
+    epci = models.ForeignKey("Epci", on_delete=models.CASCADE, verbose_name="EPCI")
+    year = models.ForeignKey(
+        "DataYear", on_delete=models.CASCADE, verbose_name="millésime"
+    )
+
+    class Meta:
+        verbose_name = "appartenance à un EPCI"
+        verbose_name_plural = "appartenances à un EPCI"
+        constraints = [
+            # Also used to find the EPCI of a commune for a year
+            models.UniqueConstraint(
+                fields=["commune", "year"], name="fd_unique_epci_membership"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["epci", "year"], name="fd_epcimember_epci_year_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.commune} - {self.epci} - {self.year}"
+
+    @classmethod
+    def annotate_epci(
+        cls,
+        queryset: QuerySet,
+        year_entry: Optional[DataYear],
+        prefix: str = "",
+        memberships: bool = None,
+    ) -> Tuple[QuerySet, str]:
+        """
+        Joins the EPCI of the year to the communes of the queryset (prefix is
+        the path to the commune), and returns the queryset with the path of the EPCI id.
+
+        Without year, or for the years imported before the memberships were kept,
+        the current EPCI of the communes is used. memberships tells whether the year
+        has memberships, to skip the query checking it.
+        """
+        if memberships is None:
+            memberships = (
+                year_entry is not None and cls.objects.filter(year=year_entry).exists()
+            )
+        if not memberships:
+            return queryset, f"{prefix}epci_id"
+
+        relation = f"{prefix}communeepcimembership"
+        queryset = queryset.annotate(
+            year_membership=FilteredRelation(
+                relation, condition=Q(**{f"{relation}__year": year_entry})
+            )
+        )
+        return queryset, "year_membership__epci_id"
+
+
+class SubdivisionCount(TimeStampModel):
+    """
+    The number of subdivisions of a région, département or EPCI for a year,
+    computed after the imports
+    """
+
+    LEVELS = [
+        ("region", "région"),
+        ("departement", "département"),
+        ("epci", "EPCI"),
+    ]
+
+    # The subdivisions counted for each level
+    FIELDS = {
+        "region": ["departements", "epcis", "communes"],
+        "departement": ["epcis", "communes"],
+        "epci": ["communes"],
+    }
+
+    year = models.ForeignKey(
+        "DataYear", on_delete=models.CASCADE, verbose_name="millésime"
+    )
+    level = models.CharField("échelon", max_length=11, choices=LEVELS)
+    collectivity_id = models.BigIntegerField("identifiant de la collectivité")
+    departements = models.PositiveIntegerField("départements", default=0)
+    epcis = models.PositiveIntegerField("EPCI", default=0)
+    communes = models.PositiveIntegerField("communes", default=0)
+
+    class Meta:
+        verbose_name = "nombre de subdivisions"
+        verbose_name_plural = "nombres de subdivisions"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["level", "collectivity_id", "year"],
+                name="fd_unique_subdivision_count",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.level} {self.collectivity_id} - {self.year}"
+
+    @classmethod
+    def refresh(cls, year_entry: DataYear) -> int:
+        """
+        Counts the subdivisions of each collectivity of the year, with one grouped
+        query per level, and replaces the previous counts. Returns the number of
+        collectivities counted.
+        """
+        # The collectivities without subdivisions are counted too
+        counts = {}
+        for level, model in [
+            ("region", Region),
+            ("departement", Departement),
+            ("epci", Epci),
+        ]:
+            for collectivity_id in model.objects.filter(years=year_entry).values_list(
+                "id", flat=True
+            ):
+                counts[(level, collectivity_id)] = {}
+
+        departements = (
+            Departement.objects.filter(years=year_entry, region__isnull=False)
+            .values("region_id")
+            .annotate(departements=Count("id"))
+            .order_by()
+        )
+        for row in departements:
+            counts.setdefault(("region", row["region_id"]), {}).update(
+                departements=row["departements"]
+            )
+
+        # The communes are grouped by their EPCI of the year
+        communes, epci_field = CommuneEpciMembership.annotate_epci(
+            Commune.objects.filter(years=year_entry), year_entry
+        )
+        for level, parent in [
+            ("region", "departement__region_id"),
+            ("departement", "departement_id"),
+            ("epci", epci_field),
+        ]:
+            annotations = {"communes": Count("id")}
+            if "epcis" in cls.FIELDS[level]:
+                annotations["epcis"] = Count(epci_field, distinct=True)
+            for row in communes.values(parent).annotate(**annotations).order_by():
+                if row[parent] is not None:
+                    collectivity_id = row.pop(parent)
+                    counts.setdefault((level, collectivity_id), {}).update(row)
+
+        with transaction.atomic():
+            cls.objects.filter(year=year_entry).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        year=year_entry,
+                        level=level,
+                        collectivity_id=collectivity_id,
+                        **values,
+                    )
+                    for (level, collectivity_id), values in counts.items()
+                ],
+                batch_size=IMPORT_BATCH_SIZE,
+            )
+        return len(counts)
+
+    @classmethod
+    def annotate_queryset(cls, queryset: QuerySet, year: int = None) -> QuerySet:
+        """
+        Adds the precomputed counts of the given year (by default, the most recent
+        one) to the collectivities of the queryset, as <subdivision>_count fields,
+        with the id of their year as counts_year_id, in the same query. They are
+        None for the collectivities not counted yet.
+        """
+        level = queryset.model._meta.model_name
+        counts = cls.objects.filter(level=level, collectivity_id=OuterRef("pk"))
+        if year:
+            counts = counts.filter(year__year=year)
+        counts = counts.order_by("-year__year")
+        return queryset.annotate(
+            counts_year_id=Subquery(counts.values("year_id")[:1]),
+            **{
+                f"{field}_count": Subquery(counts.values(field)[:1])
+                for field in cls.FIELDS[level]
+            },
+        )
+
+
 # France collectivities data models
+
+# The datatypes of the values also stored in the numeric columns
+INT_DATATYPES = {"int", "integer"}
+NUMERIC_DATATYPES = INT_DATATYPES | {"float", "decimal", "numeric"}
+
+NUMERIC_MAX_DIGITS = 20
+NUMERIC_DECIMAL_PLACES = 6
+
+
+def parse_decimal(value: Optional[str]) -> Optional[Decimal]:
+    """
+    Parses a number, written with a dot or with the French conventions ("1 234,5").
+    Returns None if the value is not a number fitting the numeric columns.
+    """
+    if value is None:
+        return None
+    cleaned = str(value).strip()
+    for separator in [" ", "\u00a0", "\u202f"]:
+        cleaned = cleaned.replace(separator, "")
+    try:
+        number = Decimal(cleaned.replace(",", "."))
+    except InvalidOperation:
+        return None
+
+    if not number.is_finite() or abs(number) >= Decimal(10) ** (
+        NUMERIC_MAX_DIGITS - NUMERIC_DECIMAL_PLACES
+    ):
+        return None
+    return number.quantize(Decimal(1).scaleb(-NUMERIC_DECIMAL_PLACES))
+
+
+def typed_values(datatype: Optional[str], value: Optional[str]) -> dict:
+    """
+    Returns the values of the typed columns of a data entry, according to its datatype
+    """
+    number = parse_decimal(value) if datatype in NUMERIC_DATATYPES else None
+    if number is None:
+        return {"value_int": None, "value_numeric": None}
+
+    value_int = None
+    if datatype in INT_DATATYPES and number == number.to_integral_value():
+        value_int = int(number)
+    return {"value_int": value_int, "value_numeric": number}
+
+
+def read_value(
+    value: Optional[str], value_int: Optional[int], value_numeric: Optional[Decimal]
+):
+    """
+    Returns a data value as read from its typed columns: an int for the integers,
+    a float for the other numbers, the original string otherwise
+    """
+    if value_int is not None:
+        return value_int
+    if value_numeric is not None:
+        return float(value_numeric)
+    return value
+
+
+class CollectivityDataQuerySet(QuerySet):
+    def latest_year(self, per_datacode: bool = False) -> QuerySet:
+        """
+        Keeps only the data of the latest year available for each collectivity,
+        or, if per_datacode is set, the latest value of each datacode.
+
+        It is done in the same query, with a correlated subquery on the
+        (collectivity, datacode, year) index.
+        """
+        collectivity = self.model.collectivity_field
+        latest = self.model.objects.filter(**{collectivity: OuterRef(collectivity)})
+        if per_datacode:
+            latest = latest.filter(datacode=OuterRef("datacode"))
+        latest_year = latest.order_by("-year__year").values("year__year")[:1]
+
+        return self.filter(year__year=Subquery(latest_year))
+
+    def ranking(
+        self,
+        datacode: str,
+        year: int = None,
+        descending: bool = True,
+        parent: models.Model = None,
+        min_value: Decimal = None,
+        max_value: Decimal = None,
+    ) -> QuerySet:
+        """
+        Keeps the numeric values of a datacode for a year (by default, the latest
+        one with values for that datacode), ordered by value.
+
+        It runs as an ORDER BY ... LIMIT on the (datacode, year, value_numeric) index
+        once sliced. parent restricts the ranking to the subdivisions of a région,
+        département or EPCI, following the parent_fields of the model.
+        """
+        queryset = self.model.annotate_parents(
+            self.filter(datacode=datacode, value_numeric__isnull=False)
+        )
+        if year is None:
+            latest_year = (
+                self.model.objects.filter(
+                    datacode=datacode, value_numeric__isnull=False
+                )
+                .order_by("-year__year")
+                .values("year_id")[:1]
+            )
+            queryset = queryset.filter(year_id=Subquery(latest_year))
+        else:
+            queryset = queryset.filter(year__year=year)
+
+        if parent is not None:
+            parent_level = parent._meta.model_name
+            if parent_level not in self.model.parent_fields:
+                raise ValueError(
+                    f"{self.model.collectivity_field} data cannot be ranked within a {parent_level}"
+                )
+            queryset = queryset.filter(
+                **{self.model.parent_fields[parent_level]: parent}
+            )
+        if min_value is not None:
+            queryset = queryset.filter(value_numeric__gte=min_value)
+        if max_value is not None:
+            queryset = queryset.filter(value_numeric__lte=max_value)
+
+        order = "-value_numeric" if descending else "value_numeric"
+        return queryset.order_by(order, "id")
+
+
 class CollectivityDataModel(TimeStampModel):
     """
     Abstract model for common methods used by the following ones
     """
 
     # (Missing here: "collectivity" variable, specific to the relevant collectivity level)
+    # The name of that variable:
+    collectivity_field = None
+    # The path to each upper level from the data entries
+    parent_fields = {}
+
     year = models.ForeignKey(
         "DataYear", on_delete=models.PROTECT, verbose_name="millésime"
     )
@@ -257,18 +782,42 @@ class CollectivityDataModel(TimeStampModel):
     value = models.CharField("valeur", max_length=255, blank=True, null=True)
     label = models.CharField("label", max_length=255, blank=True, null=True)
     datatype = models.CharField("type", max_length=255, blank=True, null=True)
+    # Copies of the numeric values, for the aggregations in SQL
+    value_int = models.BigIntegerField("valeur entière", blank=True, null=True)
+    value_numeric = models.DecimalField(
+        "valeur numérique",
+        max_digits=NUMERIC_MAX_DIGITS,
+        decimal_places=NUMERIC_DECIMAL_PLACES,
+        blank=True,
+        null=True,
+    )
     source = models.ForeignKey(
         "DataSource", on_delete=models.PROTECT, verbose_name="source"
     )
 
+    objects = CollectivityDataQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        for field, value in typed_values(self.datatype, self.value).items():
+            setattr(self, field, value)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def annotate_parents(cls, queryset: QuerySet) -> QuerySet:
+        """
+        Adds the relations that the parent_fields go through, if any
+        """
+        return queryset
+
 
 class RegionData(CollectivityDataModel):
     region = models.ForeignKey(
         "Region", on_delete=models.CASCADE, verbose_name="région"
     )
+    collectivity_field = "region"
 
     class Meta:
         verbose_name = "donnée région"
@@ -278,6 +827,19 @@ class RegionData(CollectivityDataModel):
                 fields=["region", "year", "datacode"], name="fd_unique_region_data"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["region", "datacode", "year"],
+                name="fd_regiondata_latest_idx",
+            ),
+            models.Index(
+                fields=["datacode", "year"], name="fd_regiondata_code_year_idx"
+            ),
+            models.Index(
+                fields=["datacode", "year", "value_numeric"],
+                name="fd_regiondata_numeric_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.region.name} - {self.year.year} - {self.datacode}: {self.value}"
@@ -287,6 +849,8 @@ class DepartementData(CollectivityDataModel):
     departement = models.ForeignKey(
         "Departement", on_delete=models.CASCADE, verbose_name="département"
     )
+    collectivity_field = "departement"
+    parent_fields = {"region": "departement__region"}
 
     class Meta:
         verbose_name = "donnée département"
@@ -297,6 +861,17 @@ class DepartementData(CollectivityDataModel):
                 name="fd_unique_departement_data",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["departement", "datacode", "year"],
+                name="fd_departementdata_latest_idx",
+            ),
+            models.Index(fields=["datacode", "year"], name="fd_deptdata_code_year_idx"),
+            models.Index(
+                fields=["datacode", "year", "value_numeric"],
+                name="fd_deptdata_numeric_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.departement.name} - {self.year.year} - {self.datacode}: {self.value}"
@@ -304,6 +879,7 @@ class DepartementData(CollectivityDataModel):
 
 class EpciData(CollectivityDataModel):
     epci = models.ForeignKey("Epci", on_delete=models.CASCADE, verbose_name="EPCI")
+    collectivity_field = "epci"
 
     class Meta:
         verbose_name = "donnée EPCI"
@@ -314,6 +890,17 @@ class EpciData(CollectivityDataModel):
                 name="fd_unique_epci_data",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["epci", "datacode", "year"],
+                name="fd_epcidata_latest_idx",
+            ),
+            models.Index(fields=["datacode", "year"], name="fd_epcidata_code_year_idx"),
+            models.Index(
+                fields=["datacode", "year", "value_numeric"],
+                name="fd_epcidata_numeric_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.epci.name} - {self.year.year} - {self.datacode}: {self.value}"
@@ -323,6 +910,13 @@ class CommuneData(CollectivityDataModel):
     commune = models.ForeignKey(
         "Commune", on_delete=models.CASCADE, verbose_name="commune"
     )
+    collectivity_field = "commune"
+    # The EPCI is the one the commune belonged to the year of the data
+    parent_fields = {
+        "region": "commune__departement__region",
+        "departement": "commune__departement",
+        "epci": "year_membership__epci",
+    }
 
     class Meta:
         verbose_name = "donnée commune"
@@ -333,6 +927,28 @@ class CommuneData(CollectivityDataModel):
                 name="fd_unique_commune_data",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["commune", "datacode", "year"],
+                name="fd_communedata_latest_idx",
+            ),
+            models.Index(
+                fields=["datacode", "year"], name="fd_communedata_code_year_idx"
+            ),
+            models.Index(
+                fields=["datacode", "year", "value_numeric"],
+                name="fd_communedata_numeric_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.commune.name} - {self.year.year} - {self.datacode}: {self.value}"
+
+    @classmethod
+    def annotate_parents(cls, queryset: QuerySet) -> QuerySet:
+        relation = "commune__communeepcimembership"
+        return queryset.annotate(
+            year_membership=FilteredRelation(
+                relation, condition=Q(**{f"{relation}__year": F("year")})
+            )
+        )
@@ -1,5 +1,5 @@
 from francedata.services.django_admin import TimeStampModel
-from django.db import models
+from django.db import connection, models
 
 # Meta models
 class Metadata(TimeStampModel):
@@ -30,3 +30,13 @@ class DataYear(TimeStampModel):
     class Meta:
         verbose_name = "millésime"
         get_latest_by = "year"
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        super().save(*args, **kwargs)
+        # The data tables can only be partitioned on PostgreSQL
+        if created and connection.vendor == "postgresql":
+            # The partitions service imports the data models
+            from francedata.services.partitions import create_year_partitions
+
+            create_year_partitions(self)
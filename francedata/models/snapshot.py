@@ -0,0 +1,300 @@
+"""
+Materialized wide tables of the collectivities, one per level.
+
+Each entry holds a collectivity for a year with the identifiers of its upper levels
+and all its data of the year in a JSON field, so that the read endpoints need
+a single-table lookup. They are optional (FRANCEDATA_SNAPSHOTS setting) and
+rebuilt in bulk after the imports.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.query import QuerySet
+
+from francedata.models.collectivity import (
+    Commune,
+    CommuneData,
+    CommuneEpciMembership,
+    Departement,
+    DepartementData,
+    Epci,
+    EpciData,
+    Region,
+    RegionData,
+    SEARCH_NAME_MAX_LENGTH,
+    read_value,
+)
+from francedata.models.meta import DataYear
+from francedata.services.django_admin import TimeStampModel
+from francedata.services.utils import IMPORT_BATCH_SIZE, batched
+
+
+def snapshots_enabled() -> bool:
+    return getattr(settings, "FRANCEDATA_SNAPSHOTS", False)
+
+
+class CollectivitySnapshot(TimeStampModel):
+    """
+    Abstract model for the snapshots of each level
+    """
+
+    # The name of the collectivity foreign key, and its data model
+    collectivity_field = None
+    data_model = None
+    # The copied fields, with their lookup from the collectivity
+    copied_fields = {}
+
+    year = models.ForeignKey(
+        "DataYear", on_delete=models.CASCADE, verbose_name="millésime"
+    )
+    name = models.CharField("nom", max_length=100)
+    slug = models.CharField(max_length=100, blank=True, default="")
+    search_name = models.CharField(
+        "nom normalisé", max_length=SEARCH_NAME_MAX_LENGTH, blank=True, default=""
+    )
+    data = models.JSONField("données", default=dict, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.name} - {self.year}"
+
+    @classmethod
+    def rebuild(cls, year_entry: DataYear) -> int:
+        """
+        Replaces the snapshots of the year with the collectivities of the year
+        and their data, read by batches of collectivities. Returns the number
+        of snapshots created.
+        """
+        collectivities, fields = cls.collectivities(year_entry)
+        collectivities = collectivities.order_by("id").values_list(
+            "id", *fields.values()
+        )
+
+        count = 0
+        with transaction.atomic():
+            cls.objects.filter(year=year_entry).delete()
+            for batch in batched(collectivities.iterator(), IMPORT_BATCH_SIZE):
+                data = cls.read_data(year_entry, [row[0] for row in batch])
+                cls.objects.bulk_create(
+                    [
+                        cls(
+                            **{f"{cls.collectivity_field}_id": collectivity_id},
+                            year=year_entry,
+                            data=data.get(collectivity_id, {}),
+                            **dict(zip(fields, values)),
+                        )
+                        for collectivity_id, *values in batch
+                    ]
+                )
+                count += len(batch)
+        return count
+
+    @classmethod
+    def collectivities(cls, year_entry: DataYear) -> Tuple[QuerySet, Dict[str, str]]:
+        """
+        Returns the collectivities of the year, and the lookups of the copied fields
+        """
+        collectivity_model = cls._meta.get_field(cls.collectivity_field).related_model
+        fields = {"name": "name", "slug": "slug", "search_name": "search_name"}
+        fields.update(cls.copied_fields)
+        return collectivity_model.objects.filter(years=year_entry), fields
+
+    @classmethod
+    def read_data(cls, year_entry: DataYear, ids: List[int]) -> Dict[int, dict]:
+        """
+        Returns the data of the year of the collectivities, by collectivity id
+        """
+        collectivity_id = f"{cls.data_model.collectivity_field}_id"
+        rows = cls.data_model.objects.filter(
+            year=year_entry, **{f"{collectivity_id}__in": ids}
+        ).values_list(
+            collectivity_id, "datacode", "value", "value_int", "value_numeric"
+        )
+
+        data = {}
+        for collectivity, datacode, value, value_int, value_numeric in rows:
+            data.setdefault(collectivity, {})[datacode] = read_value(
+                value, value_int, value_numeric
+            )
+        return data
+
+
+class RegionSnapshot(CollectivitySnapshot):
+    region = models.ForeignKey(
+        "Region", on_delete=models.CASCADE, verbose_name="région"
+    )
+    insee = models.CharField("identifiant Insee", max_length=2)
+    siren = models.CharField("numéro Siren", max_length=9, blank=True, null=True)
+
+    collectivity_field = "region"
+    data_model = RegionData
+    copied_fields = {"insee": "insee", "siren": "siren"}
+
+    class Meta:
+        verbose_name = "instantané région"
+        verbose_name_plural = "instantanés région"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["region", "year"], name="fd_unique_region_snapshot"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["insee", "year"], name="fd_regionsnap_insee_idx"),
+            models.Index(fields=["siren", "year"], name="fd_regionsnap_siren_idx"),
+            models.Index(
+                fields=["search_name"],
+                name="fd_regionsnap_search_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+
+class DepartementSnapshot(CollectivitySnapshot):
+    departement = models.ForeignKey(
+        "Departement", on_delete=models.CASCADE, verbose_name="département"
+    )
+    insee = models.CharField("identifiant Insee", max_length=3)
+    siren = models.CharField("numéro Siren", max_length=9, blank=True, null=True)
+    region_insee = models.CharField(
+        "identifiant Insee de la région", max_length=2, blank=True, null=True
+    )
+
+    collectivity_field = "departement"
+    data_model = DepartementData
+    copied_fields = {
+        "insee": "insee",
+        "siren": "siren",
+        "region_insee": "region__insee",
+    }
+
+    class Meta:
+        verbose_name = "instantané département"
+        verbose_name_plural = "instantanés département"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["departement", "year"], name="fd_unique_departement_snapshot"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["insee", "year"], name="fd_deptsnap_insee_idx"),
+            models.Index(fields=["siren", "year"], name="fd_deptsnap_siren_idx"),
+            models.Index(
+                fields=["search_name"],
+                name="fd_deptsnap_search_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+
+class EpciSnapshot(CollectivitySnapshot):
+    epci = models.ForeignKey("Epci", on_delete=models.CASCADE, verbose_name="EPCI")
+    siren = models.CharField("numéro Siren", max_length=9)
+    epci_type = models.CharField(
+        "type d’EPCI",
+        max_length=5,
+        choices=Epci.EpciType.choices,
+        blank=True,
+        null=True,
+    )
+
+    collectivity_field = "epci"
+    data_model = EpciData
+    copied_fields = {"siren": "siren", "epci_type": "epci_type"}
+
+    class Meta:
+        verbose_name = "instantané EPCI"
+        verbose_name_plural = "instantanés EPCI"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["epci", "year"], name="fd_unique_epci_snapshot"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["siren", "year"], name="fd_epcisnap_siren_idx"),
+            models.Index(
+                fields=["search_name"],
+                name="fd_epcisnap_search_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+
+class CommuneSnapshot(CollectivitySnapshot):
+    commune = models.ForeignKey(
+        "Commune", on_delete=models.CASCADE, verbose_name="commune"
+    )
+    insee = models.CharField("identifiant Insee", max_length=5)
+    siren = models.CharField("numéro Siren", max_length=9, blank=True)
+    departement_insee = models.CharField(
+        "identifiant Insee du département", max_length=3
+    )
+    region_insee = models.CharField(
+        "identifiant Insee de la région", max_length=2, blank=True, null=True
+    )
+    epci_siren = models.CharField(
+        "numéro Siren de l’EPCI", max_length=9, blank=True, null=True
+    )
+    population = models.IntegerField(null=True, blank=True)
+
+    collectivity_field = "commune"
+    data_model = CommuneData
+    copied_fields = {
+        "insee": "insee",
+        "siren": "siren",
+        "departement_insee": "departement__insee",
+        "region_insee": "departement__region__insee",
+        "epci_siren": "epci__siren",
+        "population": "population",
+    }
+
+    class Meta:
+        verbose_name = "instantané commune"
+        verbose_name_plural = "instantanés commune"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["commune", "year"], name="fd_unique_commune_snapshot"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["insee", "year"], name="fd_communesnap_insee_idx"),
+            models.Index(fields=["siren", "year"], name="fd_communesnap_siren_idx"),
+            models.Index(
+                fields=["search_name"],
+                name="fd_communesnap_search_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+    @classmethod
+    def collectivities(cls, year_entry: DataYear) -> Tuple[QuerySet, Dict[str, str]]:
+        queryset, fields = super().collectivities(year_entry)
+        # The EPCI of the year, from the memberships when they were kept
+        queryset, epci_id = CommuneEpciMembership.annotate_epci(queryset, year_entry)
+        fields["epci_siren"] = epci_id.replace("epci_id", "epci__siren")
+        return queryset, fields
+
+
+SNAPSHOT_MODELS = {
+    "region": RegionSnapshot,
+    "departement": DepartementSnapshot,
+    "epci": EpciSnapshot,
+    "commune": CommuneSnapshot,
+}
+
+
+def rebuild_snapshots(
+    year_entry: Optional[DataYear], levels: List[str] = None
+) -> Dict[str, int]:
+    """
+    Rebuilds the snapshots of the year for the given levels (by default, all of them),
+    if they are enabled. Returns the number of snapshots created per level.
+    """
+    if year_entry is None or not snapshots_enabled():
+        return {}
+    return {
+        level: SNAPSHOT_MODELS[level].rebuild(year_entry)
+        for level in (SNAPSHOT_MODELS if levels is None else levels)
+    }
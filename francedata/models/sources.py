@@ -5,19 +5,30 @@ from francedata.models.collectivity import (
     DepartementData,
     Epci,
     EpciData,
+    SubdivisionCount,
+    typed_values,
 )
+from francedata.models.snapshot import rebuild_snapshots
 from francedata.services.django_admin import TimeStampModel
 from django.db import models
 
 from simple_history.models import HistoricalRecords
-from typing import Union
-
-from francedata.services.banatic import import_epci_row_from_banatic
-from francedata.services.utils import fieldfile_to_dictreader
+from itertools import islice
+from typing import Callable, List, Optional, Tuple, Union
+
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.utils import (
+    IMPORT_BATCH_SIZE,
+    batched,
+    fieldfile_to_dictreader,
+    get_fieldfile_hash,
+)
 
 import logging
+from datetime import timedelta
+from django.conf import settings
 from django.contrib import messages
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from francedata.services.django_admin import TimeStampModel
@@ -72,6 +83,16 @@ class DataMapping(TimeStampModel):
     def __str__(self):
         return self.name
 
+    def get_version(self) -> Optional[int]:
+        """
+        The id of the latest history entry, changed by each edit of the mapping
+        """
+        return (
+            self.history.order_by("-history_id")
+            .values_list("history_id", flat=True)
+            .first()
+        )
+
 
 class DataSourceFile(TimeStampModel):
     name = models.CharField("Nom", max_length=100, blank=True, null=True)
@@ -86,6 +107,23 @@ class DataSourceFile(TimeStampModel):
     )
     is_imported = models.BooleanField("import effectué", default=False)
     imported_at = models.DateTimeField("date d’import", null=True, blank=True)
+    checkpoint_offset = models.PositiveIntegerField(
+        "lignes déjà importées",
+        default=0,
+        help_text="Position de reprise d’un import interrompu",
+    )
+    checkpoint_hash = models.CharField(
+        "empreinte du fichier en cours d’import", max_length=64, blank=True
+    )
+    content_hash = models.CharField(
+        "empreinte du fichier", max_length=64, blank=True, db_index=True
+    )
+    data_mapping_version = models.PositiveIntegerField(
+        "version de la table de correspondance",
+        null=True,
+        blank=True,
+        help_text="Version utilisée lors de l’envoi du fichier, puis lors de son import",
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -98,36 +136,169 @@ class DataSourceFile(TimeStampModel):
         if not self.name:
             self.name = self.data_file.name[:100]
 
+        # The hash is only computed for new uploads, not on each save
+        if not self.content_hash or not self.data_file._committed:
+            content_hash = get_fieldfile_hash(self.data_file)
+            if self.content_hash and content_hash != self.content_hash:
+                # The new content was not imported yet
+                self.is_imported = False
+                self.imported_at = None
+            self.content_hash = content_hash
+
+        if self.data_mapping_version is None:
+            self.data_mapping_version = self.data_mapping.get_version()
+
         super().save(*args, **kwargs)
 
-    def mark_imported(self) -> None:
+    def get_imported_duplicate(self) -> Optional["DataSourceFile"]:
+        """
+        Returns another file with the same content, already imported for the same
+        year with the same version of the mapping
+        """
+        return (
+            DataSourceFile.objects.exclude(pk=self.pk)
+            .filter(
+                is_imported=True,
+                content_hash=self.content_hash,
+                data_mapping_version=self.data_mapping_version,
+                source__year_id=self.source.year_id,
+            )
+            .order_by("imported_at")
+            .first()
+        )
+
+    def mark_imported(
+        self,
+        snapshots: bool = True,
+        heartbeat: Callable[[], None] = None,
+        skipped: bool = False,
+    ) -> None:
+        """
+        Marks the file as imported and refreshes the tables computed from its data.
+
+        With snapshots=False, the snapshots are left to the caller, which rebuilds
+        them once after a batch of files. heartbeat is called before each step,
+        to show that the import job running them is still alive. A skipped import
+        changed no data, so nothing is refreshed.
+        """
+        heartbeat = heartbeat or (lambda: None)
         self.is_imported = True
         self.imported_at = timezone.now()
         self.save()
+        if skipped:
+            return
+        if self.get_mapping_value("collectivity_create", False):
+            heartbeat()
+            SubdivisionCount.refresh(self.source.year)
+        heartbeat()
+        self.rollup_data()
+        if snapshots:
+            heartbeat()
+            self.rebuild_snapshots()
+        heartbeat()
+        bump_dataset_version()
+
+    def get_rollup_aggregates(self) -> dict:
+        """
+        The aggregate functions of the commune data fields rolled up to the upper
+        levels, set with the "rollup" key of the fields ("sum", "avg", "min" or "max")
+        """
+        if self.get_mapping_value("collectivity_type") != "commune":
+            return {}
+        aggregates = {
+            field["fieldname_database"]: field["rollup"]
+            for field in self.get_mapping_value("data_fields", [])
+            if field.get("rollup")
+        }
+        if self.get_mapping_value("collectivity_create", False):
+            # The population of the communes created by the file is rolled up too
+            aggregates.setdefault("population", "sum")
+        return aggregates
+
+    def rollup_data(self) -> None:
+        aggregates = self.get_rollup_aggregates()
+        if aggregates:
+            # The roll-up service imports the models
+            from francedata.services.rollup import rollup_commune_data
+
+            rollup_commune_data(self.source.year, aggregates)
+
+    def snapshot_levels(self) -> List[str]:
+        """
+        The level of the file, and the upper levels when its data is rolled up
+        """
+        levels = [self.get_mapping_value("collectivity_type")]
+        if self.get_rollup_aggregates():
+            levels += ["epci", "departement", "region"]
+        return levels
+
+    def rebuild_snapshots(self) -> None:
+        rebuild_snapshots(self.source.year, self.snapshot_levels())
 
     def import_file_data_command(self, request) -> None:
         """
-        The command actioned on click from the admin interface
+        The command actioned on click from the admin interface:
+        the import is queued, to be run by the import_worker command
         """
-        if self.data_file.size > 1048576:
-            messages.info(
-                request,
-                "Compte-tenu de la taille importante de ce fichier, il sera importé automatiquement durant la nuit.",
-            )
+        job, created = ImportJob.enqueue(self)
+        if created:
+            messages.info(request, "L’import a été ajouté à la file d’attente.")
         else:
-            response = self.import_file_data()
-            result = response["success"]
-            if result:
-                self.mark_imported()
-                messages.success(request, "L’import a été effectué avec succès.")
-            else:
-                messages.error(request, "Erreur lors de l’import.")
-                for message in response["messages"]:
-                    messages.error(request, message)
+            messages.info(request, "Un import de ce fichier est déjà en cours.")
+
+    def save_checkpoint(self, offset: int, content_hash: str) -> None:
+        if (offset, content_hash) == (self.checkpoint_offset, self.checkpoint_hash):
+            return
+        self.checkpoint_offset = offset
+        self.checkpoint_hash = content_hash
+        DataSourceFile.objects.filter(pk=self.pk).update(
+            checkpoint_offset=offset, checkpoint_hash=content_hash
+        )
+
+    def import_file_data(
+        self,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        restart: bool = False,
+    ) -> dict:
+        """
+        Imports the data of the file.
 
-    def import_file_data(self) -> dict:
-        response = {"success": False, messages: []}
-        # Step 1: get the data in a dictReader
+        The import is skipped if the same content was already imported for the
+        same year with the same version of the mapping, unless restart is True.
+
+        Each batch of rows is committed with the offset of the next row. If the
+        import is interrupted, the next one resumes from that offset, unless the
+        file content changed or restart is True.
+
+        progress, if provided, is called after each batch with the number of rows
+        processed and the total number of rows.
+        """
+        response = {"success": False, "messages": []}
+        # Step 1: skip the content already imported
+        content_hash = get_fieldfile_hash(self.data_file)
+        mapping_version = self.data_mapping.get_version()
+        if (content_hash, mapping_version) == (
+            self.content_hash,
+            self.data_mapping_version,
+        ):
+            duplicate = self if self.is_imported else self.get_imported_duplicate()
+        else:
+            self.content_hash = content_hash
+            self.data_mapping_version = mapping_version
+            DataSourceFile.objects.filter(pk=self.pk).update(
+                content_hash=content_hash, data_mapping_version=mapping_version
+            )
+            duplicate = self.get_imported_duplicate()
+
+        if duplicate and not restart:
+            response["success"] = True
+            response["skipped"] = True
+            response["messages"].append(
+                f"Contenu déjà importé avec le fichier {duplicate}, import ignoré."
+            )
+            return response
+
+        # Step 2: get the data in a dictReader
         file_format = self.data_mapping.file_format
         year = self.source.year.year
 
@@ -139,134 +310,211 @@ class DataSourceFile(TimeStampModel):
 
         reader = fieldfile_to_dictreader(self.data_file, file_format, file_params, year)
 
-        # Step 2: process the data
-        for row in reader:
-            coll_type = mapping["collectivity_type"]
-            if coll_type == "departement":
-                self.import_departement_data(row)
-            elif coll_type == "commune":
-                self.import_commune_data(row)
-            elif coll_type == "epci":
-                self.import_epci_data(row)
-            else:
-                response["messages"].append("Type de collectivité non reconnu")
-                return response
+        # Step 3: process the data, by batches of rows
+        coll_type = mapping["collectivity_type"]
+        if coll_type == "departement":
+            import_batch = self.import_departement_batch
+        elif coll_type == "commune":
+            import_batch = self.import_commune_batch
+        elif coll_type == "epci":
+            import_batch = self.import_epci_batch
+        else:
+            response["messages"].append("Type de collectivité non reconnu")
+            return response
+
+        if restart or content_hash != self.checkpoint_hash:
+            self.save_checkpoint(0, content_hash)
+        rows_done = self.checkpoint_offset
+        if rows_done:
+            logging.info(f"Reprise de l’import de {self} à la ligne {rows_done}")
+
+        rows_total = None
+        if progress is not None:
+            # The file is already read in memory, so the rows can be counted first
+            rows = list(reader)
+            rows_total = len(rows)
+            reader = iter(rows)
+            progress(rows_done, rows_total)
+
+        for batch in batched(islice(reader, rows_done, None)):
+            with transaction.atomic():
+                import_batch(batch)
+                rows_done += len(batch)
+                self.save_checkpoint(rows_done, content_hash)
+            if progress is not None:
+                progress(rows_done, rows_total)
+
+        # The import is complete, the next one will start from the first row
+        self.save_checkpoint(0, content_hash)
 
         # Return True if everything went well
         response["success"] = True
         return response
 
     def import_departement_data(self, row: dict) -> None:
-        try:
-            insee = self.get_mapping_value("insee_key", "insee")
-            fields = self.get_mapping_value("data_fields", [])
-            force_year = self.get_mapping_value("force_year", False)
-
-            if force_year:
-                dept = Departement.objects.get(insee=row[insee], years=self.source.year)
+        self.import_departement_batch([row])
+
+    def import_departement_batch(self, rows: list) -> None:
+        insee = self.get_mapping_value("insee_key", "insee")
+        force_year = self.get_mapping_value("force_year", False)
+
+        depts = Departement.objects.filter(insee__in={row[insee] for row in rows})
+        if force_year:
+            depts = depts.filter(years=self.source.year)
+        depts_by_insee = {dept.insee: dept for dept in depts}
+
+        entries = {}
+        for row in rows:
+            dept = depts_by_insee.get(row[insee])
+            if dept is None:
+                logging.warning(f"Departement with insee code {row[insee]} not found")
             else:
-                dept = Departement.objects.get(insee=row[insee])
-            for field in fields:
-                values_dict = self.process_field(field, row)
-                fieldname_db = field["fieldname_database"]
-
-                md, md_created = DepartementData.objects.get_or_create(
-                    departement=dept,
-                    year=self.source.year,
-                    datacode=fieldname_db,
-                    defaults=values_dict,
-                )
-                md.save()
-        except Departement.DoesNotExist:
-            logging.warning(f"Departement with insee code {row[insee]} not found")
+                entries.setdefault(dept, row)
+        self.create_data_entries(DepartementData, entries)
 
     def import_epci_data(self, row: dict) -> None:
-        try:
-            siren = self.get_mapping_value("siren_key", "siren")
-            fields = self.get_mapping_value("data_fields", [])
-            coll_create = self.get_mapping_value("collectivity_create", False)
-
-            if coll_create:
-                field_names = self.get_mapping_value("collectivity_create_fields", {})
-                column_keys = {
-                    "epci_name": field_names["epci_name"],
-                    "epci_type": field_names["epci_type"],
-                    "epci_siren": field_names["epci_siren"],
-                    "member_siren": field_names["member_siren"],
-                }
-                year = self.source.year
-                import_epci_row_from_banatic(row, year, column_keys)
-
-            epci = Epci.objects.get(siren=row[siren], years=self.source.year)
-
-            logging.debug(f"Importing data for epci {epci}")
-            for field in fields:
-                values_dict = self.process_field(field, row)
-                fieldname_db = field["fieldname_database"]
-
-                md, md_created = EpciData.objects.get_or_create(
-                    epci=epci,
-                    year=self.source.year,
-                    datacode=fieldname_db,
-                    defaults=values_dict,
-                )
-                md.save()
+        self.import_epci_batch([row])
+
+    def import_epci_batch(self, rows: list) -> None:
+        siren = self.get_mapping_value("siren_key", "siren")
+        coll_create = self.get_mapping_value("collectivity_create", False)
+
+        if coll_create:
+            field_names = self.get_mapping_value("collectivity_create_fields", {})
+            column_keys = {
+                "epci_name": field_names["epci_name"],
+                "epci_type": field_names["epci_type"],
+                "epci_siren": field_names["epci_siren"],
+                "member_siren": field_names["member_siren"],
+            }
+            # The Banatic importer pulls in requests and openpyxl, not needed elsewhere
+            from francedata.services.banatic import import_epci_rows_from_banatic
+
+            year = self.source.year
+            import_epci_rows_from_banatic(rows, year, column_keys)
+
+        epcis_by_siren = {
+            epci.siren: epci
+            for epci in Epci.objects.filter(
+                siren__in={row[siren] for row in rows}, years=self.source.year
+            )
+        }
 
-        except Epci.DoesNotExist:
-            logging.warning(f"Departement with siren code {row[siren]} not found")
+        entries = {}
+        for row in rows:
+            epci = epcis_by_siren.get(row[siren])
+            if epci is None:
+                logging.warning(f"Epci with siren code {row[siren]} not found")
+            else:
+                logging.debug(f"Importing data for epci {epci}")
+                entries.setdefault(epci, row)
+        self.create_data_entries(EpciData, entries)
 
     def import_commune_data(self, row: dict) -> None:
-        try:
-            insee = self.get_mapping_value("insee_key", "insee")
-            fields = self.get_mapping_value("data_fields", [])
-            coll_create = self.get_mapping_value("collectivity_create", False)
-
-            if coll_create:
-                field_names = self.get_mapping_value("collectivity_create_fields", {})
-                name_field = field_names["name"]
-                siren_field = field_names["siren"]
-                pop_field = field_names["population"]
-                dept_field = field_names["dept"]
-                year = self.source.year
-
-                departement = Departement.objects.get(insee=row[dept_field], years=year)
-
-                values_dict = {
-                    "name": row[name_field],
-                    "departement": departement,
-                    "population": row[pop_field],
-                }
-
-                # The Siren/Insee combinaison should be unique: if there is a merger a new Siren is created
-                # The name isn’t used here because of variations between the COG and Aspic files
-                commune, commune_created = Commune.objects.get_or_create(
+        self.import_commune_batch([row])
+
+    def import_commune_batch(self, rows: list) -> None:
+        insee = self.get_mapping_value("insee_key", "insee")
+        coll_create = self.get_mapping_value("collectivity_create", False)
+        year = self.source.year
+
+        if coll_create:
+            communes = self.get_or_create_communes(rows)
+        else:
+            communes_by_insee = {
+                commune.insee: commune
+                for commune in Commune.objects.filter(
+                    insee__in={row[insee] for row in rows}, years=year
+                ).select_related("departement")
+            }
+            communes = [communes_by_insee.get(row[insee]) for row in rows]
+
+        entries = {}
+        for commune, row in zip(communes, rows):
+            if commune is None:
+                logging.warning(f"Commune with insee code {row[insee]} not found")
+            else:
+                logging.debug(f"Importing data for commune {commune}")
+                entries.setdefault(commune, row)
+        self.create_data_entries(CommuneData, entries)
+
+    def get_or_create_communes(self, rows: list) -> list:
+        """
+        Returns the communes of the rows, created if needed, in the same order.
+        None stands for the rows whose département was not found.
+        """
+        insee = self.get_mapping_value("insee_key", "insee")
+        field_names = self.get_mapping_value("collectivity_create_fields", {})
+        name_field = field_names["name"]
+        siren_field = field_names["siren"]
+        pop_field = field_names["population"]
+        dept_field = field_names["dept"]
+        year = self.source.year
+
+        depts_by_insee = {
+            dept.insee: dept
+            for dept in Departement.objects.filter(
+                insee__in={row[dept_field] for row in rows}, years=year
+            )
+        }
+
+        # The Siren/Insee combinaison should be unique: if there is a merger a new Siren is created
+        # The name isn’t used here because of variations between the COG and Aspic files
+        communes_by_ids = {
+            (commune.insee, commune.siren): commune
+            for commune in Commune.objects.filter(
+                insee__in={row[insee] for row in rows}
+            ).select_related("departement")
+        }
+
+        communes = []
+        created = []
+        for row in rows:
+            key = (row[insee], row[siren_field])
+            commune = communes_by_ids.get(key)
+            departement = depts_by_insee.get(row[dept_field])
+            if commune is None and departement is None:
+                logging.warning(
+                    f"Departement with insee code {row[dept_field]} not found"
+                )
+            elif commune is None:
+                commune = Commune(
                     insee=row[insee],
                     siren=row[siren_field],
-                    defaults=values_dict,
+                    name=row[name_field],
+                    departement=departement,
+                    population=row[pop_field],
                 )
+                commune.prepare(bulk=True)
+                communes_by_ids[key] = commune
+                created.append(commune)
+                logging.info(f"Created commune {row[name_field]}")
+            communes.append(commune)
 
-                if commune_created:
-                    logging.info(f"Created commune {row[name_field]}")
-
-                commune.save()
-                commune.years.add(year)
-            else:
-                commune = Commune.objects.get(insee=row[insee], years=self.source.year)
+        Commune.objects.bulk_create(created, batch_size=IMPORT_BATCH_SIZE)
+        Commune.add_year_to_entries([commune for commune in communes if commune], year)
 
-            logging.debug(f"Importing data for commune {commune}")
-            for field in fields:
-                values_dict = self.process_field(field, row)
-                fieldname_db = field["fieldname_database"]
+        return communes
 
-                md, md_created = CommuneData.objects.get_or_create(
-                    commune=commune,
+    def create_data_entries(self, model, rows_by_collectivity: dict) -> None:
+        """
+        Creates the data of the mapping fields for each collectivity, from its row,
+        in one query for the batch. The existing data is kept, like with get_or_create.
+        """
+        fields = self.get_mapping_value("data_fields", [])
+        model.objects.bulk_create(
+            [
+                model(
+                    **{model.collectivity_field: collectivity},
                     year=self.source.year,
-                    datacode=fieldname_db,
-                    defaults=values_dict,
+                    datacode=field["fieldname_database"],
+                    **self.process_field(field, row),
                 )
-                md.save()
-        except Commune.DoesNotExist:
-            logging.warning(f"Commune with insee code {row[insee]} not found")
+                for collectivity, row in rows_by_collectivity.items()
+                for field in fields
+            ],
+            ignore_conflicts=True,
+        )
 
     def get_mapping_value(self, key: str, default=None) -> Union[str, int, bool, None]:
         """
@@ -288,5 +536,172 @@ class DataSourceFile(TimeStampModel):
         return {
             "datatype": field_type,
             "value": row[fieldname_source],
+            **typed_values(field_type, row[fieldname_source]),
             "source": self.source,
         }
+
+
+class ImportJob(TimeStampModel):
+    """
+    An import of a source file, queued from the admin interface
+    and run by the import_worker command
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+
+    STATUSES = [
+        (PENDING, "en attente"),
+        (RUNNING, "en cours"),
+        (SUCCESS, "terminé"),
+        (FAILED, "échec"),
+    ]
+
+    source_file = models.ForeignKey(
+        DataSourceFile,
+        on_delete=models.CASCADE,
+        related_name="import_jobs",
+        verbose_name="fichier source",
+    )
+    status = models.CharField(
+        "statut", max_length=10, choices=STATUSES, default=PENDING
+    )
+    rows_done = models.PositiveIntegerField("lignes traitées", default=0)
+    rows_total = models.PositiveIntegerField("lignes à traiter", null=True, blank=True)
+    messages = models.JSONField("messages", default=list, blank=True)
+    worker = models.CharField("worker", max_length=255, blank=True)
+    started_at = models.DateTimeField("date de début", null=True, blank=True)
+    finished_at = models.DateTimeField("date de fin", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "tâche d’import"
+        verbose_name_plural = "tâches d’import"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="importjob_status_idx")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.source_file} ({self.get_status_display()})"
+
+    @classmethod
+    def expire_stale_jobs(cls) -> int:
+        """
+        Marks as failed the running jobs without progress for longer than
+        FRANCEDATA_IMPORT_JOB_TIMEOUT seconds (by default, one hour), e.g. left
+        by a worker that crashed. Returns the number of expired jobs.
+        """
+        timeout = getattr(settings, "FRANCEDATA_IMPORT_JOB_TIMEOUT", 3600)
+        now = timezone.now()
+        return cls.objects.filter(
+            status=cls.RUNNING, updated_at__lt=now - timedelta(seconds=timeout)
+        ).update(
+            status=cls.FAILED,
+            messages=["Tâche expirée : le worker ne l’a pas terminée"],
+            finished_at=now,
+            updated_at=now,
+        )
+
+    @classmethod
+    def enqueue(cls, source_file: DataSourceFile) -> Tuple["ImportJob", bool]:
+        """
+        Queues the import of the file, unless it is already queued or running
+        """
+        cls.expire_stale_jobs()
+        job = cls.objects.filter(
+            source_file=source_file, status__in=[cls.PENDING, cls.RUNNING]
+        ).first()
+        if job:
+            return job, False
+        return cls.objects.create(source_file=source_file), True
+
+    @classmethod
+    def claim_next(cls, worker: str) -> Optional["ImportJob"]:
+        """
+        Marks the oldest pending job as running and returns it.
+
+        The jobs locked by another worker are skipped, so several workers
+        can drain the queue at the same time.
+        """
+        cls.expire_stale_jobs()
+        with transaction.atomic():
+            job = (
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(status=cls.PENDING)
+                .order_by("created_at")
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = cls.RUNNING
+            job.worker = worker
+            job.started_at = timezone.now()
+            job.save()
+        return job
+
+    def update_progress(self, rows_done: int, rows_total: Optional[int]) -> None:
+        # Only the progress fields are written, in their own query, so that
+        # the change form can poll them while the import is running
+        self.rows_done = rows_done
+        self.rows_total = rows_total
+        ImportJob.objects.filter(pk=self.pk).update(
+            rows_done=rows_done, rows_total=rows_total, updated_at=timezone.now()
+        )
+
+    def heartbeat(self) -> None:
+        # Keeps the job from being expired during the long steps without progress
+        ImportJob.objects.filter(pk=self.pk).update(updated_at=timezone.now())
+
+    def run(self) -> bool:
+        """
+        Imports the file, and records the result. Returns True on success.
+
+        The result is only recorded if the job is still running for this worker:
+        a job expired meanwhile stays failed.
+        """
+        source_file = self.source_file
+        try:
+            response = source_file.import_file_data(progress=self.update_progress)
+            if response["success"]:
+                # The roll-ups, counts and snapshots computed after the import
+                source_file.mark_imported(
+                    heartbeat=self.heartbeat, skipped=response.get("skipped", False)
+                )
+        except Exception as e:
+            logging.exception(f"Import of {source_file} failed")
+            response = {"success": False, "messages": [f"{type(e).__name__}: {e}"]}
+
+        status = self.SUCCESS if response["success"] else self.FAILED
+        now = timezone.now()
+        recorded = ImportJob.objects.filter(
+            pk=self.pk, status=self.RUNNING, worker=self.worker
+        ).update(
+            status=status,
+            messages=response["messages"],
+            finished_at=now,
+            updated_at=now,
+        )
+        if not recorded:
+            logging.warning(f"Import job {self.pk} expired, its result is not recorded")
+            self.refresh_from_db()
+            return False
+        self.status = status
+        self.messages = response["messages"]
+        self.finished_at = now
+        return response["success"]
+
+    def get_progress(self) -> dict:
+        """
+        The state of the job, as polled by the admin change form of the file
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "status_label": self.get_status_display(),
+            "rows_done": self.rows_done,
+            "rows_total": self.rows_total,
+            "messages": self.messages,
+            "finished": self.status in (self.SUCCESS, self.FAILED),
+        }
@@ -1,5 +1,9 @@
 from ninja import Schema
-from typing import List
+from pydantic import StrictInt, conlist
+from typing import Dict, List, Union
+
+
+BATCH_MAX_CODES = 1000
 
 
 class DataYearSchema(Schema):
@@ -90,3 +94,87 @@ class CommuneDataSchema(Schema):
     datatype: str = None
     source: DataSourceSchema = None
     commune: CommuneSchema = None
+
+
+class BatchQuerySchema(Schema):
+    codes: conlist(str, min_items=1, max_items=BATCH_MAX_CODES)
+    year: int = None
+
+
+class RegionBatchSchema(Schema):
+    results: Dict[str, RegionSchema]
+    missing: List[str]
+
+
+class DepartementBatchSchema(Schema):
+    results: Dict[str, DepartementSchema]
+    missing: List[str]
+
+
+class EpciBatchSchema(Schema):
+    results: Dict[str, EpciSchema]
+    missing: List[str]
+
+
+class CommuneBatchSchema(Schema):
+    results: Dict[str, CommuneSchema]
+    missing: List[str]
+
+
+# Values of each datacode, as [year, value] pairs
+TimeseriesSchema = Dict[str, List[list]]
+
+
+class TimeseriesQuerySchema(Schema):
+    codes: conlist(str, min_items=1, max_items=BATCH_MAX_CODES)
+    datacodes: List[str] = None
+
+
+class TimeseriesBatchSchema(Schema):
+    results: Dict[str, TimeseriesSchema]
+    missing: List[str]
+
+
+class AncestorSchema(Schema):
+    name: str
+    insee: str = None
+    siren: str = None
+    slug: str = None
+
+
+class HierarchySchema(Schema):
+    year: int = None
+    commune: AncestorSchema
+    epci: AncestorSchema = None
+    departement: AncestorSchema
+    region: AncestorSchema = None
+
+
+class HierarchyBatchSchema(Schema):
+    results: Dict[str, HierarchySchema]
+    missing: List[str]
+
+
+class RankingSchema(Schema):
+    rank: int
+    insee: str = None
+    siren: str = None
+    name: str
+    slug: str = None
+    year: int
+    # Integers are kept as such, the other numbers are returned as floats
+    value: Union[StrictInt, float]
+
+
+class SnapshotSchema(Schema):
+    year: DataYearSchema
+    name: str
+    slug: str = None
+    insee: str = None
+    siren: str = None
+    departement_insee: str = None
+    region_insee: str = None
+    epci_siren: str = None
+    epci_type: str = None
+    population: int = None
+    data: dict
@@ -0,0 +1,222 @@
+"""
+A django-ninja router aware of the dataset version.
+"""
+import hashlib
+from functools import wraps
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from django.http.response import HttpResponseBase
+from django.urls import URLPattern
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from ninja import Router
+
+from francedata.models.meta import Metadata
+from francedata.services.dataset_version import get_dataset_version
+
+CACHE_KEY_PREFIX = "francedata:api"
+CACHE_DEFAULT_TTL = 24 * 3600
+CACHE_DEFAULT_MAX_SIZE = 1048576
+
+# Names of the endpoints using the response cache, for the statistics
+cached_endpoints = set()
+
+
+def get_request_dataset_version(request: HttpRequest) -> Optional[Metadata]:
+    """
+    Returns the dataset version, read only once per request
+    """
+    if not hasattr(request, "_francedata_dataset_version"):
+        request._francedata_dataset_version = get_dataset_version()
+    return request._francedata_dataset_version
+
+
+def api_cache_enabled() -> bool:
+    return getattr(settings, "FRANCEDATA_API_CACHE_ENABLED", False)
+
+
+def cache_stats_enabled() -> bool:
+    return getattr(settings, "FRANCEDATA_API_CACHE_STATS", False)
+
+
+def get_api_cache():
+    return caches[getattr(settings, "FRANCEDATA_API_CACHE", "default")]
+
+
+def cache_response(
+    ttl: int = CACHE_DEFAULT_TTL, max_size: int = CACHE_DEFAULT_MAX_SIZE
+) -> Callable:
+    """
+    Marks an endpoint as cacheable, to be placed under the router decorator.
+
+    ttl: the lifetime of the cached responses, in seconds
+    max_size: responses with a larger body (in bytes) are not cached
+    """
+
+    def decorator(view_func: Callable) -> Callable:
+        view_func.cache_options = {"ttl": ttl, "max_size": max_size}
+        cached_endpoints.add(view_func.__name__)
+        return view_func
+
+    return decorator
+
+
+def get_cache_key(request: HttpRequest, version: str) -> str:
+    """
+    The key combines the dataset version, the path and the normalized query parameters,
+    so all the keys change at once after each import.
+    """
+    params = sorted((key, sorted(values)) for key, values in request.GET.lists())
+    request_hash = hashlib.md5(f"{request.path}?{params}".encode("utf-8")).hexdigest()
+    return f"{CACHE_KEY_PREFIX}:{version}:{request_hash}"
+
+
+def count_cache_access(endpoint: str, result: str) -> None:
+    if not cache_stats_enabled():
+        return
+    cache = get_api_cache()
+    key = f"{CACHE_KEY_PREFIX}:stats:{endpoint}:{result}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted in the meantime
+        cache.set(key, 1, None)
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns the hit and miss counters of the response cache, per endpoint,
+    counted if the FRANCEDATA_API_CACHE_STATS setting is enabled
+    """
+    cache = get_api_cache()
+    stats = {}
+    for endpoint in sorted(cached_endpoints):
+        stats[endpoint] = {
+            result: cache.get(f"{CACHE_KEY_PREFIX}:stats:{endpoint}:{result}", 0)
+            for result in ["hits", "misses"]
+        }
+    return stats
+
+
+def reset_cache_stats() -> None:
+    get_api_cache().delete_many(
+        [
+            f"{CACHE_KEY_PREFIX}:stats:{endpoint}:{result}"
+            for endpoint in cached_endpoints
+            for result in ["hits", "misses"]
+        ]
+    )
+
+
+def cached_by_dataset_version(view: Callable, options_by_method: dict) -> Callable:
+    """
+    Serves the responses of the cacheable operations of a view from the Django cache,
+    if it is enabled with the FRANCEDATA_API_CACHE_ENABLED setting
+    """
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponseBase:
+        endpoint, options = options_by_method.get(request.method, (None, None))
+        if not options or not api_cache_enabled():
+            return view(request, *args, **kwargs)
+        version = get_request_dataset_version(request)
+        if version is None:
+            return view(request, *args, **kwargs)
+
+        cache = get_api_cache()
+        key = get_cache_key(request, version.value)
+        cached = cache.get(key)
+        if cached is not None:
+            count_cache_access(endpoint, "hits")
+            response = HttpResponse(cached["content"], content_type=cached["type"])
+            response["X-Cache"] = "HIT"
+            return response
+
+        count_cache_access(endpoint, "misses")
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and len(response.content) <= options["max_size"]
+        ):
+            cache.set(
+                key,
+                {"content": response.content, "type": response["Content-Type"]},
+                options["ttl"],
+            )
+        response["X-Cache"] = "MISS"
+        return response
+
+    return wrapper
+
+
+def conditional_on_dataset_version(view: Callable) -> Callable:
+    """
+    Handles conditional GET requests for a view, with ETag and Last-Modified headers
+    derived from the dataset version: as long as no import is run, the client can keep
+    its copy and the view is not called at all.
+    """
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponseBase:
+        if request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+
+        version = get_request_dataset_version(request)
+        if version is None:
+            return view(request, *args, **kwargs)
+
+        etag = quote_etag(version.value)
+        last_modified = int(version.updated_at.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            if not response.has_header("ETag"):
+                response["ETag"] = etag
+            if not response.has_header("Last-Modified"):
+                response["Last-Modified"] = http_date(last_modified)
+
+        return response
+
+    return wrapper
+
+
+class VersionedRouter(Router):
+    """
+    Router whose read-only endpoints answer conditional requests
+    according to the dataset version, and optionally cache their responses.
+    """
+
+    def urls_paths(self, prefix: str) -> Iterator[URLPattern]:
+        # The url patterns are generated in the same order as the path operations
+        path_views = self.path_operations.values()
+        for url_pattern, path_view in zip(super().urls_paths(prefix), path_views):
+            view = url_pattern.callback
+
+            options_by_method = {}
+            for operation in path_view.operations:
+                options = getattr(operation.view_func, "cache_options", None)
+                if options:
+                    for method in operation.methods:
+                        options_by_method[method] = (
+                            operation.view_func.__name__,
+                            options,
+                        )
+            if options_by_method:
+                view = cached_by_dataset_version(view, options_by_method)
+
+            yield URLPattern(
+                url_pattern.pattern,
+                conditional_on_dataset_version(view),
+                url_pattern.default_args,
+                url_pattern.name,
+            )
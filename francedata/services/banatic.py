@@ -5,20 +5,32 @@ from zipfile import ZipFile
 from io import BytesIO, StringIO
 import openpyxl_dictreader
 from datetime import datetime
-from typing import Pattern
+from typing import List, Pattern
 
-from francedata.models import Epci, Commune, DataYear, Metadata
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from francedata.models import (
+    Epci,
+    Commune,
+    CommuneEpciMembership,
+    DataYear,
+    Metadata,
+)
 
 from francedata.services.datagouv import get_datagouv_file
+from francedata.services.dataset_version import bump_dataset_version
+from francedata.services.utils import IMPORT_BATCH_SIZE, batched
 
 BANATIC_ID = "5e1f20058b4c414d3f94460d"
+BANATIC_SIREN_INSEE_URL = "https://www.banatic.interieur.gouv.fr/V5/ressources/documents/document_reference/TableCorrespondanceSirenInsee.zip"
 
 
-def import_commune_data_from_banatic(year: int = 0) -> None:
+def import_commune_data_from_banatic(year: int = 0) -> dict:
     # Imports the Siren <-> Insee table for Communes
     # Communes must have been imported beforehand from COG
 
-    zip_url = "https://www.banatic.interieur.gouv.fr/V5/ressources/documents/document_reference/TableCorrespondanceSirenInsee.zip"
+    zip_url = BANATIC_SIREN_INSEE_URL
     print(f"🗜️   Parsing archive {zip_url}")
 
     zip_name = requests.get(zip_url).content
@@ -34,31 +46,56 @@ def import_commune_data_from_banatic(year: int = 0) -> None:
 
         with zip_file.open(annual_files[year]) as xlsx_file:
             reader = openpyxl_dictreader.DictReader(xlsx_file, "insee_siren")
-            for row in reader:
-                print(f"Importing row data for {row['nom_com']} ({row['insee']})")
-                import_commune_row_from_banatic(row, year_entry)
+            for batch in batched(reader):
+                print(f"Importing row data for {len(batch)} communes")
+                import_commune_rows_from_banatic(batch, year_entry)
 
         Metadata.objects.get_or_create(prop="banatic_communes_year", value=year)
+        bump_dataset_version()
+
+    return {"year_entry": year_entry}
 
 
 def import_commune_row_from_banatic(row: dict, year_entry: DataYear) -> None:
-    name = row["nom_com"]
-    insee = row["insee"]
-    try:
-        commune = Commune.objects.get(years=year_entry, insee=insee)
+    import_commune_rows_from_banatic([row], year_entry)
+
+
+def import_commune_rows_from_banatic(rows: List[dict], year_entry: DataYear) -> None:
+    communes = {}
+    for commune in Commune.objects.filter(
+        years=year_entry, insee__in=[row["insee"] for row in rows]
+    ).select_related("departement"):
+        # An Insee id matching several communes is as invalid as a missing one
+        communes[commune.insee] = None if commune.insee in communes else commune
+
+    pop_col = f"ptot_{year_entry.year}"
+    now = timezone.now()
+    for row in rows:
+        name = row["nom_com"]
+        insee = row["insee"]
+        commune = communes.get(insee)
+        if commune is None:
+            raise ValueError(f"Commune {name} ({insee}) not found")
         if commune.name != name:
             print(
                 f"Commune name {name} ({insee}) doesn't match with database entry {commune}"
             )
         commune.siren = row["siren"]
-        pop_col = f"ptot_{year_entry.year}"
         commune.population = row[pop_col]
-        commune.save()
-    except:
-        raise ValueError(f"Commune {name} ({insee}) not found")
+        commune.updated_at = now
+        try:
+            commune.prepare(bulk=True)
+        except ValidationError as e:
+            raise ValueError(f"Commune {name} ({insee}) is not valid: {e}")
+
+    Commune.objects.bulk_update(
+        [commune for commune in communes.values() if commune],
+        ["siren", "population", "updated_at"],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
 
 
-def import_epci_data_from_banatic(year: int) -> None:
+def import_epci_data_from_banatic(year: int) -> dict:
     # Imports the EPCIs and EPCI <=> communes relations
     # Communes must have been imported beforehand from COG
 
@@ -87,7 +124,6 @@ def import_epci_data_from_banatic(year: int) -> None:
 
     if rows_count:
         print(f"Importing {rows_count} entries.")
-        epci_sirens = []
 
         column_keys = {
             "epci_name": "Nom du groupement",
@@ -95,60 +131,98 @@ def import_epci_data_from_banatic(year: int) -> None:
             "epci_siren": "N° SIREN",
             "member_siren": "Siren membre",
         }
-        
-        for row in list_reader:
-            siren = row["N° SIREN"]
-            if siren not in epci_sirens:
-                print(import_epci_row_from_banatic(row, year_entry, column_keys))
-                epci_sirens.append(siren)
+
+        for batch in batched(list_reader):
+            for message in import_epci_rows_from_banatic(
+                batch, year_entry, column_keys
+            ):
+                print(message)
 
         Metadata.objects.get_or_create(prop="banatic_epci_year", value=year)
+        bump_dataset_version()
     else:
         raise ValueError("The spreadsheet is empty")
 
+    return {"year_entry": year_entry}
+
 
 def import_epci_row_from_banatic(row, year_entry, column_keys) -> str:
-    epci_name_key = column_keys["epci_name"]
-    epci_name = row[epci_name_key]
+    return import_epci_rows_from_banatic([row], year_entry, column_keys)[0]
 
-    epci_type_key = column_keys["epci_type"]
-    epci_type = row[epci_type_key]
 
+def import_epci_rows_from_banatic(
+    rows: List[dict], year_entry: DataYear, column_keys: dict
+) -> List[str]:
+    """
+    Imports the EPCIs of the rows, and their membership data on the communes.
+    There is one row per member, with the EPCI columns repeated.
+    """
     epci_siren_key = column_keys["epci_siren"]
-    epci_siren = row[epci_siren_key]
-
     member_siren_key = column_keys["member_siren"]
-    member_siren = row[member_siren_key]
-    member_commune = Commune.objects.get(siren=member_siren, years=year_entry)
-
-    # Get or create the EPCI
-    epci_entry, return_code = Epci.objects.get_or_create(
-        siren=epci_siren,
-        defaults={
-            "name": epci_name,
-            "epci_type": epci_type,
-        },
-    )
-    epci_entry.save()
 
-    if not year_entry in epci_entry.years.all():
-        new_year = True
-    else:
-        new_year = False
-    epci_entry.years.add(year_entry)
-
-    if return_code:
-        return_message = f"EPCI {epci_entry} created."
-    elif new_year:
-        return_message = f"EPCI {epci_entry} already in database, updated year."
-    else:
-        return_message = f"EPCI {epci_entry} already in database, skipped."
+    epci_rows = {}
+    for row in rows:
+        epci_rows.setdefault(row[epci_siren_key], row)
+
+    # Get or create the EPCIs
+    epcis = {epci.siren: epci for epci in Epci.objects.filter(siren__in=epci_rows)}
+    created = []
+    for epci_siren, row in epci_rows.items():
+        if epci_siren not in epcis:
+            epci_entry = Epci(
+                siren=epci_siren,
+                name=row[column_keys["epci_name"]],
+                epci_type=row[column_keys["epci_type"]],
+            )
+            epci_entry.prepare(bulk=True)
+            created.append(epci_entry)
+            epcis[epci_siren] = epci_entry
+    Epci.objects.bulk_create(created, batch_size=IMPORT_BATCH_SIZE)
+
+    new_year_ids = Epci.add_year_to_entries(list(epcis.values()), year_entry)
+
+    messages = []
+    for epci_siren in epci_rows:
+        epci_entry = epcis[epci_siren]
+        if epci_entry in created:
+            messages.append(f"EPCI {epci_entry} created.")
+        elif epci_entry.id in new_year_ids:
+            messages.append(f"EPCI {epci_entry} already in database, updated year.")
+        else:
+            messages.append(f"EPCI {epci_entry} already in database, skipped.")
 
     # Adds the membership data on the communes entries
-    member_commune.epci = epci_entry
-    member_commune.save()
+    members = {
+        commune.siren: commune
+        for commune in Commune.objects.filter(
+            siren__in=[row[member_siren_key] for row in rows], years=year_entry
+        )
+    }
+    now = timezone.now()
+    memberships = {}
+    for row in rows:
+        member_commune = members.get(row[member_siren_key])
+        if member_commune is None:
+            messages.append(f"Member commune {row[member_siren_key]} not found.")
+            continue
+        member_commune.epci = epcis[row[epci_siren_key]]
+        member_commune.updated_at = now
+        memberships[member_commune.id] = CommuneEpciMembership(
+            commune=member_commune, epci=member_commune.epci, year=year_entry
+        )
+    Commune.objects.bulk_update(
+        members.values(), ["epci", "updated_at"], batch_size=IMPORT_BATCH_SIZE
+    )
+
+    # Replaces the memberships of the year of the communes, the previous years are kept
+    CommuneEpciMembership.objects.filter(
+        year=year_entry, commune_id__in=memberships
+    ).delete()
+    CommuneEpciMembership.objects.bulk_create(
+        memberships.values(), batch_size=IMPORT_BATCH_SIZE
+    )
 
-    return return_message
+    return messages
 
 
 def first_day_of_quarter(dt: datetime = None, format: str = "%Y-%m-%d") -> str:
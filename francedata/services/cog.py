@@ -1,7 +1,11 @@
 import re
+from typing import List
 
 from francedata.services.datagouv import get_datagouv_file
+from francedata.services.dataset_version import bump_dataset_version
 from francedata.services.utils import (
+    IMPORT_BATCH_SIZE,
+    batched,
     get_zip_from_url,
     parse_csv_from_distant_zip,
     parse_csv_from_url,
@@ -71,10 +75,12 @@ def import_regions_from_cog(year: int = 0) -> dict:
             column_names,
         )
 
-    for region in regions:
-        print(import_region_from_cog(region, year_entry, source_entry))
+    for batch in batched(regions):
+        for message in import_regions_from_cog_rows(batch, year_entry, source_entry):
+            print(message)
 
     Metadata.objects.get_or_create(prop="cog_regions_year", value=year)
+    bump_dataset_version()
 
     return {"year_entry": year_entry}
 
@@ -82,38 +88,98 @@ def import_regions_from_cog(year: int = 0) -> dict:
 def import_region_from_cog(
     region: dict, year_entry: DataYear, source_entry: DataSource
 ) -> str:
-    # Create or update region item
-    entry, return_code = Region.objects.get_or_create(
-        name=region["name"], insee=region["insee"]
-    )
-    entry.save()
-    if not year_entry in entry.years.all():
-        new_year = True
-    else:
-        new_year = False
-    entry.years.add(year_entry)
+    return import_regions_from_cog_rows([region], year_entry, source_entry)[0]
 
-    if return_code:
-        return_message = f"Région {entry} created."
-    elif new_year:
-        return_message = f"Région {entry} already in database, updated year."
-    else:
-        return_message = f"Région {entry} already in database, skipped."
 
-    # Import metadata
+def import_regions_from_cog_rows(
+    regions: List[dict], year_entry: DataYear, source_entry: DataSource
+) -> List[str]:
+    entries = [Region(name=region["name"], insee=region["insee"]) for region in regions]
+    entries, messages = get_or_create_collectivities(
+        Region, entries, ["name", "insee"], year_entry, "Région"
+    )
+
+    # Import metadata, in one query for the batch
     metadata_keys = ["seat_insee", "tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_entry_created = RegionData.objects.get_or_create(
-            region=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=region[md_key],
-            source=source_entry,
-        )
-        metadata_entry.save()
+    RegionData.objects.bulk_create(
+        [
+            RegionData(
+                region=entry,
+                year=year_entry,
+                datacode=md_key,
+                datatype="string",
+                value=region[md_key],
+                source=source_entry,
+            )
+            for entry, region in zip(entries, regions)
+            for md_key in metadata_keys
+        ],
+        ignore_conflicts=True,
+    )
 
-    return return_message
+    return messages
+
+
+def get_or_create_collectivities(
+    model, entries: list, lookup_fields: List[str], year_entry: DataYear, label: str
+) -> tuple:
+    """
+    Gets or creates the collectivities matching the unsaved entries on the lookup
+    fields, then adds them the year, with one query per step for the whole batch.
+
+    Returns the entries from the database, in the same order, and the import messages.
+    """
+
+    def get_key(entry) -> tuple:
+        return tuple(getattr(entry, field) for field in lookup_fields)
+
+    # The parent collectivities are used in the messages
+    existing = {}
+    for entry in model.objects.filter(
+        insee__in={entry.insee for entry in entries}
+    ).select_related():
+        existing.setdefault(get_key(entry), entry)
+
+    created = {}
+    for entry in entries:
+        key = get_key(entry)
+        if key not in existing and key not in created:
+            entry.prepare(bulk=True)
+            created[key] = entry
+    model.objects.bulk_create(created.values(), batch_size=IMPORT_BATCH_SIZE)
+
+    items = [
+        existing.get(get_key(entry)) or created[get_key(entry)] for entry in entries
+    ]
+    new_year_ids = model.add_year_to_entries(items, year_entry)
+
+    messages = []
+    for item in items:
+        if get_key(item) in created:
+            messages.append(f"{label} {item} created.")
+        elif item.id in new_year_ids:
+            messages.append(f"{label} {item} already in database, updated year.")
+        else:
+            messages.append(f"{label} {item} already in database, skipped.")
+
+    return items, messages
+
+
+def get_collectivities_by_insee(model, insees: set, year_entry: DataYear) -> dict:
+    """
+    Returns the collectivities of the year with the given Insee ids, by Insee id.
+    Raises DoesNotExist if one of them is missing.
+    """
+    items = {
+        item.insee: item
+        for item in model.objects.filter(years=year_entry, insee__in=insees)
+    }
+    missing = set(insees) - set(items)
+    if missing:
+        raise model.DoesNotExist(
+            f"{model._meta.verbose_name} {', '.join(sorted(missing))} not found"
+        )
+    return items
 
 
 def import_departements_from_cog(year):
@@ -167,10 +233,14 @@ def import_departements_from_cog(year):
         )
 
 
-    for dept in depts:
-        print(import_departement_from_cog(dept, year_entry, source_entry))
+    for batch in batched(depts):
+        for message in import_departements_from_cog_rows(
+            batch, year_entry, source_entry
+        ):
+            print(message)
 
     Metadata.objects.get_or_create(prop="cog_depts_year", value=year)
+    bump_dataset_version()
 
     return {"year_entry": year_entry}
 
@@ -178,40 +248,45 @@ def import_departements_from_cog(year):
 def import_departement_from_cog(
     dept: dict, year_entry: DataYear, source_entry: DataSource
 ) -> str:
-    region = Region.objects.get(years=year_entry, insee=dept["region"])
+    return import_departements_from_cog_rows([dept], year_entry, source_entry)[0]
 
-    entry, return_code = Departement.objects.get_or_create(
-        name=dept["name"], insee=dept["insee"], region=region
-    )
-    entry.save()
 
-    if not year_entry in entry.years.all():
-        new_year = True
-    else:
-        new_year = False
-    entry.years.add(year_entry)
+def import_departements_from_cog_rows(
+    depts: List[dict], year_entry: DataYear, source_entry: DataSource
+) -> List[str]:
+    regions = get_collectivities_by_insee(
+        Region, {dept["region"] for dept in depts}, year_entry
+    )
 
-    if return_code:
-        return_message = f"Département {entry} created."
-    elif new_year:
-        return_message = f"Département {entry} already in database, updated year."
-    else:
-        return_message = f"Département {entry} already in database, skipped."
+    entries = [
+        Departement(
+            name=dept["name"], insee=dept["insee"], region=regions[dept["region"]]
+        )
+        for dept in depts
+    ]
+    entries, messages = get_or_create_collectivities(
+        Departement, entries, ["name", "insee", "region_id"], year_entry, "Département"
+    )
 
-    # Import metadata
+    # Import metadata, in one query for the batch
     metadata_keys = ["seat_insee", "tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_entry_created = DepartementData.objects.get_or_create(
-            departement=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=dept[md_key],
-            source=source_entry,
-        )
-    metadata_entry.save()
+    DepartementData.objects.bulk_create(
+        [
+            DepartementData(
+                departement=entry,
+                year=year_entry,
+                datacode=md_key,
+                datatype="string",
+                value=dept[md_key],
+                source=source_entry,
+            )
+            for entry, dept in zip(entries, depts)
+            for md_key in metadata_keys
+        ],
+        ignore_conflicts=True,
+    )
 
-    return return_message
+    return messages
 
 
 def import_communes_from_cog(year):
@@ -274,47 +349,59 @@ def import_communes_from_cog(year):
             typecheck=typecheck,
         )
 
-    for commune in communes:
-        print(import_commune_from_cog(commune, year_entry, source_entry))
+    for batch in batched(communes):
+        for message in import_communes_from_cog_rows(batch, year_entry, source_entry):
+            print(message)
 
     md_entry, md_created = Metadata.objects.get_or_create(
         prop="cog_communes_year", value=year
     )
+    bump_dataset_version()
+
+    return {"year_entry": year_entry}
 
 
 def import_commune_from_cog(
     commune: dict, year_entry: DataYear, source_entry: DataSource
 ) -> str:
-    dept = Departement.objects.get(years=year_entry, insee=commune["dept"])
-    entry, return_code = Commune.objects.get_or_create(
-        name=commune["name"], insee=commune["insee"], departement=dept
-    )
-    entry.save()
+    return import_communes_from_cog_rows([commune], year_entry, source_entry)[0]
 
-    if not year_entry in entry.years.all():
-        new_year = True
-    else:
-        new_year = False
-    entry.years.add(year_entry)
 
-    if return_code:
-        return_message = f"Commune {entry} created."
-    elif new_year:
-        return_message = f"Commune {entry} already in database, updated year."
-    else:
-        return_message = f"Commune {entry} already in database, skipped."
+def import_communes_from_cog_rows(
+    communes: List[dict], year_entry: DataYear, source_entry: DataSource
+) -> List[str]:
+    depts = get_collectivities_by_insee(
+        Departement, {commune["dept"] for commune in communes}, year_entry
+    )
 
-    # Import metadata
-    metadata_keys = ["tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_created = CommuneData.objects.get_or_create(
-            commune=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=commune[md_key],
-            source=source_entry,
+    entries = [
+        Commune(
+            name=commune["name"],
+            insee=commune["insee"],
+            departement=depts[commune["dept"]],
         )
-        metadata_entry.save()
+        for commune in communes
+    ]
+    entries, messages = get_or_create_collectivities(
+        Commune, entries, ["name", "insee", "departement_id"], year_entry, "Commune"
+    )
+
+    # Import metadata, in one query for the batch
+    metadata_keys = ["tncc", "nccenr"]
+    CommuneData.objects.bulk_create(
+        [
+            CommuneData(
+                commune=entry,
+                year=year_entry,
+                datacode=md_key,
+                datatype="string",
+                value=commune[md_key],
+                source=source_entry,
+            )
+            for entry, commune in zip(entries, communes)
+            for md_key in metadata_keys
+        ],
+        ignore_conflicts=True,
+    )
 
-    return return_message
+    return messages
@@ -0,0 +1,34 @@
+"""
+The dataset version, changed each time imported data is written to the database.
+
+It is stored as a Metadata entry, and used to validate the cached API responses.
+"""
+from typing import Optional
+
+from django.utils import timezone
+
+from francedata.models.meta import Metadata
+
+DATASET_VERSION_PROP = "dataset_version"
+
+
+def get_dataset_version() -> Optional[Metadata]:
+    """
+    Returns the current dataset version entry, or None if no import was run yet
+    """
+    return (
+        Metadata.objects.filter(prop=DATASET_VERSION_PROP)
+        .order_by("-updated_at")
+        .first()
+    )
+
+
+def bump_dataset_version() -> Metadata:
+    """
+    Marks the data as changed. To be called at the end of each import.
+    """
+    entry, _created = Metadata.objects.update_or_create(
+        prop=DATASET_VERSION_PROP,
+        defaults={"value": timezone.now().strftime("%Y%m%d%H%M%S%f")},
+    )
+    return entry
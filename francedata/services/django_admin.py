@@ -64,18 +64,26 @@ def view_reverse_changelink(
     local_model_name: str,
     distant_model_name: str,
     key: int = "pk",
+    count: int = None,
+    filters: dict = None,
 ) -> str:
     """
     Generates a link to the list of related items of a many-to-many field,
     for use in the admin list and change views.
+
+    The items are counted with one query, unless their count is provided.
+    filters adds lookups to the link, e.g. the year of a provided count.
     """
 
     distant_model = apps.get_model(module_name, distant_model_name)
-    count = getattr(obj, f"{distant_model_name}_set").count()
+    if count is None:
+        count = getattr(obj, f"{distant_model_name}_set").count()
     url = (
         reverse(f"admin:{module_name}_{distant_model_name}_changelist")
         + "?"
-        + urlencode({f"{local_model_name}__id__exact": f"{getattr(obj, key)}"})
+        + urlencode(
+            {f"{local_model_name}__id__exact": f"{getattr(obj, key)}", **(filters or {})}
+        )
     )
     if count <= 1:
         label = f"{count} {getattr(distant_model._meta, 'verbose_name')}"
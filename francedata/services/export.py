@@ -0,0 +1,86 @@
+"""
+Streaming exports of the collectivity data, as CSV or NDJSON.
+"""
+import csv
+import json
+from typing import Iterable, Iterator, List
+
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+# Rows fetched per round trip on the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows serialized together in each chunk of the HTTP response
+EXPORT_LINES_PER_CHUNK = 500
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+class Echo:
+    """
+    A pseudo-buffer for the csv writer, returning the written line instead of storing it
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(rows: Iterable[tuple], columns: List[str]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows: Iterable[tuple], columns: List[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+
+
+def chunked(lines: Iterable[str], size: int = EXPORT_LINES_PER_CHUNK) -> Iterator[str]:
+    """
+    Groups the lines so that the response is not written one row at a time
+    """
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def streaming_export(
+    queryset: QuerySet, fields: dict, format: str, filename: str
+) -> StreamingHttpResponse:
+    """
+    Streams the queryset as a CSV or NDJSON file.
+
+    fields maps the exported column names to the queryset lookups. The rows are read
+    with a server-side cursor, so the memory used does not depend on the export size.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Export format {format} is not valid")
+
+    columns = list(fields)
+    rows = (
+        queryset.order_by("id")
+        .values_list(*fields.values())
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    if format == "csv":
+        lines = csv_lines(rows, columns)
+    else:
+        lines = ndjson_lines(rows, columns)
+
+    response = StreamingHttpResponse(
+        chunked(lines), content_type=EXPORT_FORMATS[format]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return response
@@ -0,0 +1,207 @@
+"""
+Opt-in declarative partitioning of the collectivity data tables by year.
+
+partition_data_table() turns a data table into a table partitioned by year_id,
+with one list partition per DataYear and a default partition. The indexes and
+constraints of the table are created again on the partitioned table: PostgreSQL
+requires the partition key in the unique constraints, so the primary key becomes
+(id, year_id), while the (collectivity, year, datacode) constraints already
+include it. The partitions of each new DataYear are created when it is saved.
+"""
+from typing import List
+
+from django.db import connection, transaction
+
+from francedata.models import (
+    CommuneData,
+    DataYear,
+    DepartementData,
+    EpciData,
+    RegionData,
+)
+
+PARTITIONED_MODELS = {
+    "region": RegionData,
+    "departement": DepartementData,
+    "epci": EpciData,
+    "commune": CommuneData,
+}
+
+
+def quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+# Default partitions and unique constraints on partitioned tables need PostgreSQL 11
+MIN_PG_VERSION = 110000
+
+
+def partitioning_supported() -> bool:
+    return connection.vendor == "postgresql" and connection.pg_version >= MIN_PG_VERSION
+
+
+def get_partitioned_models() -> List:
+    """
+    Returns the data models whose table is already partitioned
+    """
+    if not partitioning_supported():
+        return []
+    tables = {model._meta.db_table: model for model in PARTITIONED_MODELS.values()}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = ANY(%s) AND pg_table_is_visible(c.oid)
+            """,
+            [list(tables)],
+        )
+        return [tables[row[0]] for row in cursor.fetchall()]
+
+
+def partition_name(model, year_entry: DataYear) -> str:
+    return f"{model._meta.db_table}_{year_entry.year}"
+
+
+def default_partition_name(model) -> str:
+    return f"{model._meta.db_table}_default"
+
+
+def create_partition(model, year_entry: DataYear) -> None:
+    """
+    Creates the partition of the year in a partitioned data table.
+
+    The rows of the year already stored in the default partition, which
+    would prevent its creation, are moved to it.
+    """
+    table = quote(model._meta.db_table)
+    partition = quote(partition_name(model, year_entry))
+    default = quote(default_partition_name(model))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT to_regclass(%s) IS NOT NULL", [partition_name(model, year_entry)]
+        )
+        if cursor.fetchone()[0]:
+            return
+
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE fd_partition_rows ON COMMIT DROP AS
+            SELECT * FROM {default} WHERE year_id = %s
+            """,
+            [year_entry.id],
+        )
+        cursor.execute(f"DELETE FROM {default} WHERE year_id = %s", [year_entry.id])
+        cursor.execute(
+            f"CREATE TABLE {partition} PARTITION OF {table} FOR VALUES IN (%s)",
+            [year_entry.id],
+        )
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM fd_partition_rows")
+        cursor.execute("DROP TABLE fd_partition_rows")
+
+
+def create_year_partitions(year_entry: DataYear) -> None:
+    """
+    Creates the partitions of a new year in the partitioned data tables
+    """
+    for model in get_partitioned_models():
+        create_partition(model, year_entry)
+
+
+def partition_data_table(model) -> bool:
+    """
+    Converts a data table into a table partitioned by year, in one transaction.
+    Returns False if it was already partitioned.
+
+    The rows are copied to the new table, so the tables are locked in the meantime.
+    """
+    if model in get_partitioned_models():
+        return False
+
+    table = model._meta.db_table
+    new_table = f"{table}_partitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # The deferred foreign key checks of the rows written in the same
+        # transaction would prevent the table from being dropped
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        # The constraints and indexes to create again, once the table is replaced
+        cursor.execute(
+            """
+            SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass ORDER BY contype DESC, conname
+            """,
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+            WHERE i.indrelid = %s::regclass AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid
+            )
+            """,
+            [table],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"""
+            CREATE TABLE {quote(new_table)} (LIKE {quote(table)} INCLUDING DEFAULTS)
+            PARTITION BY LIST (year_id)
+            """
+        )
+        cursor.execute(
+            f"CREATE TABLE {quote(default_partition_name(model))} "
+            f"PARTITION OF {quote(new_table)} DEFAULT"
+        )
+        for year_entry in DataYear.objects.order_by("year"):
+            cursor.execute(
+                f"""
+                CREATE TABLE {quote(partition_name(model, year_entry))}
+                PARTITION OF {quote(new_table)} FOR VALUES IN (%s)
+                """,
+                [year_entry.id],
+            )
+        cursor.execute(f"INSERT INTO {quote(new_table)} SELECT * FROM {quote(table)}")
+
+        # The id sequence would be dropped with the table owning it
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {quote(new_table)}.id")
+        cursor.execute(f"DROP TABLE {quote(table)}")
+        cursor.execute(f"ALTER TABLE {quote(new_table)} RENAME TO {quote(table)}")
+
+        for name, constraint_type, definition in constraints:
+            if constraint_type == "p":
+                definition = "PRIMARY KEY (id, year_id)"
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+        for definition in indexes:
+            cursor.execute(definition)
+    return True
+
+
+def detach_partition(model, year_entry: DataYear) -> bool:
+    """
+    Detaches the partition of the year from a partitioned data table: its rows
+    are kept in a standalone table, to be archived or dropped.
+    Returns False if the table has no partition for that year.
+    """
+    partition = partition_name(model, year_entry)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = %s::regclass AND inhrelid = to_regclass(%s)
+            """,
+            [model._meta.db_table, partition],
+        )
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute(
+            f"ALTER TABLE {quote(model._meta.db_table)} "
+            f"DETACH PARTITION {quote(partition)}"
+        )
+    return True
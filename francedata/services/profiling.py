@@ -0,0 +1,191 @@
+"""
+Profiling of the import commands, enabled with their --profile option.
+
+The command runs under pyinstrument, a sampling profiler, when it is installed,
+or under cProfile otherwise. The profile is written as a .pstats file (readable
+with pstats or snakeviz) and summarized in a .txt file, with the top functions
+by cumulative time and the top SQL statements by count and cumulative time.
+"""
+import cProfile
+import io
+import pstats
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+from django.db import connection
+from django.utils import timezone
+
+PROFILE_TOP_DEFAULT = 30
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+def add_profiling_arguments(parser) -> None:
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profiles the command, and writes the profile and its summary",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help="Path of the profiling files, without extension. \
+            By default: profile-<command>-<date>",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=PROFILE_TOP_DEFAULT,
+        help="Number of functions and SQL statements in the summary",
+    )
+    parser.add_argument(
+        "--profiler",
+        type=str,
+        choices=PROFILERS,
+        help="By default, pyinstrument if it is installed, cProfile otherwise",
+    )
+
+
+class SqlRecorder:
+    """
+    A database execute wrapper aggregating the SQL statements, with their count
+    and cumulative time. The parameters are passed apart from the statements,
+    so the same query with other values is counted as the same statement.
+    """
+
+    def __init__(self) -> None:
+        self.statements: Dict[str, dict] = defaultdict(
+            lambda: {"count": 0, "time": 0.0}
+        )
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # The savepoint names are unique
+            statement = re.sub(r'"s\d+_x\d+"', '"<savepoint>"', sql)
+            self.statements[statement]["count"] += 1
+            self.statements[statement]["time"] += time.perf_counter() - start
+
+    def summary(self, top: int = PROFILE_TOP_DEFAULT) -> str:
+        total_count = sum(stats["count"] for stats in self.statements.values())
+        total_time = sum(stats["time"] for stats in self.statements.values())
+        lines = [f"{total_count} SQL queries, {total_time:.3f} s"]
+
+        for sort_key in ["count", "time"]:
+            lines += ["", f"Top {top} SQL statements by {sort_key}:"]
+            ranking = sorted(
+                self.statements.items(),
+                key=lambda item: item[1][sort_key],
+                reverse=True,
+            )
+            for statement, stats in ranking[:top]:
+                lines.append(
+                    f"{stats['count']:>9} {stats['time']:>10.3f} s   {statement[:200]}"
+                )
+        return "\n".join(lines)
+
+
+class CProfileProfiler:
+    name = "cProfile"
+
+    def __init__(self) -> None:
+        self.profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        self.profiler.disable()
+
+    def dump_stats(self, path: str) -> None:
+        self.profiler.dump_stats(path)
+
+
+class PyinstrumentProfiler:
+    name = "pyinstrument"
+
+    def __init__(self) -> None:
+        from pyinstrument import Profiler
+
+        self.profiler = Profiler()
+
+    def start(self) -> None:
+        self.profiler.start()
+
+    def stop(self) -> None:
+        self.profiler.stop()
+
+    def dump_stats(self, path: str) -> None:
+        from pyinstrument.renderers import PstatsRenderer
+
+        stats = self.profiler.output(renderer=PstatsRenderer())
+        with open(path, "wb") as stats_file:
+            stats_file.write(stats.encode("utf-8", errors="surrogateescape"))
+
+
+def get_profiler(name: str = None):
+    if name == "cprofile":
+        return CProfileProfiler()
+    try:
+        return PyinstrumentProfiler()
+    except ImportError:
+        if name == "pyinstrument":
+            raise
+        return CProfileProfiler()
+
+
+def get_functions_summary(stats_path: str, top: int = PROFILE_TOP_DEFAULT) -> str:
+    stream = io.StringIO()
+    try:
+        stats = pstats.Stats(stats_path, stream=stream)
+    except TypeError:
+        # The sampling profiler records nothing for very short runs
+        return "No function call recorded"
+    stats.sort_stats("cumulative").print_stats(top)
+    return stream.getvalue()
+
+
+@contextmanager
+def profiling(options: dict, command: str):
+    """
+    Profiles the block if the --profile option of the command is set
+    """
+    if not options.get("profile"):
+        yield
+        return
+
+    output = options.get("profile_output")
+    if not output:
+        output = f"profile-{command}-{timezone.now():%Y%m%d-%H%M%S}"
+    top = options.get("profile_top") or PROFILE_TOP_DEFAULT
+
+    profiler = get_profiler(options.get("profiler"))
+    recorder = SqlRecorder()
+    start = time.perf_counter()
+    with connection.execute_wrapper(recorder):
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - start
+
+            stats_path = f"{output}.pstats"
+            profiler.dump_stats(stats_path)
+            summary = "\n\n".join(
+                [
+                    f"Profile of {command} with {profiler.name}: {duration:.3f} s",
+                    get_functions_summary(stats_path, top),
+                    recorder.summary(top),
+                ]
+            )
+            summary_path = f"{output}.txt"
+            with open(summary_path, "w") as summary_file:
+                summary_file.write(summary + "\n")
+
+            print(summary)
+            print(f"📊   Profile written to {stats_path} and {summary_path}")
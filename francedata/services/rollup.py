@@ -0,0 +1,226 @@
+"""
+Roll-up of the numeric commune data to the EPCIs, départements and régions.
+
+The values are aggregated in SQL, with one GROUP BY statement per level and
+aggregate function for all the datacodes of a year, following the EPCI memberships
+of the year (or Commune.epci for the years without memberships),
+Commune.departement and Departement.region links. The results are written
+as EpciData, DepartementData and RegionData entries of a derived DataSource.
+
+The population of the communes, stored on Commune.population, is rolled up
+as the "population" datacode. As it only holds the latest population, it is only
+rolled up for the latest year of the communes.
+"""
+
+from typing import Dict, Optional
+
+from django.db import transaction
+from django.db.models import Avg, Max, Min, Sum
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    CommuneEpciMembership,
+    DataSource,
+    DataYear,
+    DepartementData,
+    EpciData,
+    RegionData,
+    parse_decimal,
+    typed_values,
+)
+from francedata.services.utils import IMPORT_BATCH_SIZE
+
+ROLLUP_SOURCE_TITLE = "Agrégation des données communales"
+ROLLUP_POPULATION = "population"
+
+# Aggregate functions, with the label of the rolled up values
+ROLLUP_AGGREGATES = {
+    "sum": (Sum, "somme des communes"),
+    "avg": (Avg, "moyenne des communes"),
+    "min": (Min, "minimum des communes"),
+    "max": (Max, "maximum des communes"),
+}
+
+# Data model of each level, with the path to its collectivity from a commune
+# (the EPCI of the year is joined from the memberships)
+ROLLUP_LEVELS = [
+    (EpciData, None),
+    (DepartementData, "departement_id"),
+    (RegionData, "departement__region_id"),
+]
+
+
+def get_rollup_source(year_entry: DataYear) -> DataSource:
+    source, _created = DataSource.objects.get_or_create(
+        title=ROLLUP_SOURCE_TITLE, url=None, year=year_entry
+    )
+    return source
+
+
+def format_value(result, aggregate: str) -> Optional[tuple]:
+    """
+    Returns the value and datatype of a rolled up entry: sums, minimums
+    and maximums of whole numbers are stored as integers.
+    Returns None if the result does not fit the numeric columns.
+    """
+    value = parse_decimal(str(result))
+    if value is None:
+        return None
+    if aggregate != "avg" and value == value.to_integral_value():
+        return str(int(value)), "int"
+    return format(value.normalize(), "f"), "decimal"
+
+
+def aggregate_level(
+    year_entry: DataYear,
+    parent: Optional[str],
+    aggregates: Dict[str, str],
+    memberships: bool = False,
+) -> Dict[tuple, tuple]:
+    """
+    Returns the aggregated values of one level, by (collectivity id, datacode),
+    as (value, aggregate) tuples.
+
+    parent is None for the EPCIs, and memberships tells whether the year
+    has EPCI memberships.
+    """
+    communes = Commune.objects.filter(years=year_entry)
+    data = CommuneData.objects.filter(year=year_entry, value_numeric__isnull=False)
+    if parent is None:
+        communes, commune_parent = CommuneEpciMembership.annotate_epci(
+            communes, year_entry, memberships=memberships
+        )
+        data, data_parent = CommuneEpciMembership.annotate_epci(
+            data, year_entry, "commune__", memberships
+        )
+    else:
+        commune_parent, data_parent = parent, f"commune__{parent}"
+
+    results = {}
+    for aggregate in set(aggregates.values()):
+        function = ROLLUP_AGGREGATES[aggregate][0]
+        datacodes = [code for code, name in aggregates.items() if name == aggregate]
+
+        rows = []
+        if ROLLUP_POPULATION in datacodes:
+            rows += [
+                (row[commune_parent], ROLLUP_POPULATION, row["result"])
+                for row in communes.values(commune_parent)
+                .annotate(result=function("population"))
+                .order_by()
+            ]
+        if set(datacodes) - {ROLLUP_POPULATION}:
+            rows += [
+                (row[data_parent], row["datacode"], row["result"])
+                for row in data.filter(datacode__in=datacodes)
+                .values(data_parent, "datacode")
+                .annotate(result=function("value_numeric"))
+                .order_by()
+            ]
+
+        for collectivity_id, datacode, result in rows:
+            # The communes without EPCI or région are left out
+            if collectivity_id is not None and result is not None:
+                results[(collectivity_id, datacode)] = (result, aggregate)
+    return results
+
+
+def population_is_current(year_entry: DataYear) -> bool:
+    """
+    Whether Commune.population holds the population of the year: the latest year
+    of the communes
+    """
+    return not DataYear.objects.filter(
+        commune__isnull=False, year__gt=year_entry.year
+    ).exists()
+
+
+def rollup_commune_data(
+    year_entry: DataYear, aggregates: Dict[str, str]
+) -> Dict[str, int]:
+    """
+    Aggregates the commune data of the year to the upper levels.
+
+    aggregates maps each datacode to the name of its aggregate function
+    (sum, avg, min or max). The previous roll-up of these datacodes is replaced,
+    while the data imported from other sources for the same collectivities,
+    year and datacode is kept. Returns the number of entries written per level.
+    """
+    for aggregate in aggregates.values():
+        if aggregate not in ROLLUP_AGGREGATES:
+            raise ValueError(f"Roll-up aggregate {aggregate} is not valid")
+    if ROLLUP_POPULATION in aggregates and not population_is_current(year_entry):
+        # The population of the previous years is kept
+        aggregates = {
+            code: name for code, name in aggregates.items() if code != ROLLUP_POPULATION
+        }
+    if not aggregates:
+        return {}
+
+    source = get_rollup_source(year_entry)
+    memberships = CommuneEpciMembership.objects.filter(year=year_entry).exists()
+    counts = {}
+    with transaction.atomic():
+        for model, parent in ROLLUP_LEVELS:
+            results = aggregate_level(year_entry, parent, aggregates, memberships)
+            model.objects.filter(
+                source=source, year=year_entry, datacode__in=aggregates
+            ).delete()
+
+            entries = []
+            for (collectivity_id, datacode), (result, aggregate) in results.items():
+                formatted = format_value(result, aggregate)
+                if formatted is None:
+                    continue
+                value, datatype = formatted
+                entries.append(
+                    model(
+                        **{f"{model.collectivity_field}_id": collectivity_id},
+                        year=year_entry,
+                        datacode=datacode,
+                        value=value,
+                        label=ROLLUP_AGGREGATES[aggregate][1],
+                        datatype=datatype,
+                        **typed_values(datatype, value),
+                        source=source,
+                    )
+                )
+            model.objects.bulk_create(
+                entries, batch_size=IMPORT_BATCH_SIZE, ignore_conflicts=True
+            )
+            counts[model.collectivity_field] = len(entries)
+    return counts
+
+
+def get_rolled_up_datacodes(year_entry: DataYear) -> Dict[str, str]:
+    """
+    Returns the datacodes already rolled up for the year, with their aggregate
+    function, read from the label of the département entries
+    """
+    aggregates_by_label = {
+        label: name for name, (_function, label) in ROLLUP_AGGREGATES.items()
+    }
+    rows = (
+        DepartementData.objects.filter(
+            year=year_entry, source__title=ROLLUP_SOURCE_TITLE
+        )
+        .values_list("datacode", "label")
+        .distinct()
+    )
+    return {
+        datacode: aggregates_by_label[label]
+        for datacode, label in rows
+        if label in aggregates_by_label
+    }
+
+
+def refresh_rollups(year_entry: Optional[DataYear]) -> Dict[str, int]:
+    """
+    Computes again the population and the datacodes already rolled up for the year,
+    after the communes or their links to the upper levels changed
+    """
+    if year_entry is None:
+        return {}
+    aggregates = {ROLLUP_POPULATION: "sum", **get_rolled_up_datacodes(year_entry)}
+    return rollup_commune_data(year_entry, aggregates)
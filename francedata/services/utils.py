@@ -1,15 +1,35 @@
-from typing import Callable, Union
-import requests
-import pandas
+import hashlib
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Union
 from zipfile import ZipFile
 from io import BytesIO, TextIOWrapper, StringIO
 from importlib import resources
 
 from django.db.models.fields.files import FieldFile
 
+from francedata.services.dataset_version import bump_dataset_version
+
 # Caution, we import two different types of DictReader here
 from csv import DictReader
 
+# requests and pandas are only imported by the functions using them, as this module
+# is loaded with the models and they are not needed outside of the imports
+
+# Number of rows written together by the importers
+IMPORT_BATCH_SIZE = 1000
+
+
+def batched(rows: Iterable, size: int = IMPORT_BATCH_SIZE) -> Iterator[List]:
+    """
+    Splits the rows in lists of at most size rows
+    """
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 def parse_csv_from_distant_zip(
     zip_url: str,
@@ -29,6 +49,8 @@ def parse_csv_from_url(
     column_names: dict,
     typecheck: dict = False,
     ):
+    import requests
+
     response = requests.get(file_url)
     response.encoding = response.apparent_encoding
     stream = StringIO(response.text)
@@ -59,31 +81,44 @@ def parse_csv_from_stream(
 
 def add_sirens_and_categories(input_file, model_name, year_entry):
     with resources.open_text("francedata.resources", input_file) as input_csv:
-        reader = DictReader(input_csv)
-        for row in reader:
-            insee = row["Insee"]
-            siren = row["Siren"]
-            category = row["CATEG"]
-
-            if category != "ML":
-                # The Métropole de Lyon is managed only at the EPCI level
-                try:
-                    collectivity_entry = model_name.objects.get(
-                        insee=insee, years=year_entry
-                    )
-                    collectivity_entry.siren = siren
-                    collectivity_entry.category = category
-                    collectivity_entry.save()
-                except:
-                    print(f"{model_name} {insee} not found")
+        # The Métropole de Lyon is managed only at the EPCI level
+        rows = [row for row in DictReader(input_csv) if row["CATEG"] != "ML"]
+
+    entries = {
+        entry.insee: entry
+        for entry in model_name.objects.filter(
+            insee__in=[row["Insee"] for row in rows], years=year_entry
+        )
+    }
+    updated_entries = []
+    for row in rows:
+        insee = row["Insee"]
+        collectivity_entry = entries.get(insee)
+        if collectivity_entry is None:
+            print(f"{model_name} {insee} not found")
+            continue
+        collectivity_entry.siren = row["Siren"]
+        collectivity_entry.category = row["CATEG"]
+        collectivity_entry.prepare(bulk=True)
+        updated_entries.append(collectivity_entry)
+
+    model_name.objects.bulk_update(
+        updated_entries, ["siren", "category"], batch_size=IMPORT_BATCH_SIZE
+    )
+
+    bump_dataset_version()
 
 
 def file_exists_at_url(url: str) -> bool:
+    import requests
+
     r = requests.head(url)
     return r.status_code == requests.codes.ok
 
 
 def get_zip_from_url(zip_url: str) -> ZipFile:
+    import requests
+
     zip_name = requests.get(zip_url).content
     zip_file = ZipFile(BytesIO(zip_name))
     return zip_file
@@ -121,12 +156,26 @@ def fieldfile_to_dictreader(
         raise ValueError("File format is not valid")
 
 
+def get_fieldfile_hash(data_file: FieldFile) -> str:
+    """
+    Returns the SHA-256 of the file content, read by chunks
+    """
+    sha256 = hashlib.sha256()
+    data_file.open("rb")
+    for chunk in data_file.chunks():
+        sha256.update(chunk)
+    data_file.seek(0)
+    return sha256.hexdigest()
+
+
 def excel_fieldfile_to_dictreader(
     data_file: FieldFile, sheet: Union[str, int] = 0
 ) -> DictReader:
     """
     Takes an excel file and return a DictReader object
     """
+    import pandas
+
     dataframe = pandas.read_excel(data_file.read(), sheet, dtype="object")
     csv_string = dataframe.to_csv(index=False)
     return DictReader(csv_string.splitlines())
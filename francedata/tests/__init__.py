@@ -1,6 +1,16 @@
+from .tests_analytics import *
+from .tests_api import *
+from .tests_files_import import *
+from .tests_generator import *
+from .tests_import_jobs import *
 from .tests_models import *
+from .tests_query_budgets import *
+from .tests_startup import *
 
 from .services.tests_banatic import *
 from .services.tests_cog import *
+from .services.tests_partitions import *
+from .services.tests_profiling import *
+from .services.tests_rollup import *
 from .services.tests_utils import *
 from .services.tests_validators import *
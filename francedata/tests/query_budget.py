@@ -0,0 +1,52 @@
+"""
+Query budgets: upper bounds on the number of SQL queries run by an operation.
+
+The queries are counted on generated fixtures at two sizes, so that a test
+fails as soon as the count depends on the number of rows (N+1 queries).
+"""
+from typing import Callable, List
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+# Scales of the generated fixtures, relative to the size of France:
+# about 175 and 525 communes, in one and two départements
+FIXTURE_SCALES = (0.005, 0.015)
+
+
+class QueryBudgetTestCase(TestCase):
+    fixture_scales = FIXTURE_SCALES
+
+    def count_queries(self, populate: Callable, operation: Callable) -> List[int]:
+        """
+        For each fixture scale, populates the database with populate(scale), then
+        counts the queries run by operation(fixture), where fixture is the value
+        returned by populate. The fixtures are rolled back after each count.
+        """
+        counts = []
+        for scale in self.fixture_scales:
+            with transaction.atomic():
+                fixture = populate(scale)
+                with CaptureQueriesContext(connection) as queries:
+                    operation(fixture)
+                counts.append(len(queries))
+                transaction.set_rollback(True)
+        return counts
+
+    def assertQueryBudget(
+        self, budget: int, populate: Callable, operation: Callable
+    ) -> None:
+        """
+        Fails if the operation runs more than budget queries,
+        or if its number of queries grows with the size of the fixtures
+        """
+        counts = self.count_queries(populate, operation)
+        self.assertLessEqual(
+            max(counts), budget, f"Query budget of {budget} exceeded: {counts}"
+        )
+        self.assertEqual(
+            min(counts),
+            max(counts),
+            f"The number of queries depends on the size of the fixtures: {counts}",
+        )
@@ -1,4 +1,10 @@
-from francedata.models import Commune, DataYear, Departement, Epci
+from francedata.models import (
+    Commune,
+    CommuneEpciMembership,
+    DataYear,
+    Departement,
+    Epci,
+)
 from django.test import TestCase
 from unittest import mock
 import re
@@ -8,6 +14,7 @@ from francedata.services.banatic import (
     first_day_of_quarter,
     import_commune_row_from_banatic,
     import_epci_row_from_banatic,
+    import_epci_rows_from_banatic,
     match_filenames_in_zip,
 )
 
@@ -141,3 +148,95 @@ class ImportCommuneRowFromBanaticTestCase(TestCase):
         test_commune = Commune.objects.get(insee="47237", years=year_entry)
         test_epci = Epci.objects.get(siren="200023307", years=year_entry)
         self.assertEqual(test_commune.epci, test_epci)
+
+
+class ImportEpciRowsFromBanaticTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year_entry = DataYear.objects.create(year=2021)
+        dept = Departement.objects.create(name="Ain", insee="01")
+        for name, insee, siren in [
+            ("L'Abergement-Clémenciat", "01001", "210100012"),
+            ("L'Abergement-de-Varey", "01002", "210100020"),
+        ]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, siren=siren, departement=dept
+            )
+            commune.years.add(self.year_entry)
+
+        self.column_keys = {
+            "epci_name": "Nom du groupement",
+            "epci_type": "Nature juridique",
+            "epci_siren": "N° SIREN",
+            "member_siren": "Siren membre",
+        }
+        self.rows = [
+            {
+                "Nom du groupement": "CC de la Dombes",
+                "Nature juridique": "CC",
+                "N° SIREN": "200042935",
+                "Siren membre": member_siren,
+            }
+            for member_siren in ["210100012", "210100020", "210100038"]
+        ]
+
+    def test_all_members_are_added_to_the_epci(self) -> None:
+        messages = import_epci_rows_from_banatic(
+            self.rows, self.year_entry, self.column_keys
+        )
+
+        epci = Epci.objects.get(siren="200042935", years=self.year_entry)
+        self.assertEqual(
+            sorted(epci.commune_set.values_list("insee", flat=True)),
+            ["01001", "01002"],
+        )
+        self.assertEqual(
+            messages,
+            [
+                "EPCI CC de la Dombes created.",
+                "Member commune 210100038 not found.",
+            ],
+        )
+
+    def test_existing_epci_is_not_created_again(self) -> None:
+        import_epci_rows_from_banatic(self.rows, self.year_entry, self.column_keys)
+        messages = import_epci_rows_from_banatic(
+            self.rows, self.year_entry, self.column_keys
+        )
+
+        self.assertEqual(Epci.objects.count(), 1)
+        self.assertEqual(
+            messages[0], "EPCI CC de la Dombes already in database, skipped."
+        )
+
+    def test_memberships_of_previous_years_are_kept(self) -> None:
+        import_epci_rows_from_banatic(self.rows, self.year_entry, self.column_keys)
+
+        year_entry = DataYear.objects.create(year=2022)
+        for commune in Commune.objects.all():
+            commune.years.add(year_entry)
+        rows = [
+            dict(row, **{"Nom du groupement": "CA du Bassin de Bourg-en-Bresse"})
+            for row in self.rows
+        ]
+        for row in rows:
+            row["N° SIREN"] = "200071751"
+        import_epci_rows_from_banatic(rows, year_entry, self.column_keys)
+        # Importing the same year again replaces its memberships
+        import_epci_rows_from_banatic(rows, year_entry, self.column_keys)
+
+        self.assertEqual(
+            sorted(
+                CommuneEpciMembership.objects.values_list(
+                    "commune__insee", "epci__siren", "year__year"
+                )
+            ),
+            [
+                ("01001", "200042935", 2021),
+                ("01001", "200071751", 2022),
+                ("01002", "200042935", 2021),
+                ("01002", "200071751", 2022),
+            ],
+        )
+        commune = Commune.objects.get(insee="01001")
+        self.assertEqual(commune.epci.siren, "200071751")
+        self.assertEqual(commune.get_epci(self.year_entry).siren, "200042935")
@@ -0,0 +1,148 @@
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+)
+from francedata.services.partitions import (
+    create_partition,
+    detach_partition,
+    get_partitioned_models,
+    partition_data_table,
+    partitioning_supported,
+)
+
+
+class YearWithoutPartitionsTestCase(TestCase):
+    def test_year_is_created_without_partitioned_tables(self) -> None:
+        # The year, then the lookup of the partitioned tables
+        with self.assertNumQueries(2):
+            DataYear.objects.create(year=2020)
+        self.assertEqual(get_partitioned_models(), [])
+
+    def test_year_is_created_on_other_backends(self) -> None:
+        # Without looking for partitioned tables
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            self.assertFalse(partitioning_supported())
+            self.assertEqual(get_partitioned_models(), [])
+            with self.assertNumQueries(1):
+                DataYear.objects.create(year=2020)
+
+    def test_command_requires_postgresql_11(self) -> None:
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            with self.assertRaises(CommandError):
+                call_command("partition_data")
+
+
+class PartitionTestCase(TestCase):
+    def setUp(self) -> None:
+        if not partitioning_supported():
+            self.skipTest("Partitioning requires PostgreSQL 11 or later")
+        self.year = DataYear.objects.create(year=2020)
+        self.source = DataSource.objects.create(title="Test source", year=self.year)
+        dept = Departement.objects.create(name="Ain", insee="01")
+        self.commune = Commune.objects.create(
+            name="L'Abergement-Clémenciat", insee="01001", departement=dept
+        )
+        self.create_data(self.year, "771")
+
+    def create_data(self, year: DataYear, value: str) -> CommuneData:
+        return CommuneData.objects.create(
+            commune=self.commune,
+            year=year,
+            datacode="pop_muni",
+            value=value,
+            datatype="int",
+            source=self.source,
+        )
+
+    def get_partitions(self) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'francedata_communedata'::regclass
+                ORDER BY c.relname
+                """)
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_table_is_partitioned_by_year(self) -> None:
+        self.assertTrue(partition_data_table(CommuneData))
+        self.assertFalse(partition_data_table(CommuneData))
+        self.assertEqual(get_partitioned_models(), [CommuneData])
+        self.assertEqual(
+            self.get_partitions(),
+            ["francedata_communedata_2020", "francedata_communedata_default"],
+        )
+
+        # The existing rows were copied, and the indexes created again
+        self.assertEqual(CommuneData.objects.get(year=self.year).value_int, 771)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+                ["francedata_communedata"],
+            )
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.assertTrue(
+            {"fd_communedata_latest_idx", "fd_unique_commune_data"} <= indexes
+        )
+
+    def test_rows_stored_in_the_default_partition_are_moved(self) -> None:
+        partition_data_table(CommuneData)
+        # Created without save(), so without its partition
+        year = DataYear.objects.bulk_create([DataYear(year=2021)])[0]
+        self.create_data(year, "779")
+
+        create_partition(CommuneData, year)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value FROM francedata_communedata_2021")
+            self.assertEqual(cursor.fetchall(), [("779",)])
+            cursor.execute("SELECT count(*) FROM francedata_communedata_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_new_years_get_their_partition(self) -> None:
+        partition_data_table(CommuneData)
+        year = DataYear.objects.create(year=2021)
+        entry = self.create_data(year, "779")
+
+        self.assertIn("francedata_communedata_2021", self.get_partitions())
+        self.assertGreater(entry.id, CommuneData.objects.get(year=self.year).id)
+        self.assertEqual(CommuneData.objects.filter(year=year).count(), 1)
+
+    def test_unique_constraint_is_kept(self) -> None:
+        partition_data_table(CommuneData)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_data(self.year, "772")
+
+        # The imports ignore the conflicting rows
+        CommuneData.objects.bulk_create(
+            [
+                CommuneData(
+                    commune=self.commune,
+                    year=self.year,
+                    datacode="pop_muni",
+                    value="772",
+                    source=self.source,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        self.assertEqual(CommuneData.objects.get(year=self.year).value, "771")
+
+    def test_partition_is_detached(self) -> None:
+        self.assertFalse(detach_partition(CommuneData, self.year))
+        partition_data_table(CommuneData)
+
+        self.assertTrue(detach_partition(CommuneData, self.year))
+        self.assertFalse(CommuneData.objects.filter(year=self.year).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value FROM francedata_communedata_2020")
+            self.assertEqual(cursor.fetchall(), [("771",)])
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from francedata.models import DataYear
+from francedata.services.profiling import SqlRecorder
+
+
+class SqlRecorderTestCase(TestCase):
+    def test_statements_are_aggregated(self) -> None:
+        recorder = SqlRecorder()
+        with connection.execute_wrapper(recorder):
+            for year in [2020, 2021, 2022]:
+                DataYear.objects.filter(year=year).exists()
+            DataYear.objects.count()
+
+        counts = sorted(stats["count"] for stats in recorder.statements.values())
+        self.assertEqual(counts, [1, 3])
+        self.assertIn("4 SQL queries", recorder.summary())
+
+
+class ProfileOptionTestCase(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "profile")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def run_profiled_command(self, profiler: str) -> str:
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            call_command(
+                "files_import",
+                profile=True,
+                profile_output=self.output,
+                profile_top=5,
+                profiler=profiler,
+            )
+        self.assertTrue(os.path.exists(f"{self.output}.pstats"))
+        with open(f"{self.output}.txt") as summary_file:
+            summary = summary_file.read()
+        self.assertIn(summary.strip(), stdout.getvalue())
+        return summary
+
+    def test_command_is_profiled_with_cprofile(self) -> None:
+        summary = self.run_profiled_command("cprofile")
+        self.assertIn("Profile of files_import with cProfile", summary)
+        self.assertIn("francedata_datasourcefile", summary)
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyinstrument"), "pyinstrument is not installed"
+    )
+    def test_command_is_profiled_with_pyinstrument(self) -> None:
+        summary = self.run_profiled_command("pyinstrument")
+        self.assertIn("Profile of files_import with pyinstrument", summary)
+
+    def test_command_is_not_profiled_by_default(self) -> None:
+        with redirect_stdout(StringIO()):
+            call_command("files_import", profile_output=self.output)
+        self.assertFalse(os.path.exists(f"{self.output}.pstats"))
@@ -0,0 +1,176 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    CommuneEpciMembership,
+    DataSource,
+    DataYear,
+    Departement,
+    DepartementData,
+    Epci,
+    EpciData,
+    Region,
+    RegionData,
+    SubdivisionCount,
+)
+from francedata.services.rollup import (
+    ROLLUP_SOURCE_TITLE,
+    refresh_rollups,
+    rollup_commune_data,
+)
+
+
+class RollupTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test title", year=self.year)
+
+        region = Region.objects.create(insee="84", name="Test region")
+        dept1 = Departement.objects.create(name="Dept 1", insee="01", region=region)
+        dept2 = Departement.objects.create(name="Dept 2", insee="02", region=region)
+        self.epci = Epci.objects.create(name="Test EPCI", siren="200068989")
+
+        values = [
+            ("01001", dept1, self.epci, 100, "10"),
+            ("01002", dept1, self.epci, 200, "12,5"),
+            ("02001", dept2, None, 50, "N/A"),
+        ]
+        for insee, dept, epci, population, value in values:
+            commune = Commune.objects.create(
+                name=f"Commune {insee}",
+                insee=insee,
+                departement=dept,
+                epci=epci,
+                population=population,
+            )
+            commune.years.add(self.year)
+            CommuneData.objects.create(
+                commune=commune,
+                year=self.year,
+                datacode="superficie",
+                value=value,
+                datatype="float",
+                source=source,
+            )
+
+    def get_values(self, model, datacode: str) -> dict:
+        collectivity = model.collectivity_field
+        return dict(
+            model.objects.filter(datacode=datacode).values_list(
+                f"{collectivity}__name", "value"
+            )
+        )
+
+    def test_commune_data_is_rolled_up_to_each_level(self) -> None:
+        counts = rollup_commune_data(self.year, {"superficie": "sum"})
+        self.assertEqual(counts, {"epci": 1, "departement": 1, "region": 1})
+
+        self.assertEqual(self.get_values(EpciData, "superficie"), {"Test EPCI": "22.5"})
+        # The value of the commune 02001 is not a number
+        self.assertEqual(
+            self.get_values(DepartementData, "superficie"), {"Dept 1": "22.5"}
+        )
+        entry = RegionData.objects.get(datacode="superficie")
+        self.assertEqual(entry.value_numeric, Decimal("22.5"))
+        self.assertEqual(entry.source.title, ROLLUP_SOURCE_TITLE)
+
+    def test_population_is_rolled_up(self) -> None:
+        rollup_commune_data(self.year, {"population": "sum"})
+
+        self.assertEqual(self.get_values(EpciData, "population"), {"Test EPCI": "300"})
+        self.assertEqual(
+            self.get_values(DepartementData, "population"),
+            {"Dept 1": "300", "Dept 2": "50"},
+        )
+        entry = RegionData.objects.get(datacode="population")
+        self.assertEqual((entry.value_int, entry.datatype), (350, "int"))
+
+    def test_average_is_rolled_up(self) -> None:
+        rollup_commune_data(self.year, {"population": "avg"})
+        self.assertEqual(
+            self.get_values(RegionData, "population"), {"Test region": "116.666667"}
+        )
+
+    def test_invalid_aggregate_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            rollup_commune_data(self.year, {"population": "median"})
+
+    def test_rollup_is_replaced_by_the_next_one(self) -> None:
+        rollup_commune_data(self.year, {"population": "sum"})
+        Commune.objects.filter(insee="02001").update(epci=self.epci)
+
+        refresh_rollups(self.year)
+        self.assertEqual(self.get_values(EpciData, "population"), {"Test EPCI": "350"})
+        self.assertEqual(EpciData.objects.filter(datacode="population").count(), 1)
+
+    def test_refresh_keeps_the_rolled_up_datacodes(self) -> None:
+        rollup_commune_data(self.year, {"superficie": "max"})
+        Commune.objects.filter(insee="02001").update(epci=self.epci)
+        CommuneData.objects.filter(commune__insee="02001").update(
+            value="30", value_numeric=30
+        )
+
+        refresh_rollups(self.year)
+        self.assertEqual(self.get_values(EpciData, "superficie"), {"Test EPCI": "30"})
+
+    def test_imported_data_is_kept(self) -> None:
+        source = DataSource.objects.create(title="Imported", year=self.year)
+        EpciData.objects.create(
+            epci=self.epci,
+            year=self.year,
+            datacode="population",
+            value="301",
+            datatype="int",
+            source=source,
+        )
+
+        rollup_commune_data(self.year, {"population": "sum"})
+        self.assertEqual(self.get_values(EpciData, "population"), {"Test EPCI": "301"})
+
+    def test_past_years_follow_the_memberships_of_the_year(self) -> None:
+        # In 2020, the commune 01002 was isolated and 02001 was a member
+        past_year = DataYear.objects.create(year=2020)
+        source = DataSource.objects.create(title="Past source", year=past_year)
+        for commune in Commune.objects.all():
+            commune.years.add(past_year)
+            CommuneData.objects.create(
+                commune=commune,
+                year=past_year,
+                datacode="superficie",
+                value="5",
+                datatype="float",
+                source=source,
+            )
+        for insee in ["01001", "02001"]:
+            CommuneEpciMembership.objects.create(
+                commune=Commune.objects.get(insee=insee),
+                epci=self.epci,
+                year=past_year,
+            )
+
+        counts = rollup_commune_data(
+            past_year, {"superficie": "sum", "population": "sum"}
+        )
+        self.assertEqual(counts, {"epci": 1, "departement": 2, "region": 1})
+        entry = EpciData.objects.get(year=past_year)
+        self.assertEqual((entry.datacode, entry.value), ("superficie", "10"))
+        # The population of the communes is the one of the latest year
+        self.assertFalse(
+            RegionData.objects.filter(year=past_year, datacode="population").exists()
+        )
+
+        # Counted live, then precomputed
+        self.assertEqual(self.epci.count_subdivisions(2020), {"communes": 2})
+        self.assertEqual(
+            Departement.objects.get(insee="02").count_subdivisions(2020),
+            {"epcis": 1, "communes": 1},
+        )
+        SubdivisionCount.refresh(past_year)
+        self.assertEqual(self.epci.subdivisions_count(2020), {"communes": 2})
+        self.assertEqual(
+            Departement.objects.get(insee="01").subdivisions_count(2020),
+            {"epcis": 1, "communes": 2},
+        )
@@ -0,0 +1,41 @@
+"""
+Startup check: the modules loaded when Django sets the app up.
+
+It is shared by the startup test and the startup benchmark, so that they check
+the same modules in the same way.
+"""
+
+import os
+import subprocess
+import sys
+
+# Only needed by the importers, they must not be loaded with the models
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl", "openpyxl_dictreader", "requests"]
+
+STARTUP_CODE = """
+import os, sys
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+import django
+django.setup()
+import francedata.models
+print(" ".join(sorted(name for name in {heavy} if name in sys.modules)))
+"""
+
+
+def run_startup(*python_options: str, check: bool = False):
+    """
+    Sets Django up in a new interpreter, started with the given options, which
+    prints the heavy modules it loaded. Returns the completed process.
+    """
+    return subprocess.run(
+        [
+            sys.executable,
+            *python_options,
+            "-c",
+            STARTUP_CODE.format(heavy=HEAVY_MODULES),
+        ],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        check=check,
+    )
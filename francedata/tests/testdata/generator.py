@@ -0,0 +1,604 @@
+"""
+Synthetic dataset generator, with the shape of the French administrative structure.
+
+The scale is relative to the actual size of France (about 35 000 communes
+and 1 250 EPCIs): scale=1 generates a full-size dataset, small values are
+enough for tests. The generation is deterministic for a given seed.
+
+The dataset can be loaded directly in the database, or written as the source files
+read by the importers: COG CSVs, Banatic EPCI TSV and SirenInsee workbook, and a
+commune data CSV for a DataSourceFile.
+
+The Insee ids are made of the département id and a 3-digit number (2-digit for
+the overseas départements), so there are at most 999 communes per département.
+The communes of the full départements spill over to the others, then to a spare
+département code: the ids stay unique up to about 2.78 times the size of France,
+and larger scales are rejected.
+"""
+import csv
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from django.utils.text import slugify
+from openpyxl import Workbook
+from stdnum import luhn
+from unidecode import unidecode
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+    Epci,
+    Region,
+)
+from francedata.models.collectivity import normalize_search_name
+
+FRANCE_COMMUNES = 34955
+FRANCE_COMMUNES_PER_EPCI = 28
+
+# (insee, category) of the régions, the first five ones are the overseas ones
+REGIONS = [
+    ("01", "REG"),
+    ("02", "CTU"),
+    ("03", "CTU"),
+    ("04", "REG"),
+    ("06", "CTU"),
+    ("11", "REG"),
+    ("24", "REG"),
+    ("27", "REG"),
+    ("28", "REG"),
+    ("32", "REG"),
+    ("44", "REG"),
+    ("52", "REG"),
+    ("53", "REG"),
+    ("75", "REG"),
+    ("76", "REG"),
+    ("84", "REG"),
+    ("93", "REG"),
+    ("94", "REG"),
+]
+
+OVERSEAS_DEPARTEMENTS = ["971", "972", "973", "974", "976"]
+DEPARTEMENTS = (
+    [f"{i:02d}" for i in range(1, 20)]
+    + ["2A", "2B"]
+    + [f"{i:02d}" for i in range(21, 96)]
+    + OVERSEAS_DEPARTEMENTS
+)
+# Valid département codes without an actual département, used once the others are full
+SPARE_DEPARTEMENTS = ["00"]
+
+NAME_PREFIXES = ["Saint-", "Sainte-", "Le ", "La ", "Les ", "", "", "", ""]
+NAME_ROOTS = [
+    "Abergement",
+    "Ambérieu",
+    "Bourg",
+    "Châtillon",
+    "Château",
+    "Crèvecœur",
+    "Étoile",
+    "Fontaine",
+    "Île",
+    "Montagne",
+    "Pérouges",
+    "Rivière",
+    "Sérignan",
+    "Valbonne",
+    "Vézelay",
+]
+NAME_SUFFIXES = [
+    "",
+    "",
+    "-sur-Mer",
+    "-en-Bresse",
+    "-les-Bains",
+    "-de-Varey",
+    "-sur-Saône",
+    "-d'Azergues",
+    "-le-Château",
+]
+EPCI_TYPES = ["CC", "CC", "CC", "CA", "CU", "METRO"]
+
+# Type of name (TNCC) of the COG files, according to the article
+COG_ARTICLES = {"Le ": "2", "La ": "3", "Les ": "4"}
+
+# Mapping of the commune data file, in the format of DataMapping.mapping
+COMMUNES_DATA_MAPPING = {
+    "collectivity_type": "commune",
+    "insee_key": "CodeInsee",
+    "data_fields": [
+        {
+            "field_type": "int",
+            "fieldname_database": "pop_tot",
+            "fieldname_sourcefile": "PopTot",
+        },
+        {
+            "field_type": "int",
+            "fieldname_database": "pop_muni",
+            "fieldname_sourcefile": "PopMuni",
+        },
+        {
+            "field_type": "int",
+            "fieldname_database": "superficie",
+            "fieldname_sourcefile": "Sup",
+        },
+        {
+            "field_type": "float",
+            "fieldname_database": "densite",
+            "fieldname_sourcefile": "Densite",
+        },
+    ],
+}
+
+
+def communes_capacity(departement: str) -> int:
+    return 99 if departement in OVERSEAS_DEPARTEMENTS else 999
+
+
+def make_siren(prefix: str, number: int) -> str:
+    """
+    Returns a valid Siren id, made of a 2-digit prefix, a sequence number
+    and a Luhn check digit
+    """
+    base = f"{prefix}{number:06d}"
+    return base + luhn.calc_check_digit(base)
+
+
+def make_slug(*parts) -> str:
+    return slugify("-".join(unidecode(str(part)) for part in parts))
+
+
+def make_cog_names(name: str) -> dict:
+    """
+    Returns the name columns of the COG files: type of name, uppercase name
+    and name without its article
+    """
+    tncc = "0"
+    nccenr = name
+    for article, code in COG_ARTICLES.items():
+        if name.startswith(article):
+            tncc = code
+            nccenr = name[len(article) :]
+    return {
+        "TNCC": tncc,
+        "NCC": unidecode(nccenr).upper(),
+        "NCCENR": nccenr,
+        "LIBELLE": name,
+    }
+
+
+def write_csv(
+    path: str,
+    columns: List[str],
+    rows: List[list],
+    delimiter: str = ",",
+    encoding: str = "utf-8",
+) -> str:
+    with open(path, "w", newline="", encoding=encoding, errors="replace") as csv_file:
+        writer = csv.writer(csv_file, delimiter=delimiter, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(rows)
+    return path
+
+
+@dataclass
+class SyntheticFrance:
+    scale: float = 1.0
+    seed: int = 42
+    regions: List[dict] = field(default_factory=list)
+    departements: List[dict] = field(default_factory=list)
+    epcis: List[dict] = field(default_factory=list)
+    communes: List[dict] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.rng = random.Random(self.seed)
+        self.generate()
+
+    def make_name(self) -> str:
+        return (
+            self.rng.choice(NAME_PREFIXES)
+            + self.rng.choice(NAME_ROOTS)
+            + self.rng.choice(NAME_SUFFIXES)
+        )
+
+    def add_departement(self, insee: str, metro_regions: List[tuple]) -> dict:
+        i = len(self.departements)
+        if insee in OVERSEAS_DEPARTEMENTS:
+            region = REGIONS[OVERSEAS_DEPARTEMENTS.index(insee)][0]
+        else:
+            region = metro_regions[min(i, 95) * len(metro_regions) // 96][0]
+        departement = {
+            "insee": insee,
+            "name": f"{self.make_name()} {insee}",
+            "siren": make_siren("22", i + 1),
+            "region": region,
+            "category": "DEPT",
+        }
+        self.departements.append(departement)
+        return departement
+
+    def generate(self) -> None:
+        departements_count = max(1, min(len(DEPARTEMENTS), round(101 * self.scale)))
+        communes_count = max(departements_count, round(FRANCE_COMMUNES * self.scale))
+
+        # Régions and départements
+        metro_regions = REGIONS[5:]
+        for i, (insee, category) in enumerate(REGIONS):
+            self.regions.append(
+                {
+                    "insee": insee,
+                    "name": f"Région {self.make_name()} {insee}",
+                    "siren": make_siren("23", i + 1),
+                    "category": category,
+                }
+            )
+
+        for insee in DEPARTEMENTS[:departements_count]:
+            self.add_departement(insee, metro_regions)
+
+        capacity = sum(map(communes_capacity, DEPARTEMENTS + SPARE_DEPARTEMENTS))
+        if communes_count > capacity:
+            raise ValueError(
+                f"{communes_count} communes requested, but only {capacity} Insee ids "
+                f"are available (scale {capacity / FRANCE_COMMUNES:.2f})"
+            )
+
+        # Communes, spread over the départements, skipping the full ones
+        numbers = {departement["insee"]: 0 for departement in self.departements}
+        open_departements = list(self.departements)
+        spare_departements = [
+            insee for insee in DEPARTEMENTS + SPARE_DEPARTEMENTS if insee not in numbers
+        ]
+        position = 0
+        for i in range(communes_count):
+            if not open_departements:
+                insee = spare_departements.pop(0)
+                open_departements.append(self.add_departement(insee, metro_regions))
+                numbers[insee] = 0
+            position %= len(open_departements)
+            departement = open_departements[position]
+            numbers[departement["insee"]] += 1
+            number = numbers[departement["insee"]]
+            if number == communes_capacity(departement["insee"]):
+                open_departements.pop(position)
+            else:
+                position += 1
+            digits = 2 if departement["insee"] in OVERSEAS_DEPARTEMENTS else 3
+            self.communes.append(
+                {
+                    "insee": f"{departement['insee']}{number:0{digits}d}",
+                    "name": self.make_name(),
+                    "siren": make_siren("21", i + 1),
+                    "departement": departement["insee"],
+                    "population": int(self.rng.paretovariate(1.2) * 150),
+                    "epci": None,
+                }
+            )
+
+        # EPCIs, grouping communes of the same département
+        by_departement: Dict[str, List[dict]] = {}
+        for commune in self.communes:
+            by_departement.setdefault(commune["departement"], []).append(commune)
+
+        for members in by_departement.values():
+            for start in range(0, len(members), FRANCE_COMMUNES_PER_EPCI):
+                siren = make_siren("24", len(self.epcis) + 1)
+                self.epcis.append(
+                    {
+                        "siren": siren,
+                        "name": f"CC {self.make_name()}",
+                        "epci_type": self.rng.choice(EPCI_TYPES),
+                    }
+                )
+                for commune in members[start : start + FRANCE_COMMUNES_PER_EPCI]:
+                    commune["epci"] = siren
+
+
+def populate_database(
+    dataset: SyntheticFrance,
+    years: List[int] = (2021,),
+    datacodes: List[str] = None,
+    batch_size: int = 5000,
+) -> List[DataYear]:
+    """
+    Writes the dataset in bulk, with all collectivities belonging to the given years.
+
+    For each year and datacode, an integer value is added to each commune.
+    """
+    year_entries = [DataYear.objects.get_or_create(year=year)[0] for year in years]
+
+    regions = Region.objects.bulk_create(
+        [
+            Region(
+                **item,
+                slug=make_slug(item["name"]),
+                search_name=normalize_search_name(item["name"]),
+            )
+            for item in dataset.regions
+        ],
+        batch_size=batch_size,
+    )
+    regions_by_insee = {region.insee: region for region in regions}
+
+    departements = Departement.objects.bulk_create(
+        [
+            Departement(
+                **{**item, "region": regions_by_insee[item["region"]]},
+                slug=make_slug(item["name"]),
+                search_name=normalize_search_name(item["name"]),
+            )
+            for item in dataset.departements
+        ],
+        batch_size=batch_size,
+    )
+    departements_by_insee = {dept.insee: dept for dept in departements}
+
+    epcis = Epci.objects.bulk_create(
+        [
+            Epci(
+                **item,
+                slug=make_slug(item["name"], item["siren"]),
+                search_name=normalize_search_name(item["name"]),
+            )
+            for item in dataset.epcis
+        ],
+        batch_size=batch_size,
+    )
+    epcis_by_siren = {epci.siren: epci for epci in epcis}
+
+    communes = Commune.objects.bulk_create(
+        [
+            Commune(
+                **{
+                    **item,
+                    "departement": departements_by_insee[item["departement"]],
+                    "epci": epcis_by_siren.get(item["epci"]),
+                },
+                slug=make_slug(item["name"], item["insee"]),
+                search_name=normalize_search_name(item["name"]),
+            )
+            for item in dataset.communes
+        ],
+        batch_size=batch_size,
+    )
+
+    for model, items in [
+        (Region, regions),
+        (Departement, departements),
+        (Epci, epcis),
+        (Commune, communes),
+    ]:
+        through = model.years.through
+        fk_name = f"{model._meta.model_name}_id"
+        through.objects.bulk_create(
+            [
+                through(**{fk_name: item.id, "datayear_id": year_entry.id})
+                for item in items
+                for year_entry in year_entries
+            ],
+            batch_size=batch_size,
+        )
+
+    for year_entry in year_entries if datacodes else []:
+        source, _created = DataSource.objects.get_or_create(
+            title="Synthetic data", year=year_entry
+        )
+        rng = random.Random(dataset.seed + year_entry.year)
+        CommuneData.objects.bulk_create(
+            [
+                CommuneData(
+                    commune=commune,
+                    year=year_entry,
+                    datacode=datacode,
+                    value=str(value),
+                    datatype="int",
+                    value_int=value,
+                    value_numeric=value,
+                    source=source,
+                )
+                for commune in communes
+                for datacode in datacodes
+                for value in [rng.randint(0, 100000)]
+            ],
+            batch_size=batch_size,
+        )
+
+    return year_entries
+
+
+def write_cog_files(dataset: SyntheticFrance, directory: str, year: int) -> dict:
+    """
+    Writes the régions, départements and communes lists in the COG format
+    used since 2021, and returns their paths.
+
+    Some communes have a commune déléguée, which the importer has to skip.
+    """
+    communes_by_departement: Dict[str, List[dict]] = {}
+    for commune in dataset.communes:
+        communes_by_departement.setdefault(commune["departement"], []).append(commune)
+    departement_seats = {
+        insee: communes[0]["insee"]
+        for insee, communes in communes_by_departement.items()
+    }
+    region_seats = {}
+    for departement in dataset.departements:
+        region_seats.setdefault(
+            departement["region"], departement_seats[departement["insee"]]
+        )
+    departements_regions = {
+        departement["insee"]: departement["region"]
+        for departement in dataset.departements
+    }
+    names_columns = ["TNCC", "NCC", "NCCENR", "LIBELLE"]
+
+    regions_rows = [
+        [region["insee"], region_seats.get(region["insee"], "")]
+        + list(make_cog_names(region["name"]).values())
+        for region in dataset.regions
+    ]
+    departements_rows = [
+        [
+            departement["insee"],
+            departement["region"],
+            departement_seats[departement["insee"]],
+        ]
+        + list(make_cog_names(departement["name"]).values())
+        for departement in dataset.departements
+    ]
+    communes_rows = []
+    for i, commune in enumerate(dataset.communes):
+        region = departements_regions[commune["departement"]]
+        names = list(make_cog_names(commune["name"]).values())
+        communes_rows.append(
+            ["COM", commune["insee"], region, commune["departement"], ""]
+            + names
+            + ["", ""]
+        )
+        if i % 25 == 0:
+            communes_rows.append(
+                ["COMD", commune["insee"], "", "", ""] + names + ["", commune["insee"]]
+            )
+
+    return {
+        "regions": write_csv(
+            os.path.join(directory, f"region{year}.csv"),
+            ["REG", "CHEFLIEU"] + names_columns,
+            regions_rows,
+        ),
+        "departements": write_csv(
+            os.path.join(directory, f"departement{year}.csv"),
+            ["DEP", "REG", "CHEFLIEU"] + names_columns,
+            departements_rows,
+        ),
+        "communes": write_csv(
+            os.path.join(directory, f"commune{year}.csv"),
+            ["TYPECOM", "COM", "REG", "DEP", "ARR"]
+            + names_columns
+            + ["CAN", "COMPARENT"],
+            communes_rows,
+        ),
+    }
+
+
+def write_banatic_files(dataset: SyntheticFrance, directory: str, year: int) -> dict:
+    """
+    Writes the Banatic files and returns their paths:
+    - the EPCI perimeters, a cp1252 TSV with a .xls extension, one row per member
+    - the SirenInsee zip archive, with one workbook for the year
+    """
+    communes_by_epci: Dict[str, List[dict]] = {}
+    for commune in dataset.communes:
+        communes_by_epci.setdefault(commune["epci"], []).append(commune)
+
+    epci_rows = []
+    for epci in dataset.epcis:
+        members = communes_by_epci.get(epci["siren"], [])
+        for member in members:
+            epci_rows.append(
+                [
+                    epci["siren"],
+                    epci["name"],
+                    epci["epci_type"],
+                    f"01/01/{year - 10}",
+                    len(members),
+                    member["siren"],
+                    member["name"],
+                    "Commune",
+                ]
+            )
+    epci_path = write_csv(
+        os.path.join(directory, f"perimetre-epci-{year}.xls"),
+        [
+            "N° SIREN",
+            "Nom du groupement",
+            "Nature juridique",
+            "Date de création",
+            "Nombre de membres",
+            "Siren membre",
+            "Nom membre",
+            "Type",
+        ],
+        epci_rows,
+        delimiter="\t",
+        encoding="cp1252",
+    )
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("insee_siren")
+    sheet.append(
+        [
+            "reg_com",
+            "dep_com",
+            "siren",
+            "insee",
+            "nom_com",
+            f"ptot_{year}",
+            f"pmun_{year}",
+        ]
+    )
+    departements_regions = {
+        departement["insee"]: departement["region"]
+        for departement in dataset.departements
+    }
+    for commune in dataset.communes:
+        sheet.append(
+            [
+                departements_regions[commune["departement"]],
+                commune["departement"],
+                commune["siren"],
+                commune["insee"],
+                commune["name"],
+                commune["population"],
+                commune["population"] - commune["population"] // 50,
+            ]
+        )
+
+    siren_insee_path = os.path.join(directory, "TableCorrespondanceSirenInsee.zip")
+    with ZipFile(siren_insee_path, "w", ZIP_DEFLATED) as zip_file:
+        with zip_file.open(f"Banatic_SirenInsee{year}.xlsx", "w") as xlsx_file:
+            workbook.save(xlsx_file)
+
+    return {"epcis": epci_path, "siren_insee": siren_insee_path}
+
+
+def write_communes_data_file(
+    dataset: SyntheticFrance, directory: str, year: int
+) -> str:
+    """
+    Writes a commune data file, to be imported with COMMUNES_DATA_MAPPING
+    """
+    rng = random.Random(dataset.seed + year)
+    rows = []
+    for commune in dataset.communes:
+        area = rng.randint(100, 10000)
+        rows.append(
+            [
+                commune["departement"],
+                commune["insee"],
+                commune["siren"],
+                commune["name"],
+                commune["population"],
+                commune["population"] - commune["population"] // 50,
+                area,
+                str(round(commune["population"] * 100 / area, 4)).replace(".", ","),
+            ]
+        )
+    return write_csv(
+        os.path.join(directory, f"communes-data-{year}.csv"),
+        [
+            "CodeDep",
+            "CodeInsee",
+            "SIREN",
+            "NomCom",
+            "PopTot",
+            "PopMuni",
+            "Sup",
+            "Densite",
+        ],
+        rows,
+    )
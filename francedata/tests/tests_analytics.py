@@ -0,0 +1,145 @@
+import numpy
+from django.test import TestCase
+
+from francedata.analytics import to_frame
+from francedata.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+    DepartementData,
+)
+
+
+class ToFrameTestCase(TestCase):
+    def setUp(self) -> None:
+        dept = Departement.objects.create(name="Ain", insee="01")
+        communes = [
+            Commune.objects.create(
+                name=f"Commune {insee}", insee=insee, departement=dept
+            )
+            for insee in ["01001", "01002"]
+        ]
+
+        for year, factor in [(2020, 1), (2021, 2)]:
+            year_entry = DataYear.objects.create(year=year)
+            source = DataSource.objects.create(title="Test title", year=year_entry)
+            for i, commune in enumerate(communes, start=1):
+                for datacode, value, datatype in [
+                    ("pop_muni", str(100 * i * factor), "int"),
+                    ("densite", f"{i * factor},5", "float"),
+                    ("uu", f"UU {i}", "string"),
+                ]:
+                    CommuneData.objects.create(
+                        commune=commune,
+                        year=year_entry,
+                        datacode=datacode,
+                        value=value,
+                        datatype=datatype,
+                        source=source,
+                    )
+            DepartementData.objects.create(
+                departement=dept,
+                year=year_entry,
+                datacode="pop_muni",
+                value=str(300 * factor),
+                datatype="int",
+                source=source,
+            )
+
+    def test_latest_year_is_returned_by_default(self) -> None:
+        frame = to_frame("commune", chunk_size=2)
+
+        self.assertEqual(frame.index.name, "insee")
+        self.assertEqual(list(frame.index), ["01001", "01002"])
+        self.assertEqual(list(frame.columns), ["densite", "pop_muni", "uu"])
+        self.assertEqual(frame.loc["01002", "pop_muni"], 400)
+        self.assertEqual(frame.loc["01001", "densite"], 2.5)
+        self.assertEqual(frame.loc["01001", "uu"], "UU 1")
+
+    def test_columns_are_typed_per_datatype(self) -> None:
+        frame = to_frame("commune", 2020)
+
+        self.assertEqual(frame["pop_muni"].dtype, numpy.int64)
+        self.assertEqual(frame["densite"].dtype, numpy.float64)
+        self.assertEqual(frame["uu"].dtype, object)
+
+    def test_datacodes_are_filtered_in_order(self) -> None:
+        frame = to_frame("commune", 2020, ["pop_muni", "densite"])
+        self.assertEqual(list(frame.columns), ["pop_muni", "densite"])
+        self.assertEqual(frame.loc["01001", "pop_muni"], 100)
+
+    def test_several_years_are_indexed_by_year(self) -> None:
+        frame = to_frame("commune", datacodes=["pop_muni"], years=[2020, 2021])
+
+        self.assertEqual(frame.index.names, ["insee", "year"])
+        self.assertEqual(frame.loc[("01002", 2020), "pop_muni"], 200)
+        self.assertEqual(frame.loc[("01002", 2021), "pop_muni"], 400)
+
+    def test_other_levels(self) -> None:
+        frame = to_frame("departement", 2021)
+        self.assertEqual(frame.loc["01", "pop_muni"], 600)
+
+        with self.assertRaises(ValueError):
+            to_frame("canton")
+
+    def test_missing_data_returns_an_empty_frame(self) -> None:
+        frame = to_frame("epci", 2021, ["pop_muni"])
+
+        self.assertTrue(frame.empty)
+        self.assertEqual(frame.index.name, "siren")
+        self.assertEqual(list(frame.columns), ["pop_muni"])
+
+    def test_integers_are_exact(self) -> None:
+        # Above 2**53, the integers are not exact as floats
+        CommuneData.objects.filter(commune__insee="01001", datacode="pop_muni").update(
+            value="9007199254740993", value_int=9007199254740993
+        )
+        frame = to_frame("commune", 2021)
+
+        self.assertEqual(frame["pop_muni"].dtype, numpy.int64)
+        self.assertEqual(frame.loc["01001", "pop_muni"], 9007199254740993)
+
+    def test_duplicate_identifiers_are_rejected(self) -> None:
+        commune = Commune.objects.create(
+            name="Commune 01001 bis",
+            insee="01001",
+            departement=Departement.objects.get(insee="01"),
+        )
+        CommuneData.objects.create(
+            commune=commune,
+            year=DataYear.objects.get(year=2021),
+            datacode="pop_muni",
+            value="50",
+            datatype="int",
+            source=DataSource.objects.first(),
+        )
+
+        with self.assertRaisesMessage(
+            ValueError, "Several commune entries have the insee 01001"
+        ):
+            to_frame("commune", 2021)
+
+    def test_query_count_does_not_depend_on_the_number_of_rows(self) -> None:
+        # Years, data types, rows and identifiers
+        with self.assertNumQueries(4):
+            to_frame("commune", 2021)
+
+
+class CollectivityGetDataTestCase(TestCase):
+    def test_data_of_each_level_is_returned(self) -> None:
+        year = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test title", year=year)
+        dept = Departement.objects.create(name="Ain", insee="01")
+        dept.years.add(year)
+        DepartementData.objects.create(
+            departement=dept,
+            year=year,
+            datacode="seat_insee",
+            value="01053",
+            source=source,
+        )
+
+        self.assertEqual(dept.get_data().get().value, "01053")
+        self.assertFalse(dept.get_data(datacode="tncc").exists())
@@ -0,0 +1,878 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from francedata.models import (
+    Commune,
+    CommuneData,
+    CommuneEpciMembership,
+    DataSource,
+    DataYear,
+    CommuneSnapshot,
+    Departement,
+    DepartementData,
+    Epci,
+    Region,
+    rebuild_snapshots,
+)
+from francedata.services.api_router import (
+    get_api_cache,
+    get_cache_stats,
+    reset_cache_stats,
+)
+from francedata.services.dataset_version import bump_dataset_version
+
+API_ROOT = "/api/france"
+
+
+class BatchLookupTestCase(TestCase):
+    def setUp(self) -> None:
+        year = DataYear.objects.create(year=2021)
+
+        region = Region.objects.create(insee="84", name="Auvergne-Rhône-Alpes")
+        region.years.add(year)
+
+        dept = Departement.objects.create(
+            name="Ain", insee="01", siren="220100010", region=region
+        )
+        dept.years.add(year)
+
+        epci = Epci.objects.create(name="CC de la Dombes", siren="200042935")
+        epci.years.add(year)
+
+        commune_1 = Commune.objects.create(
+            name="L'Abergement-Clémenciat",
+            insee="01001",
+            siren="210100012",
+            departement=dept,
+            epci=epci,
+        )
+        commune_1.years.add(year)
+
+        commune_2 = Commune.objects.create(
+            name="L'Abergement-de-Varey",
+            insee="01002",
+            siren="210100020",
+            departement=dept,
+        )
+        commune_2.years.add(year)
+
+    def post_batch(self, level: str, payload: dict):
+        return self.client.post(
+            f"{API_ROOT}/{level}/batch", payload, content_type="application/json"
+        )
+
+    def test_communes_are_resolved_by_mixed_codes(self) -> None:
+        response = self.post_batch(
+            "communes", {"codes": ["01001", "210100020", "99999"]}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(set(data["results"]), {"01001", "210100020"})
+        self.assertEqual(data["results"]["01001"]["siren"], "210100012")
+        self.assertEqual(data["results"]["01001"]["epci"]["siren"], "200042935")
+        self.assertEqual(data["results"]["210100020"]["insee"], "01002")
+        self.assertEqual(data["missing"], ["99999"])
+
+    def test_codes_with_invalid_length_are_missing(self) -> None:
+        response = self.post_batch("communes", {"codes": ["0100", "01001"]})
+        self.assertEqual(response.json()["missing"], ["0100"])
+
+    def test_year_filter_is_applied(self) -> None:
+        response = self.post_batch("communes", {"codes": ["01001"], "year": 2020})
+        data = response.json()
+        self.assertEqual(data["results"], {})
+        self.assertEqual(data["missing"], ["01001"])
+
+    def test_query_count_does_not_depend_on_codes_count(self) -> None:
+        # One lookup query, plus one per prefetched relation
+        with self.assertNumQueries(5):
+            self.post_batch("communes", {"codes": ["01001", "210100020"]})
+
+    def test_other_levels_are_resolved(self) -> None:
+        response = self.post_batch("departements", {"codes": ["01", "220100010"]})
+        self.assertEqual(set(response.json()["results"]), {"01", "220100010"})
+
+        response = self.post_batch("regions", {"codes": ["84"]})
+        self.assertEqual(
+            response.json()["results"]["84"]["name"], "Auvergne-Rhône-Alpes"
+        )
+
+        response = self.post_batch("epcis", {"codes": ["200042935"]})
+        self.assertEqual(response.json()["missing"], [])
+
+    def test_too_many_codes_are_rejected(self) -> None:
+        response = self.post_batch("communes", {"codes": ["01001"] * 1001})
+        self.assertEqual(response.status_code, 422)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self) -> None:
+        year_2020 = DataYear.objects.create(year=2020)
+        year_2021 = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test source", year=year_2021)
+
+        dept = Departement.objects.create(name="Ain", insee="01")
+        commune_1 = Commune.objects.create(
+            name="L'Abergement-Clémenciat",
+            insee="01001",
+            siren="210100012",
+            departement=dept,
+        )
+        commune_2 = Commune.objects.create(
+            name="L'Abergement-de-Varey",
+            insee="01002",
+            siren="210100020",
+            departement=dept,
+        )
+
+        for year, commune, value in [
+            (year_2021, commune_1, "771"),
+            (year_2021, commune_2, "253"),
+            (year_2020, commune_1, "765"),
+        ]:
+            CommuneData.objects.create(
+                commune=commune,
+                year=year,
+                datacode="pop_muni",
+                value=value,
+                datatype="int",
+                source=source,
+            )
+        CommuneData.objects.create(
+            commune=commune_1,
+            year=year_2021,
+            datacode="tncc",
+            value="0",
+            datatype="string",
+            source=source,
+        )
+
+    def get_export(self, params: dict) -> list:
+        response = self.client.get(f"{API_ROOT}/export/communedata", params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8").splitlines()
+
+    def test_csv_export_is_filtered(self) -> None:
+        lines = self.get_export({"year": 2021, "datacode": "pop_muni"})
+        self.assertEqual(lines[0], "insee,siren,year,datacode,value,label,datatype")
+        self.assertEqual(
+            lines[1:],
+            [
+                "01001,210100012,2021,pop_muni,771,,int",
+                "01002,210100020,2021,pop_muni,253,,int",
+            ],
+        )
+
+    def test_ndjson_export(self) -> None:
+        lines = self.get_export({"datacode": "pop_muni", "format": "ndjson"})
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            json.loads(lines[2]),
+            {
+                "insee": "01001",
+                "siren": "210100012",
+                "year": 2020,
+                "datacode": "pop_muni",
+                "value": "765",
+                "label": None,
+                "datatype": "int",
+            },
+        )
+
+    def test_invalid_format_is_rejected(self) -> None:
+        response = self.client.get(f"{API_ROOT}/export/communedata", {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self) -> None:
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(insee="84", name="Auvergne-Rhône-Alpes")
+        region.years.add(year)
+
+    def test_no_etag_before_first_import(self) -> None:
+        response = self.client.get(f"{API_ROOT}/regions")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_etag_and_last_modified_are_sent(self) -> None:
+        version = bump_dataset_version()
+        response = self.client.get(f"{API_ROOT}/regions")
+        self.assertEqual(response["ETag"], f'"{version.value}"')
+        self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_matching_etag_returns_not_modified_without_querying_data(self) -> None:
+        version = bump_dataset_version()
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f"{API_ROOT}/regions", HTTP_IF_NONE_MATCH=f'"{version.value}"'
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], f'"{version.value}"')
+
+    def test_import_changes_the_etag(self) -> None:
+        old_version = bump_dataset_version()
+        new_version = bump_dataset_version()
+        self.assertNotEqual(old_version.value, new_version.value)
+
+        response = self.client.get(
+            f"{API_ROOT}/regions", HTTP_IF_NONE_MATCH=f'"{old_version.value}"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{new_version.value}"')
+
+
+@override_settings(FRANCEDATA_API_CACHE_ENABLED=True)
+class ResponseCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        get_api_cache().clear()
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(
+            insee="84", name="Auvergne-Rhône-Alpes", siren="200053767"
+        )
+        region.years.add(year)
+        bump_dataset_version()
+
+    def test_second_identical_request_is_served_from_cache(self) -> None:
+        response = self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertEqual(response["X-Cache"], "MISS")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()["name"], "Auvergne-Rhône-Alpes")
+
+    def test_query_parameters_are_normalized(self) -> None:
+        self.client.get(
+            f"{API_ROOT}/subdivisions/84", {"category": "regions", "year": 2021}
+        )
+        response = self.client.get(
+            f"{API_ROOT}/subdivisions/84?year=2021&category=regions"
+        )
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()[0]["items"][0]["value"], "200053767")
+
+    def test_import_invalidates_the_cache(self) -> None:
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        bump_dataset_version()
+        response = self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_errors_are_not_cached(self) -> None:
+        self.client.get(f"{API_ROOT}/regions/200000000")
+        response = self.client.get(f"{API_ROOT}/regions/200000000")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_endpoints_without_cache_are_not_cached(self) -> None:
+        self.client.get(f"{API_ROOT}/regiondata/200053767")
+        response = self.client.get(f"{API_ROOT}/regiondata/200053767")
+        self.assertFalse(response.has_header("X-Cache"))
+
+    def test_cache_is_disabled_by_default(self) -> None:
+        with override_settings(FRANCEDATA_API_CACHE_ENABLED=False):
+            self.client.get(f"{API_ROOT}/regions/200053767")
+            response = self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertFalse(response.has_header("X-Cache"))
+
+    @override_settings(FRANCEDATA_API_CACHE_STATS=True)
+    def test_hits_and_misses_are_counted(self) -> None:
+        reset_cache_stats()
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertEqual(get_cache_stats()["get_region"], {"hits": 2, "misses": 1})
+
+    def test_hits_and_misses_are_only_counted_when_enabled(self) -> None:
+        reset_cache_stats()
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        self.client.get(f"{API_ROOT}/regions/200053767")
+        self.assertEqual(get_cache_stats()["get_region"], {"hits": 0, "misses": 0})
+
+
+class SearchTestCase(TestCase):
+    def setUp(self) -> None:
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(
+            insee="84", name="Auvergne-Rhône-Alpes", siren="200053767"
+        )
+        region.years.add(year)
+        dept = Departement.objects.create(
+            name="Ain", insee="01", siren="220100010", region=region
+        )
+        dept.years.add(year)
+        epci = Epci.objects.create(name="CC de la Dombes", siren="200042935")
+        epci.years.add(year)
+        for name, insee, siren in [
+            ("L'Abergement-Clémenciat", "01001", "210100012"),
+            ("Ambérieu-en-Bugey", "01004", "210100046"),
+            ("Ambérieux-en-Dombes", "01005", "210100053"),
+        ]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, siren=siren, departement=dept
+            )
+            commune.years.add(year)
+
+    def search(self, query: str, category: str) -> list:
+        response = self.client.get(
+            f"{API_ROOT}/subdivisions/{query}", {"category": category, "year": 2021}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.json()[0]["items"]]
+
+    def test_search_ignores_case_and_accents(self) -> None:
+        self.assertEqual(
+            sorted(self.search("AMBERIEU", "communes")),
+            ["Ambérieu-en-Bugey", "Ambérieux-en-Dombes"],
+        )
+        self.assertEqual(self.search("ambérieu-en", "communes"), ["Ambérieu-en-Bugey"])
+
+    def test_search_epcis_by_part_of_name(self) -> None:
+        response = self.client.get(
+            f"{API_ROOT}/subdivisions/dombes", {"category": "epcis", "year": 2021}
+        )
+        self.assertEqual(response.json()[0]["items"][0]["value"], "200042935")
+
+
+@override_settings(FRANCEDATA_SNAPSHOTS=True)
+class SnapshotSearchTestCase(SearchTestCase):
+    """
+    The same searches, on the snapshot tables
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        rebuild_snapshots(DataYear.objects.get(year=2021))
+        # The collectivities are not read anymore
+        Commune.objects.update(search_name="")
+        Epci.objects.update(search_name="")
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test source", year=self.year)
+        region = Region.objects.create(
+            insee="84", name="Auvergne-Rhône-Alpes", siren="200053767"
+        )
+        dept = Departement.objects.create(
+            name="Ain", insee="01", siren="220100010", region=region
+        )
+        epci = Epci.objects.create(name="CC de la Dombes", siren="200042935")
+        for collectivity in [region, dept, epci]:
+            collectivity.years.add(self.year)
+
+        for name, insee, siren, population in [
+            ("L'Abergement-Clémenciat", "01001", "210100012", 779),
+            ("Ambérieu-en-Bugey", "01004", "210100046", 14514),
+        ]:
+            commune = Commune.objects.create(
+                name=name,
+                insee=insee,
+                siren=siren,
+                departement=dept,
+                epci=epci,
+                population=population,
+            )
+            commune.years.add(self.year)
+            for datacode, value, datatype in [
+                ("pop_muni", str(population), "int"),
+                ("densite", "48,4", "float"),
+                ("uu", "01000", "string"),
+            ]:
+                CommuneData.objects.create(
+                    commune=commune,
+                    year=self.year,
+                    datacode=datacode,
+                    value=value,
+                    datatype=datatype,
+                    source=source,
+                )
+        DepartementData.objects.create(
+            departement=dept,
+            year=self.year,
+            datacode="seat_insee",
+            value="01053",
+            source=source,
+        )
+
+    def test_snapshots_are_only_rebuilt_when_enabled(self) -> None:
+        self.assertEqual(rebuild_snapshots(self.year), {})
+
+        with override_settings(FRANCEDATA_SNAPSHOTS=True):
+            counts = rebuild_snapshots(self.year)
+        self.assertEqual(
+            counts, {"region": 1, "departement": 1, "epci": 1, "commune": 2}
+        )
+
+    def test_snapshot_has_the_data_of_the_year(self) -> None:
+        with override_settings(FRANCEDATA_SNAPSHOTS=True):
+            rebuild_snapshots(self.year)
+            # Rebuilding replaces the previous snapshots
+            rebuild_snapshots(self.year, ["commune"])
+
+        snapshot = CommuneSnapshot.objects.get(insee="01001")
+        self.assertEqual(
+            (snapshot.departement_insee, snapshot.region_insee, snapshot.epci_siren),
+            ("01", "84", "200042935"),
+        )
+        self.assertEqual(
+            snapshot.data, {"pop_muni": 779, "densite": 48.4, "uu": "01000"}
+        )
+        self.assertEqual(CommuneSnapshot.objects.count(), 2)
+
+    def test_search_reads_the_collectivities_until_the_snapshots_are_built(
+        self,
+    ) -> None:
+        url = f"{API_ROOT}/subdivisions/amberieu?category=communes&year=2021"
+        with override_settings(FRANCEDATA_SNAPSHOTS=True), self.assertLogs(
+            level="WARNING"
+        ) as logs:
+            response = self.client.get(url)
+        self.assertEqual(response.json()[0]["items"][0]["value"], "210100046")
+        self.assertIn(
+            "WARNING:root:No commune snapshot for 2021, "
+            "the collectivities are read instead",
+            logs.output,
+        )
+
+    def test_commune_snapshots_have_the_epci_of_their_year(self) -> None:
+        # The commune 01001 moved to another EPCI in 2021
+        commune = Commune.objects.get(insee="01001")
+        year_2020 = DataYear.objects.create(year=2020)
+        commune.years.add(year_2020)
+        other_epci = Epci.objects.create(
+            name="CA du Bassin de Bourg", siren="200071751"
+        )
+        for year, epci in [(year_2020, commune.epci), (self.year, other_epci)]:
+            CommuneEpciMembership.objects.create(commune=commune, epci=epci, year=year)
+
+        with override_settings(FRANCEDATA_SNAPSHOTS=True):
+            rebuild_snapshots(year_2020, ["commune"])
+            rebuild_snapshots(self.year, ["commune"])
+
+        self.assertEqual(
+            list(
+                CommuneSnapshot.objects.filter(insee="01001")
+                .order_by("year__year")
+                .values_list("year__year", "epci_siren")
+            ),
+            [(2020, "200042935"), (2021, "200071751")],
+        )
+
+    def test_snapshot_detail(self) -> None:
+        with override_settings(FRANCEDATA_SNAPSHOTS=True):
+            rebuild_snapshots(self.year)
+
+        # The dataset version, then the snapshot
+        with self.assertNumQueries(2):
+            response = self.client.get(f"{API_ROOT}/snapshots/commune/210100046")
+        data = response.json()
+        self.assertEqual(data["name"], "Ambérieu-en-Bugey")
+        self.assertEqual(data["year"], {"year": 2021})
+        self.assertEqual(data["data"]["pop_muni"], 14514)
+
+        response = self.client.get(f"{API_ROOT}/snapshots/departement/01")
+        self.assertEqual(response.json()["data"], {"seat_insee": "01053"})
+
+        for path in ["commune/01002", "commune/01001?year=2020", "canton/01001"]:
+            response = self.client.get(f"{API_ROOT}/snapshots/{path}")
+            self.assertEqual(response.status_code, 404)
+
+    def test_snapshot_export(self) -> None:
+        with override_settings(FRANCEDATA_SNAPSHOTS=True):
+            rebuild_snapshots(self.year)
+
+        response = self.client.get(f"{API_ROOT}/export/snapshots/commune")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(
+            lines[0],
+            "insee,siren,departement_insee,region_insee,epci_siren,population,"
+            "name,slug,densite,pop_muni,uu",
+        )
+        self.assertEqual(
+            lines[1],
+            "01001,210100012,01,84,200042935,779,L'Abergement-Clémenciat,"
+            "labergement-clemenciat-01001,48.4,779,01000",
+        )
+
+        response = self.client.get(
+            f"{API_ROOT}/export/snapshots/epci",
+            {"datacodes": "pop_muni", "format": "ndjson"},
+        )
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(json.loads(lines[0])["pop_muni"], None)
+
+        response = self.client.get(
+            f"{API_ROOT}/export/snapshots/commune", {"year": 2020}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class LatestDataTestCase(TestCase):
+    def setUp(self) -> None:
+        year_2020 = DataYear.objects.create(year=2020)
+        year_2021 = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test source", year=year_2020)
+
+        dept = Departement.objects.create(name="Ain", insee="01")
+        commune_1 = Commune.objects.create(
+            name="L'Abergement-Clémenciat",
+            insee="01001",
+            siren="210100012",
+            departement=dept,
+        )
+        commune_2 = Commune.objects.create(
+            name="L'Abergement-de-Varey",
+            insee="01002",
+            siren="210100020",
+            departement=dept,
+        )
+
+        # commune_1 has no data for the global latest year
+        for year, commune, datacode, value in [
+            (year_2020, commune_1, "pop_muni", "765"),
+            (year_2020, commune_1, "superficie", "1595"),
+            (year_2021, commune_2, "pop_muni", "253"),
+            (year_2020, commune_2, "pop_muni", "250"),
+            (year_2020, commune_2, "superficie", "915"),
+        ]:
+            CommuneData.objects.create(
+                commune=commune,
+                year=year,
+                datacode=datacode,
+                value=value,
+                source=source,
+            )
+
+    def test_latest_data_is_computed_per_commune(self) -> None:
+        response = self.client.get(f"{API_ROOT}/communedata/210100012/latest")
+        data = response.json()
+        self.assertEqual(len(data), 2)
+        self.assertEqual({item["year"]["year"] for item in data}, {2020})
+
+        response = self.client.get(f"{API_ROOT}/communedata/210100020/latest")
+        data = response.json()
+        self.assertEqual(
+            [(item["year"]["year"], item["value"]) for item in data], [(2021, "253")]
+        )
+
+    def test_latest_data_per_datacode(self) -> None:
+        response = self.client.get(
+            f"{API_ROOT}/communedata/210100020/latest", {"per_datacode": True}
+        )
+        data = {item["datacode"]: item for item in response.json()}
+        self.assertEqual(data["pop_muni"]["value"], "253")
+        self.assertEqual(data["superficie"]["year"]["year"], 2020)
+
+    def test_latest_year_is_one_query(self) -> None:
+        with self.assertNumQueries(1):
+            list(
+                CommuneData.objects.filter(commune__siren="210100020").latest_year(
+                    per_datacode=True
+                )
+            )
+
+
+class TimeseriesTestCase(TestCase):
+    def setUp(self) -> None:
+        source = DataSource.objects.create(
+            title="Test source", year=DataYear.objects.create(year=2019)
+        )
+        dept = Departement.objects.create(name="Ain", insee="01")
+        commune_1 = Commune.objects.create(
+            name="L'Abergement-Clémenciat",
+            insee="01001",
+            siren="210100012",
+            departement=dept,
+        )
+        commune_2 = Commune.objects.create(
+            name="L'Abergement-de-Varey",
+            insee="01002",
+            siren="210100020",
+            departement=dept,
+        )
+        Commune.objects.create(
+            name="Ambérieu-en-Bugey", insee="01004", departement=dept
+        )
+
+        for year, commune, datacode, value, datatype in [
+            (2021, commune_1, "pop_muni", "779", "int"),
+            (2019, commune_1, "pop_muni", "765", "int"),
+            (2020, commune_1, "pop_muni", "772", "int"),
+            (2020, commune_1, "densite", "48,4", "float"),
+            (2020, commune_1, "uu", "01000", "string"),
+            (2021, commune_2, "pop_muni", "253", "int"),
+        ]:
+            CommuneData.objects.create(
+                commune=commune,
+                year=DataYear.objects.get_or_create(year=year)[0],
+                datacode=datacode,
+                value=value,
+                datatype=datatype,
+                source=source,
+            )
+
+    def test_values_are_sorted_by_year(self) -> None:
+        response = self.client.get(
+            f"{API_ROOT}/timeseries/commune/01001", {"datacodes": "pop_muni,densite"}
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "pop_muni": [[2019, 765], [2020, 772], [2021, 779]],
+                "densite": [[2020, 48.4]],
+            },
+        )
+
+    def test_all_datacodes_are_returned_by_siren(self) -> None:
+        response = self.client.get(f"{API_ROOT}/timeseries/commune/210100012")
+        data = response.json()
+        self.assertEqual(set(data), {"pop_muni", "densite", "uu"})
+        self.assertEqual(data["uu"], [[2020, "01000"]])
+
+    def test_unknown_collectivities_are_not_found(self) -> None:
+        response = self.client.get(f"{API_ROOT}/timeseries/commune/01003")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f"{API_ROOT}/timeseries/canton/01001")
+        self.assertEqual(response.status_code, 404)
+
+        # Existing commune without data
+        response = self.client.get(f"{API_ROOT}/timeseries/commune/01004")
+        self.assertEqual((response.status_code, response.json()), (200, {}))
+
+    def test_series_is_one_query(self) -> None:
+        with self.assertNumQueries(2):
+            # The dataset version, then the data
+            self.client.get(f"{API_ROOT}/timeseries/commune/01001")
+
+    def test_batch(self) -> None:
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                f"{API_ROOT}/timeseries/commune/batch",
+                {"codes": ["01001", "210100020", "01004"], "datacodes": ["pop_muni"]},
+                content_type="application/json",
+            )
+        data = response.json()
+        self.assertEqual(data["missing"], ["01004"])
+        self.assertEqual(data["results"]["01001"]["pop_muni"][0], [2019, 765])
+        self.assertEqual(data["results"]["210100020"], {"pop_muni": [[2021, 253]]})
+
+
+class RankingTestCase(TestCase):
+    def setUp(self) -> None:
+        year = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(title="Test source", year=year)
+        region = Region.objects.create(name="Auvergne-Rhône-Alpes", insee="84")
+        ain = Departement.objects.create(name="Ain", insee="01", region=region)
+        aisne = Departement.objects.create(name="Aisne", insee="02")
+
+        for insee, dept, population, densite in [
+            ("01001", ain, "779", "48,4"),
+            ("01002", ain, "253", "27"),
+            ("01004", ain, "14514", "590,1"),
+            ("02001", aisne, "2401", "102,5"),
+        ]:
+            commune = Commune.objects.create(
+                name=f"Commune {insee}", insee=insee, departement=dept
+            )
+            for datacode, value, datatype in [
+                ("pop_muni", population, "int"),
+                ("densite", densite, "float"),
+            ]:
+                CommuneData.objects.create(
+                    commune=commune,
+                    year=year,
+                    datacode=datacode,
+                    value=value,
+                    datatype=datatype,
+                    source=source,
+                )
+
+        # Older values are not ranked with the latest year
+        CommuneData.objects.create(
+            commune=commune,
+            year=DataYear.objects.create(year=2020),
+            datacode="pop_muni",
+            value="99999",
+            datatype="int",
+            source=source,
+        )
+
+    def get_ranking(self, path: str, params: dict = None):
+        return self.client.get(f"{API_ROOT}/ranking/{path}", params or {})
+
+    def test_top_communes(self) -> None:
+        response = self.get_ranking("commune/pop_muni", {"limit": 2})
+        data = response.json()
+        self.assertEqual([item["insee"] for item in data], ["01004", "02001"])
+        self.assertEqual(
+            data[0],
+            {
+                "rank": 1,
+                "insee": "01004",
+                "siren": "",
+                "name": "Commune 01004",
+                "slug": "commune-01004-01004",
+                "year": 2021,
+                "value": 14514,
+            },
+        )
+
+    def test_ranking_within_a_parent(self) -> None:
+        response = self.get_ranking(
+            "commune/densite", {"departement": "01", "order": "asc"}
+        )
+        self.assertEqual(
+            [(item["insee"], item["value"]) for item in response.json()],
+            [("01002", 27), ("01001", 48.4), ("01004", 590.1)],
+        )
+
+        response = self.get_ranking("commune/pop_muni", {"region": "84"})
+        self.assertEqual(len(response.json()), 3)
+
+    def test_values_are_filtered(self) -> None:
+        response = self.get_ranking(
+            "commune/pop_muni", {"min_value": 500, "max_value": 3000, "year": 2021}
+        )
+        self.assertEqual(
+            [item["insee"] for item in response.json()], ["02001", "01001"]
+        )
+
+    def test_invalid_parameters(self) -> None:
+        for path, params, status in [
+            ("canton/pop_muni", {}, 404),
+            ("commune/pop_muni", {"order": "random"}, 400),
+            ("commune/pop_muni", {"limit": 0}, 400),
+            ("departement/pop_muni", {"epci": "200068989"}, 400),
+            ("commune/pop_muni", {"departement": "1"}, 400),
+        ]:
+            response = self.get_ranking(path, params)
+            self.assertEqual(response.status_code, status, path)
+
+    def test_ranking_is_one_query(self) -> None:
+        with self.assertNumQueries(2):
+            # The dataset version, then the ranking
+            self.get_ranking("commune/pop_muni", {"departement": "01"})
+
+    def test_ranking_within_an_epci_follows_the_memberships_of_the_year(
+        self,
+    ) -> None:
+        # The commune 01001 moved from the first EPCI to the second one in 2021
+        commune = Commune.objects.get(insee="01001")
+        first = Epci.objects.create(name="CC de la Dombes", siren="200042935")
+        second = Epci.objects.create(name="CA du Bassin de Bourg", siren="200071751")
+        commune.epci = second
+        commune.save()
+        year_2020 = DataYear.objects.get(year=2020)
+        for year, epci in [
+            (year_2020, first),
+            (DataYear.objects.get(year=2021), second),
+        ]:
+            CommuneEpciMembership.objects.create(commune=commune, epci=epci, year=year)
+        CommuneData.objects.create(
+            commune=commune,
+            year=year_2020,
+            datacode="pop_muni",
+            value="765",
+            datatype="int",
+            source=DataSource.objects.first(),
+        )
+
+        for siren, year, expected in [
+            ("200042935", 2020, [("01001", 765)]),
+            ("200042935", 2021, []),
+            ("200071751", 2021, [("01001", 779)]),
+        ]:
+            response = self.get_ranking(
+                "commune/pop_muni", {"epci": siren, "year": year}
+            )
+            self.assertEqual(
+                [(item["insee"], item["value"]) for item in response.json()],
+                expected,
+            )
+
+
+class HierarchyTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year_1 = DataYear.objects.create(year=2020)
+        self.year_2 = DataYear.objects.create(year=2021)
+        region = Region.objects.create(
+            insee="84", name="Auvergne-Rhône-Alpes", siren="200053767"
+        )
+        dept = Departement.objects.create(
+            name="Ain", insee="01", siren="220100010", region=region
+        )
+        epci_1 = Epci.objects.create(name="CC de la Dombes", siren="200042935")
+        epci_2 = Epci.objects.create(
+            name="CA du Bassin de Bourg-en-Bresse", siren="200071751"
+        )
+
+        commune = Commune.objects.create(
+            name="L'Abergement-Clémenciat",
+            insee="01001",
+            siren="210100012",
+            departement=dept,
+            epci=epci_2,
+        )
+        commune.years.add(self.year_1, self.year_2)
+        CommuneEpciMembership.objects.create(
+            commune=commune, epci=epci_1, year=self.year_1
+        )
+        CommuneEpciMembership.objects.create(
+            commune=commune, epci=epci_2, year=self.year_2
+        )
+        # An isolated commune
+        isolated = Commune.objects.create(
+            name="Île-de-Bréhat", insee="22016", siren="212200166", departement=dept
+        )
+        isolated.years.add(self.year_2)
+
+    def test_hierarchy_of_the_year(self) -> None:
+        # The dataset version, the year, then the hierarchy
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{API_ROOT}/hierarchy/01001?year=2020")
+        data = response.json()
+        self.assertEqual(data["year"], 2020)
+        self.assertEqual(
+            data["commune"],
+            {
+                "name": "L'Abergement-Clémenciat",
+                "insee": "01001",
+                "siren": "210100012",
+                "slug": "labergement-clemenciat-01001",
+            },
+        )
+        self.assertEqual(data["epci"]["siren"], "200042935")
+        self.assertEqual(data["epci"]["slug"], "cc-de-la-dombes-200042935")
+        self.assertEqual(data["departement"]["insee"], "01")
+        self.assertEqual(data["region"]["siren"], "200053767")
+
+        # The current EPCI, by default
+        response = self.client.get(f"{API_ROOT}/hierarchy/210100012")
+        self.assertEqual(response.json()["year"], None)
+        self.assertEqual(response.json()["epci"]["siren"], "200071751")
+
+        response = self.client.get(f"{API_ROOT}/hierarchy/22016?year=2021")
+        self.assertEqual(response.json()["epci"], None)
+
+        for path in ["22016?year=2020", "01001?year=2019", "01002", "01"]:
+            response = self.client.get(f"{API_ROOT}/hierarchy/{path}")
+            self.assertEqual(response.status_code, 404)
+
+    def test_hierarchy_batch(self) -> None:
+        payload = {"codes": ["01001", "212200166", "01002"], "year": 2021}
+        # The year, then the hierarchies
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                f"{API_ROOT}/hierarchy/batch",
+                json.dumps(payload),
+                content_type="application/json",
+            )
+        data = response.json()
+        self.assertEqual(data["missing"], ["01002"])
+        self.assertEqual(data["results"]["01001"]["epci"]["siren"], "200071751")
+        self.assertEqual(data["results"]["212200166"]["epci"], None)
+        self.assertEqual(data["results"]["212200166"]["departement"]["slug"], "ain")
@@ -0,0 +1,140 @@
+import json
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from francedata.management.commands.files_import import plan_import_stages
+from francedata.models import (
+    Commune,
+    CommuneData,
+    DataMapping,
+    DataSource,
+    DataSourceFile,
+    DataYear,
+    Departement,
+)
+from francedata.tests.testdata.sample_data import sample_commune_mapping
+
+
+def create_source_files() -> dict:
+    """
+    A file creating the communes of each year, and two data files for 2021
+    """
+    creating_mapping = DataMapping.objects.create(
+        name="Creating mapping",
+        file_format="csv",
+        mapping=json.loads(sample_commune_mapping),
+    )
+    data_mapping = DataMapping.objects.create(
+        name="Data mapping",
+        file_format="csv",
+        mapping={
+            **json.loads(sample_commune_mapping),
+            "collectivity_create": False,
+        },
+    )
+
+    files = {}
+    for year_value in [2021, 2020]:
+        year = DataYear.objects.create(year=year_value)
+        for insee in ["01", "2A", "56", "976"]:
+            departement, _created = Departement.objects.get_or_create(
+                insee=insee, defaults={"name": insee}
+            )
+            departement.years.add(year)
+        files[f"communes_{year_value}"] = DataSourceFile.objects.create(
+            name=f"Communes {year_value}",
+            data_file="sample_communes.csv",
+            data_mapping=creating_mapping,
+            source=DataSource.objects.create(title=f"COG {year_value}", year=year),
+        )
+
+    year = DataYear.objects.get(year=2021)
+    for name in ["data_a", "data_b"]:
+        files[name] = DataSourceFile.objects.create(
+            name=name,
+            data_file="sample_communes.csv",
+            data_mapping=data_mapping,
+            source=DataSource.objects.create(title=name, year=year),
+        )
+    return files
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class PlanImportStagesTestCase(TestCase):
+    def test_creating_files_come_first_by_year(self) -> None:
+        files = create_source_files()
+        stages = plan_import_stages(list(DataSourceFile.objects.order_by("id")))
+
+        self.assertEqual(
+            stages,
+            [
+                [files["communes_2020"]],
+                [files["communes_2021"]],
+                [files["data_a"], files["data_b"]],
+            ],
+        )
+
+
+    def test_creating_files_of_a_year_are_ordered_by_level(self) -> None:
+        files = create_source_files()
+        epci_mapping = DataMapping.objects.create(
+            name="EPCI mapping",
+            file_format="csv",
+            mapping={
+                **json.loads(sample_commune_mapping),
+                "collectivity_type": "epci",
+            },
+        )
+        epcis = DataSourceFile.objects.create(
+            name="EPCIs 2021",
+            data_file="sample_communes.csv",
+            data_mapping=epci_mapping,
+            source=DataSource.objects.create(
+                title="EPCIs 2021", year=DataYear.objects.get(year=2021)
+            ),
+        )
+
+        stages = plan_import_stages([epcis, files["communes_2021"]])
+        self.assertEqual(stages, [[files["communes_2021"]], [epcis]])
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class FilesImportTestCase(TestCase):
+    def test_snapshots_are_rebuilt_once_per_year(self) -> None:
+        create_source_files()
+
+        with mock.patch(
+            "francedata.management.commands.files_import.rebuild_snapshots"
+        ) as rebuild, self.assertLogs(level="INFO"):
+            call_command("files_import")
+
+        # The data files of 2021 touch the same levels as its communes file
+        levels = ["region", "departement", "epci", "commune"]
+        self.assertEqual(
+            rebuild.call_args_list,
+            [
+                mock.call(DataYear.objects.get(year=2020), levels),
+                mock.call(DataYear.objects.get(year=2021), levels),
+            ],
+        )
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class ParallelFilesImportTestCase(TransactionTestCase):
+    def test_files_are_imported_by_worker_processes(self) -> None:
+        create_source_files()
+
+        with self.assertLogs(level="INFO") as logs:
+            call_command("files_import", workers=2)
+
+        self.assertFalse(DataSourceFile.objects.filter(is_imported=False).exists())
+        self.assertEqual(Commune.objects.count(), 12)
+        # The data files write the same entries as the 2021 communes file
+        self.assertEqual(CommuneData.objects.filter(year__year=2020).count(), 336)
+        self.assertEqual(CommuneData.objects.filter(year__year=2021).count(), 336)
+        self.assertIn("INFO:root:Import de 2 fichiers avec 2 processus.", logs.output)
+        self.assertIn(
+            "INFO:root:L’import de data_b a été effectué avec succès.", logs.output
+        )
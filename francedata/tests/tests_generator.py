@@ -0,0 +1,76 @@
+import csv
+import tempfile
+from io import StringIO
+from zipfile import ZipFile
+
+import openpyxl_dictreader
+from django.test import TestCase
+
+from francedata.services.utils import parse_csv_from_stream
+from francedata.services.validators import validate_insee_commune, validate_siren
+from francedata.tests.testdata.generator import (
+    SyntheticFrance,
+    write_banatic_files,
+    write_cog_files,
+)
+
+
+class SyntheticFranceTestCase(TestCase):
+    def setUp(self) -> None:
+        self.dataset = SyntheticFrance(scale=0.01)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_generation_is_deterministic(self) -> None:
+        self.assertEqual(SyntheticFrance(scale=0.01).communes, self.dataset.communes)
+
+    def test_ids_are_valid(self) -> None:
+        for commune in self.dataset.communes:
+            validate_insee_commune(commune["insee"])
+            validate_siren(commune["siren"])
+        for epci in self.dataset.epcis:
+            validate_siren(epci["siren"])
+
+    def test_insee_ids_are_unique_at_national_scale(self) -> None:
+        for scale in [1, 2.5]:
+            communes = SyntheticFrance(scale=scale).communes
+            insee_ids = {commune["insee"] for commune in communes}
+            self.assertEqual(len(insee_ids), len(communes))
+            for insee in insee_ids:
+                validate_insee_commune(insee)
+
+    def test_scale_beyond_the_available_ids_is_rejected(self) -> None:
+        with self.assertRaisesMessage(ValueError, "Insee ids are available"):
+            SyntheticFrance(scale=3)
+
+    def test_cog_communes_file_is_parsed(self) -> None:
+        files = write_cog_files(self.dataset, self.directory.name, 2021)
+        with open(files["communes"], encoding="utf-8") as stream:
+            communes = parse_csv_from_stream(
+                stream,
+                {"insee": "COM", "name": "LIBELLE", "dept": "DEP"},
+                typecheck={"column": "TYPECOM", "value": "COM"},
+            )
+        self.assertEqual(len(communes), len(self.dataset.communes))
+        self.assertEqual(communes[0]["name"], self.dataset.communes[0]["name"])
+
+    def test_banatic_files_are_parsed(self) -> None:
+        files = write_banatic_files(self.dataset, self.directory.name, 2021)
+
+        with open(files["epcis"], "rb") as tsv_file:
+            content = tsv_file.read().decode("cp1252")
+        rows = list(csv.DictReader(StringIO(content, newline="\n"), delimiter="\t"))
+        self.assertEqual(len(rows), len(self.dataset.communes))
+        self.assertEqual(
+            {row["N° SIREN"] for row in rows},
+            {epci["siren"] for epci in self.dataset.epcis},
+        )
+
+        with ZipFile(files["siren_insee"]) as zip_file:
+            with zip_file.open("Banatic_SirenInsee2021.xlsx") as xlsx_file:
+                reader = openpyxl_dictreader.DictReader(xlsx_file, "insee_siren")
+                first_row = next(iter(reader))
+        self.assertEqual(first_row["siren"], self.dataset.communes[0]["siren"])
+        self.assertEqual(first_row["ptot_2021"], self.dataset.communes[0]["population"])
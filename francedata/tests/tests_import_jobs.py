@@ -0,0 +1,279 @@
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from francedata.models import (
+    Commune,
+    DataMapping,
+    DataSource,
+    DataSourceFile,
+    DataYear,
+    Departement,
+    ImportJob,
+    SubdivisionCount,
+)
+from francedata.tests.testdata.sample_data import sample_commune_mapping
+
+
+def create_source_files(count: int = 1) -> list:
+    mapping = DataMapping.objects.create(
+        name="Test mapping",
+        file_format="csv",
+        mapping=json.loads(sample_commune_mapping),
+    )
+    year = DataYear.objects.create(year=2021)
+    for insee, name in [("01", "Ain"), ("2A", "Corse-du-Sud"), ("56", "Morbihan")]:
+        Departement.objects.create(insee=insee, name=name).years.add(year)
+    Departement.objects.create(insee="976", name="Mayotte").years.add(year)
+
+    return [
+        DataSourceFile.objects.create(
+            name=f"Test csv source file {i}",
+            data_file="sample_communes.csv",
+            data_mapping=mapping,
+            source=DataSource.objects.create(title=f"Sample source {i}", year=year),
+        )
+        for i in range(count)
+    ]
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class ImportJobTestCase(TestCase):
+    def setUp(self) -> None:
+        self.source_file = create_source_files()[0]
+
+    def test_file_import_is_queued_once(self) -> None:
+        job, created = ImportJob.enqueue(self.source_file)
+        self.assertTrue(created)
+        self.assertEqual(job.status, ImportJob.PENDING)
+
+        same_job, created = ImportJob.enqueue(self.source_file)
+        self.assertFalse(created)
+        self.assertEqual(same_job, job)
+
+    def test_file_import_can_be_queued_again_once_finished(self) -> None:
+        job, _created = ImportJob.enqueue(self.source_file)
+        job.status = ImportJob.SUCCESS
+        job.save()
+
+        _job, created = ImportJob.enqueue(self.source_file)
+        self.assertTrue(created)
+
+    def test_oldest_pending_job_is_claimed(self) -> None:
+        self.assertIsNone(ImportJob.claim_next("worker"))
+        job, _created = ImportJob.enqueue(self.source_file)
+
+        claimed = ImportJob.claim_next("worker")
+        self.assertEqual(claimed, job)
+        self.assertEqual(claimed.status, ImportJob.RUNNING)
+        self.assertEqual(claimed.worker, "worker")
+        self.assertIsNotNone(claimed.started_at)
+        self.assertIsNone(ImportJob.claim_next("worker"))
+
+    def test_job_run_imports_the_file_and_reports_progress(self) -> None:
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+
+        self.assertTrue(job.run())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCESS)
+        self.assertEqual(job.rows_done, 12)
+        self.assertEqual(job.rows_total, 12)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(Commune.objects.count(), 12)
+        self.source_file.refresh_from_db()
+        self.assertTrue(self.source_file.is_imported)
+
+    def test_skipped_import_refreshes_nothing(self) -> None:
+        self.source_file.import_file_data()
+        self.source_file.mark_imported()
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+
+        with mock.patch(
+            "francedata.models.sources.bump_dataset_version"
+        ) as bump_dataset_version:
+            self.assertTrue(job.run())
+        bump_dataset_version.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCESS)
+        self.assertIn("import ignoré", job.messages[0])
+
+    def test_job_failure_is_recorded(self) -> None:
+        mapping = self.source_file.data_mapping
+        mapping.mapping["collectivity_type"] = "canton"
+        mapping.save()
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+
+        self.assertFalse(job.run())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.messages, ["Type de collectivité non reconnu"])
+        self.source_file.refresh_from_db()
+        self.assertFalse(self.source_file.is_imported)
+
+    def test_failure_after_the_import_is_recorded(self) -> None:
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+
+        with mock.patch.object(
+            DataSourceFile, "mark_imported", side_effect=ValueError("Rollup failed")
+        ), self.assertLogs(level="ERROR"):
+            self.assertFalse(job.run())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.messages, ["ValueError: Rollup failed"])
+
+    def test_stale_running_job_is_expired(self) -> None:
+        job, _created = ImportJob.enqueue(self.source_file)
+        ImportJob.claim_next("worker")
+        # The worker crashed two hours ago
+        ImportJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(hours=2)
+        )
+
+        new_job, created = ImportJob.enqueue(self.source_file)
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+        # Running jobs with a recent progress are kept
+        ImportJob.claim_next("worker")
+        with override_settings(FRANCEDATA_IMPORT_JOB_TIMEOUT=60):
+            self.assertEqual(ImportJob.expire_stale_jobs(), 0)
+            self.assertEqual(ImportJob.enqueue(self.source_file), (new_job, False))
+
+    def test_post_import_steps_keep_the_job_alive(self) -> None:
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+        expired = []
+
+        def refresh_counts(year):
+            # The counts took two hours
+            ImportJob.objects.filter(pk=job.pk).update(
+                updated_at=timezone.now() - timedelta(hours=2)
+            )
+
+        def rollup_data():
+            expired.append(ImportJob.expire_stale_jobs())
+
+        with mock.patch.object(
+            SubdivisionCount, "refresh", side_effect=refresh_counts
+        ), mock.patch.object(DataSourceFile, "rollup_data", side_effect=rollup_data):
+            self.assertTrue(job.run())
+        self.assertEqual(expired, [0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCESS)
+
+    def test_result_of_an_expired_job_is_not_recorded(self) -> None:
+        ImportJob.enqueue(self.source_file)
+        job = ImportJob.claim_next("worker")
+
+        def rollup_data():
+            # The job was expired by another process meanwhile
+            ImportJob.objects.filter(pk=job.pk).update(
+                updated_at=timezone.now() - timedelta(hours=2)
+            )
+            ImportJob.expire_stale_jobs()
+
+        with mock.patch.object(
+            DataSourceFile, "rollup_data", side_effect=rollup_data
+        ), self.assertLogs(level="WARNING"):
+            self.assertFalse(job.run())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(
+            job.messages, ["Tâche expirée : le worker ne l’a pas terminée"]
+        )
+
+    def test_worker_drains_the_queue(self) -> None:
+        ImportJob.enqueue(self.source_file)
+        # The test transaction must not be closed between the jobs
+        with mock.patch(
+            "francedata.management.commands.import_worker.close_old_connections"
+        ):
+            call_command("import_worker", once=True)
+
+        self.assertEqual(ImportJob.objects.filter(status=ImportJob.SUCCESS).count(), 1)
+        self.assertEqual(Commune.objects.count(), 12)
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class ImportJobAdminTestCase(TestCase):
+    def setUp(self) -> None:
+        self.source_file = create_source_files()[0]
+        user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+
+    def test_admin_import_button_queues_the_import(self) -> None:
+        url = reverse(
+            "admin:francedata_datasourcefile_change", args=[self.source_file.pk]
+        )
+        data = {
+            "name": self.source_file.name,
+            "data_mapping": self.source_file.data_mapping.pk,
+            "source": self.source_file.source.pk,
+            "_import_file_data": "1",
+        }
+        response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.source_file.import_jobs.count(), 1)
+        self.assertEqual(Commune.objects.count(), 0)
+
+    def test_progress_of_the_last_job_can_be_polled(self) -> None:
+        url = reverse(
+            "admin:francedata_datasourcefile_import_progress",
+            args=[self.source_file.pk],
+        )
+        self.assertEqual(self.client.get(url).json(), {"job": None})
+
+        job, _created = ImportJob.enqueue(self.source_file)
+        job.update_progress(1000, 4000)
+
+        progress = self.client.get(url).json()["job"]
+        self.assertEqual(progress["status"], ImportJob.PENDING)
+        self.assertEqual(progress["rows_done"], 1000)
+        self.assertEqual(progress["rows_total"], 4000)
+        self.assertFalse(progress["finished"])
+
+
+@override_settings(MEDIA_ROOT="francedata/tests/testdata")
+class ImportJobConcurrencyTestCase(TransactionTestCase):
+    def test_jobs_locked_by_a_worker_are_skipped(self) -> None:
+        first, second = create_source_files(2)
+        first_job, _created = ImportJob.enqueue(first)
+        second_job, _created = ImportJob.enqueue(second)
+
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock() -> None:
+            # Another worker, in the middle of claiming the first job
+            try:
+                with transaction.atomic():
+                    ImportJob.objects.select_for_update().get(pk=first_job.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(ImportJob.claim_next("worker"), second_job)
+            self.assertIsNone(ImportJob.claim_next("worker"))
+        finally:
+            release.set()
+            thread.join()
@@ -1,11 +1,20 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 from django.db import IntegrityError
 from django.core.exceptions import ValidationError
 from django.test import override_settings
+from unittest import mock
+from contextlib import redirect_stdout
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
 
 from francedata.models import (
     Commune,
     CommuneData,
+    CommuneEpciMembership,
+    CommuneSnapshot,
     DataMapping,
     DataSourceFile,
     DepartementData,
@@ -17,10 +26,16 @@ from francedata.models import (
     Metadata,
     Region,
     RegionData,
+    SubdivisionCount,
+    normalize_search_name,
 )
 
+from francedata.models.collectivity import typed_values
+from francedata.services.dataset_version import get_dataset_version
+from francedata.services.utils import batched, get_fieldfile_hash
 from francedata.tests.testdata.sample_data import sample_commune_mapping
 
+import hashlib
 import json
 
 
@@ -177,6 +192,126 @@ class DataSourceFileTestCase(TestCase):
             ).datatype,
             "int",
         )
+        self.assertEqual(
+            CommuneData.objects.get(
+                commune__insee="01001", datacode="pop_muni"
+            ).value_int,
+            771,
+        )
+
+    def test_interrupted_import_resumes_from_the_last_batch(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        import_batch = test_item.import_commune_batch
+        imported_rows = []
+
+        def failing_batch(rows):
+            if imported_rows:
+                raise RuntimeError("Interrupted")
+            import_batch(rows)
+            imported_rows.extend(rows)
+
+        with mock.patch(
+            "francedata.models.sources.batched", lambda rows: batched(rows, 5)
+        ):
+            with mock.patch.object(test_item, "import_commune_batch", failing_batch):
+                with self.assertRaises(RuntimeError):
+                    test_item.import_file_data()
+
+            test_item = DataSourceFile.objects.get(name="Test csv source file")
+            self.assertEqual(test_item.checkpoint_offset, 5)
+            self.assertEqual(Commune.objects.count(), 5)
+
+            with mock.patch.object(
+                test_item, "import_commune_batch", wraps=test_item.import_commune_batch
+            ) as resumed_batch:
+                self.assertTrue(test_item.import_file_data()["success"])
+
+        self.assertEqual(sum(len(c.args[0]) for c in resumed_batch.call_args_list), 7)
+        self.assertEqual(Commune.objects.count(), 12)
+        self.assertEqual(CommuneData.objects.count(), 336)
+        test_item.refresh_from_db()
+        self.assertEqual(test_item.checkpoint_offset, 0)
+
+    def test_import_restarts_when_asked_or_when_the_file_changed(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        content_hash = get_fieldfile_hash(test_item.data_file)
+
+        for restart, checkpoint_hash, expected_rows in [
+            (False, content_hash, 7),
+            (True, content_hash, 12),
+            (False, "previous content", 12),
+        ]:
+            test_item.checkpoint_offset = 5
+            test_item.checkpoint_hash = checkpoint_hash
+            with mock.patch.object(test_item, "import_commune_batch") as import_batch:
+                test_item.import_file_data(restart=restart)
+            self.assertEqual(
+                sum(len(c.args[0]) for c in import_batch.call_args_list),
+                expected_rows,
+            )
+
+    def test_content_hash_and_mapping_version_are_stored_on_upload(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        with open("francedata/tests/testdata/sample_communes.csv", "rb") as f:
+            self.assertEqual(
+                test_item.content_hash, hashlib.sha256(f.read()).hexdigest()
+            )
+        self.assertEqual(
+            test_item.data_mapping_version,
+            test_item.data_mapping.history.latest().history_id,
+        )
+
+    def test_import_of_content_already_imported_is_skipped(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        test_item.import_file_data()
+        test_item.mark_imported()
+
+        copy = DataSourceFile.objects.create(
+            name="Copy of the csv source file",
+            data_file="sample_communes.csv",
+            data_mapping=test_item.data_mapping,
+            source=DataSource.objects.create(title="Copy", year=test_item.source.year),
+        )
+        for item in [copy, test_item]:
+            with mock.patch.object(item, "import_commune_batch") as import_batch:
+                response = item.import_file_data()
+            self.assertTrue(response["success"])
+            self.assertTrue(response["skipped"])
+            import_batch.assert_not_called()
+
+        # Nothing is refreshed for a skipped import, as no data changed
+        with mock.patch.object(
+            DataSourceFile, "rollup_data"
+        ) as rollup_data, mock.patch(
+            "francedata.models.sources.bump_dataset_version"
+        ) as bump_dataset_version:
+            copy.mark_imported(skipped=True)
+        rollup_data.assert_not_called()
+        bump_dataset_version.assert_not_called()
+        copy.refresh_from_db()
+        self.assertTrue(copy.is_imported)
+
+        with mock.patch.object(copy, "import_commune_batch") as import_batch:
+            response = copy.import_file_data(restart=True)
+        self.assertNotIn("skipped", response)
+        import_batch.assert_called()
+
+    def test_import_is_not_skipped_after_a_mapping_change(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        test_item.import_file_data()
+        test_item.mark_imported()
+
+        mapping = test_item.data_mapping
+        mapping.name = "Edited mapping"
+        mapping.save()
+
+        with mock.patch.object(test_item, "import_commune_batch") as import_batch:
+            response = test_item.import_file_data()
+        self.assertNotIn("skipped", response)
+        import_batch.assert_called()
+        self.assertEqual(
+            test_item.data_mapping_version, mapping.history.latest().history_id
+        )
 
     def test_source_file_is_not_marked_as_imported_by_default(self) -> None:
         test_item = DataSourceFile.objects.get(name="Test xlsx source file")
@@ -189,6 +324,53 @@ class DataSourceFileTestCase(TestCase):
         self.assertTrue(test_item.is_imported)
         self.assertIsNotNone(test_item.imported_at)
 
+    def test_marking_source_file_as_imported_changes_dataset_version(self) -> None:
+        self.assertIsNone(get_dataset_version())
+        test_item = DataSourceFile.objects.get(name="Test xlsx source file")
+        test_item.mark_imported()
+        self.assertIsNotNone(get_dataset_version())
+
+    def test_imported_commune_data_is_rolled_up(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        mapping = test_item.data_mapping
+        for field in mapping.mapping["data_fields"]:
+            if field["fieldname_database"] == "pop_muni":
+                field["rollup"] = "sum"
+        mapping.save()
+
+        test_item.import_file_data()
+        test_item.mark_imported()
+
+        communes = Commune.objects.filter(departement__insee="01")
+        self.assertEqual(
+            DepartementData.objects.get(
+                departement__insee="01", datacode="pop_muni"
+            ).value_int,
+            sum(
+                CommuneData.objects.filter(
+                    commune__in=communes, datacode="pop_muni"
+                ).values_list("value_int", flat=True)
+            ),
+        )
+        # The population of the communes created by the file is rolled up too
+        self.assertEqual(
+            DepartementData.objects.get(
+                departement__insee="01", datacode="population"
+            ).value_int,
+            sum(communes.values_list("population", flat=True)),
+        )
+
+    @override_settings(FRANCEDATA_SNAPSHOTS=True)
+    def test_snapshots_are_rebuilt_after_import(self) -> None:
+        test_item = DataSourceFile.objects.get(name="Test csv source file")
+        test_item.import_file_data()
+        test_item.mark_imported()
+
+        self.assertEqual(CommuneSnapshot.objects.count(), 12)
+        snapshot = CommuneSnapshot.objects.get(insee="01001")
+        self.assertEqual(snapshot.data["pop_muni"], 771)
+        self.assertEqual(snapshot.departement_insee, "01")
+
 
 class RegionTestCase(TestCase):
     def setUp(self) -> None:
@@ -249,6 +431,62 @@ class RegionTestCase(TestCase):
 
         self.assertEqual(test_region.subdivisions_count()["communes"], 3)
 
+    def test_region_subdivisions_are_precomputed_per_year(self) -> None:
+        year = DataYear.objects.get(year=2021)
+        for dept in Departement.objects.filter(region__insee=11):
+            dept.years.add(year)
+        Commune.objects.get(insee="01001").years.add(year)
+        SubdivisionCount.refresh(year)
+
+        test_region = Region.objects.get(insee=11)
+        with self.assertNumQueries(1):
+            counts = test_region.subdivisions_count()
+        self.assertEqual(counts, {"departements": 2, "epcis": 0, "communes": 1})
+        self.assertEqual(
+            Departement.objects.get(insee="02").subdivisions_count(),
+            {"epcis": 0, "communes": 0},
+        )
+
+    def test_admin_links_the_subdivisions_of_the_counted_year(self) -> None:
+        year = DataYear.objects.get(year=2021)
+        Departement.objects.get(insee="01").years.add(year)
+        SubdivisionCount.refresh(year)
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+
+        response = self.client.get("/admin/francedata/region/")
+        region = Region.objects.get(insee=11)
+        self.assertContains(
+            response,
+            f'<a href="/admin/francedata/departement/?region__id__exact={region.id}'
+            f'&amp;years__id__exact={year.id}">1 département</a>',
+            html=True,
+        )
+        response = self.client.get(
+            "/admin/francedata/departement/",
+            {"region__id__exact": region.id, "years__id__exact": year.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+    def test_region_subdivisions_are_counted_for_the_year(self) -> None:
+        # Without precomputed counts
+        year = DataYear.objects.get(year=2021)
+        Departement.objects.get(insee="01").years.add(year)
+        Commune.objects.get(insee="01002").years.add(year)
+
+        test_region = Region.objects.get(insee=11)
+        self.assertEqual(
+            test_region.subdivisions_count(2021),
+            {"departements": 1, "epcis": 0, "communes": 1},
+        )
+        self.assertEqual(
+            test_region.subdivisions_count(),
+            {"departements": 2, "epcis": 0, "communes": 3},
+        )
+        self.assertFalse(hasattr(Commune, "subdivisions_count"))
+
     def test_region_cant_have_invalid_siren(self) -> None:
         with self.assertRaises(ValidationError):
             test_region = Region.objects.get(insee=11)
@@ -321,6 +559,21 @@ class DepartementTestCase(TestCase):
         test_item = Departement.objects.get(insee="01")
         self.assertEqual(test_item.list_epcis().count(), 2)
 
+    def test_departement_has_epcis_of_the_year(self) -> None:
+        test_item = Departement.objects.get(insee="01")
+        year1, year2 = DataYear.objects.order_by("year")
+        commune = Commune.objects.get(insee="01001")
+        CommuneEpciMembership.objects.create(
+            commune=commune, epci=commune.epci, year=year1
+        )
+
+        self.assertQuerysetEqual(
+            test_item.list_epcis(year1), [commune.epci], ordered=False
+        )
+        self.assertEqual(test_item.list_epcis(year2).count(), 0)
+        self.assertQuerysetEqual(commune.epci.list_communes(year1), [commune])
+        self.assertEqual(commune.epci.list_communes(year2).count(), 0)
+
     def test_departement_cant_have_invalid_siren(self) -> None:
         with self.assertRaises(ValidationError):
             test_item = Departement.objects.get(insee="01")
@@ -438,6 +691,21 @@ class CommuneTestCase(TestCase):
         )
         self.assertEqual(test_item.slug, "le-boeuf-etoile-01010")
 
+    def test_commune_search_name_is_normalized(self) -> None:
+        dept = Departement.objects.get(insee="01")
+        test_item = Commune.objects.create(
+            name="Le Bœuf Étoilé", insee="01010", departement=dept
+        )
+        self.assertEqual(test_item.search_name, "le boeuf etoile")
+
+    def test_search_name_is_cut_to_the_field_length(self) -> None:
+        # Each "Œ" is transliterated to two characters
+        search_name = normalize_search_name("Œ" * 100)
+        self.assertEqual(search_name, "oe" * 50)
+        self.assertEqual(
+            len(search_name), Commune._meta.get_field("search_name").max_length
+        )
+
 
 class RegionDataTestCase(TestCase):
     def setUp(self) -> None:
@@ -596,3 +864,108 @@ class DepartementDataTestCase(TestCase):
                 value="Test data duplicate",
                 source=source,
             )
+
+    def test_commune_data_numeric_values_are_typed(self) -> None:
+        commune = Commune.objects.get(insee="01001")
+        year = DataYear.objects.get(year=2020)
+        source = DataSource.objects.get(title="Test title", year=year)
+
+        entry = CommuneData.objects.create(
+            commune=commune,
+            year=year,
+            datacode="superficie",
+            value="1 234,5",
+            datatype="float",
+            source=source,
+        )
+        entry.refresh_from_db()
+        self.assertIsNone(entry.value_int)
+        self.assertEqual(entry.value_numeric, Decimal("1234.5"))
+
+        entry = CommuneData.objects.get(datacode="property")
+        self.assertIsNone(entry.value_numeric)
+
+    def test_commune_data_ranking(self) -> None:
+        dept = Departement.objects.get(insee="11")
+        year = DataYear.objects.get(year=2020)
+        source = DataSource.objects.get(title="Test title", year=year)
+        for insee, value in [("11001", "300"), ("11002", "N/A"), ("11003", "120")]:
+            CommuneData.objects.create(
+                commune=Commune.objects.create(
+                    name=f"Commune {insee}", insee=insee, departement=dept
+                ),
+                year=year,
+                datacode="pop_muni",
+                value=value,
+                datatype="int",
+                source=source,
+            )
+
+        ranking = CommuneData.objects.ranking("pop_muni", parent=dept)
+        self.assertEqual([entry.commune.insee for entry in ranking], ["11001", "11003"])
+        ranking = CommuneData.objects.ranking(
+            "pop_muni", 2020, descending=False, min_value=Decimal(100)
+        )
+        self.assertEqual(ranking.first().value, "120")
+
+        with self.assertRaises(ValueError):
+            CommuneData.objects.ranking("pop_muni", parent=Commune.objects.first())
+
+
+class TypedValuesTestCase(TestCase):
+    def test_int_values_are_stored_in_both_columns(self) -> None:
+        self.assertEqual(
+            typed_values("int", "771"),
+            {"value_int": 771, "value_numeric": Decimal("771")},
+        )
+
+    def test_decimal_values_are_only_stored_as_numeric(self) -> None:
+        self.assertEqual(
+            typed_values("float", "12.25"),
+            {"value_int": None, "value_numeric": Decimal("12.25")},
+        )
+        self.assertEqual(typed_values("int", "12,5")["value_int"], None)
+
+    def test_non_numeric_values_are_not_stored(self) -> None:
+        empty = {"value_int": None, "value_numeric": None}
+        self.assertEqual(typed_values("string", "771"), empty)
+        self.assertEqual(typed_values("int", "N/A"), empty)
+        self.assertEqual(typed_values("int", ""), empty)
+        self.assertEqual(typed_values("int", None), empty)
+        self.assertEqual(typed_values("float", "NaN"), empty)
+        self.assertEqual(typed_values("float", "1e30"), empty)
+
+    def test_existing_data_can_be_backfilled(self) -> None:
+        dept = Departement.objects.create(insee="11", name="Test departement")
+        commune = Commune.objects.create(
+            name="Commune", insee="11001", departement=dept
+        )
+        year = DataYear.objects.create(year=2020)
+        source = DataSource.objects.create(title="Test title", year=year)
+        # Created without the typed values, as before they existed
+        CommuneData.objects.bulk_create(
+            [
+                CommuneData(
+                    commune=commune,
+                    year=year,
+                    datacode=datacode,
+                    value=value,
+                    datatype=datatype,
+                    source=source,
+                )
+                for datacode, value, datatype in [
+                    ("pop_muni", "771", "int"),
+                    ("densite", "12,5", "float"),
+                    ("nom", "Commune", "string"),
+                ]
+            ]
+        )
+
+        with redirect_stdout(StringIO()):
+            call_command("backfill_typed_values", batch_size=1)
+
+        self.assertEqual(
+            dict(CommuneData.objects.values_list("datacode", "value_numeric")),
+            {"pop_muni": Decimal("771"), "densite": Decimal("12.5"), "nom": None},
+        )
+        self.assertEqual(CommuneData.objects.get(datacode="pop_muni").value_int, 771)
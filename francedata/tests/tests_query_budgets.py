@@ -0,0 +1,342 @@
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+
+from francedata.models import (
+    Commune,
+    DataMapping,
+    DataSource,
+    DataSourceFile,
+    DataYear,
+    Departement,
+    DepartementData,
+    Epci,
+    EpciData,
+    Region,
+    RegionData,
+    SubdivisionCount,
+)
+from francedata.services.banatic import (
+    import_commune_data_from_banatic,
+    import_epci_data_from_banatic,
+)
+from francedata.services.cog import (
+    import_communes_from_cog,
+    import_departements_from_cog,
+    import_regions_from_cog,
+)
+from francedata.services.rollup import rollup_commune_data
+from francedata.services.utils import parse_csv_from_stream
+from francedata.tests.query_budget import QueryBudgetTestCase
+from francedata.tests.testdata.generator import (
+    COMMUNES_DATA_MAPPING,
+    SyntheticFrance,
+    populate_database,
+    write_banatic_files,
+    write_cog_files,
+    write_communes_data_file,
+)
+
+API_ROOT = "/api/france"
+YEAR = 2021
+
+
+def populate_collectivities(scale: float) -> SyntheticFrance:
+    """
+    Loads a dataset, with data for each collectivity. The number of datacodes
+    grows with the scale, like the number of collectivities.
+    """
+    dataset = SyntheticFrance(scale)
+    datacodes = [f"code_{i}" for i in range(round(scale * 400))]
+    year_entries = populate_database(dataset, [YEAR - 1, YEAR], datacodes)
+
+    for year_entry in year_entries:
+        source = DataSource.objects.get(year=year_entry)
+        for model, collectivities in [
+            (RegionData, Region.objects.all()),
+            (DepartementData, Departement.objects.all()),
+            (EpciData, Epci.objects.all()),
+        ]:
+            model.objects.bulk_create(
+                [
+                    model(
+                        **{model.collectivity_field: collectivity},
+                        year=year_entry,
+                        datacode=datacode,
+                        value="1",
+                        source=source,
+                    )
+                    for collectivity in collectivities
+                    for datacode in datacodes
+                ]
+            )
+    return dataset
+
+
+class ApiQueryBudgetTestCase(QueryBudgetTestCase):
+    def assertEndpointBudget(self, budget: int, get_path, method: str = "get"):
+        def call(dataset: SyntheticFrance) -> None:
+            path, params = get_path(dataset)
+            if method == "post":
+                response = self.client.post(
+                    API_ROOT + path, json.dumps(params), "application/json"
+                )
+            else:
+                response = self.client.get(API_ROOT + path, params)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+        self.assertQueryBudget(budget, populate_collectivities, call)
+
+    def test_search(self) -> None:
+        self.assertEndpointBudget(
+            8, lambda dataset: ("/subdivisions/saint", {"year": YEAR})
+        )
+        self.assertEndpointBudget(
+            8,
+            lambda dataset: ("/subdivisions/0", {"category": "communes", "year": YEAR}),
+        )
+
+    def test_lists(self) -> None:
+        for path in ["/regions", "/departements", "/epcis", "/communes"]:
+            with self.subTest(path=path):
+                self.assertEndpointBudget(6, lambda dataset: (path, {}))
+
+    def test_details(self) -> None:
+        for path in [
+            lambda dataset: f"/regions/{dataset.regions[0]['siren']}",
+            lambda dataset: f"/departements/{dataset.departements[0]['siren']}",
+            lambda dataset: f"/epcis/{dataset.epcis[0]['siren']}",
+            lambda dataset: f"/communes/{dataset.communes[0]['siren']}",
+            lambda dataset: f"/communes/siren/{dataset.communes[0]['siren']}",
+            lambda dataset: f"/communes/insee/{dataset.communes[0]['insee']}",
+        ]:
+            with self.subTest(path=path):
+                self.assertEndpointBudget(6, lambda dataset: (path(dataset), {}))
+
+    def test_batches(self) -> None:
+        for path, level, identifier in [
+            ("/regions/batch", "regions", "siren"),
+            ("/departements/batch", "departements", "insee"),
+            ("/epcis/batch", "epcis", "siren"),
+            ("/communes/batch", "communes", "siren"),
+        ]:
+            with self.subTest(path=path):
+                self.assertEndpointBudget(
+                    6,
+                    lambda dataset: (
+                        path,
+                        {
+                            "codes": [
+                                item[identifier] for item in getattr(dataset, level)
+                            ]
+                        },
+                    ),
+                    method="post",
+                )
+
+    def test_data(self) -> None:
+        for level, collectivities in [
+            ("region", "regions"),
+            ("departement", "departements"),
+            ("epci", "epcis"),
+            ("commune", "communes"),
+        ]:
+            for suffix in ["", "/latest", f"/{YEAR}"]:
+                with self.subTest(level=level, suffix=suffix):
+                    self.assertEndpointBudget(
+                        6,
+                        lambda dataset: (
+                            f"/{level}data/"
+                            f"{getattr(dataset, collectivities)[0]['siren']}{suffix}",
+                            {},
+                        ),
+                    )
+
+    def test_exports(self) -> None:
+        for level in ["region", "departement", "epci", "commune"]:
+            with self.subTest(level=level):
+                self.assertEndpointBudget(
+                    3, lambda dataset: (f"/export/{level}data", {"year": YEAR})
+                )
+
+
+class AdminQueryBudgetTestCase(QueryBudgetTestCase):
+    def setUp(self) -> None:
+        user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(user)
+
+    def test_changelists(self) -> None:
+        def populate(scale: float) -> None:
+            for year_entry in populate_database(SyntheticFrance(scale), [YEAR]):
+                SubdivisionCount.refresh(year_entry)
+
+        for level in ["region", "departement", "epci"]:
+            with self.subTest(level=level):
+
+                def call(fixture) -> None:
+                    response = self.client.get(f"/admin/francedata/{level}/")
+                    self.assertEqual(response.status_code, 200)
+
+                self.assertQueryBudget(10, populate, call)
+
+
+COG_LEVELS = {
+    import_regions_from_cog: "regions",
+    import_departements_from_cog: "departements",
+    import_communes_from_cog: "communes",
+}
+
+
+class ImporterQueryBudgetTestCase(QueryBudgetTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_cog_files(self, scale: float) -> dict:
+        dataset = SyntheticFrance(scale)
+        files = write_cog_files(dataset, self.directory.name, YEAR)
+        # The files are read from the disk instead of data.gouv.fr
+        return {
+            f"https://www.data.gouv.fr/{level}.csv": path
+            for level, path in files.items()
+        }
+
+    def run_cog_import(self, import_function, files: dict) -> None:
+        def read_file(url, column_names, typecheck=False):
+            with open(files[url], encoding="utf-8") as stream:
+                return parse_csv_from_stream(stream, column_names, typecheck)
+
+        datagouv_files = {
+            YEAR: {"title": f"Liste {YEAR}", "url": url, "year": YEAR}
+            for url in files
+            if os.path.basename(url) == f"{COG_LEVELS[import_function]}.csv"
+        }
+        with mock.patch(
+            "francedata.services.cog.get_datagouv_file", return_value=datagouv_files
+        ), mock.patch(
+            "francedata.services.cog.parse_csv_from_url", side_effect=read_file
+        ), redirect_stdout(
+            StringIO()
+        ):
+            import_function(YEAR)
+
+    def assertCogImportBudget(self, budget: int, import_function, previous=()):
+        def populate(scale: float) -> dict:
+            files = self.write_cog_files(scale)
+            for previous_function in previous:
+                self.run_cog_import(previous_function, files)
+            return files
+
+        self.assertQueryBudget(
+            budget, populate, lambda files: self.run_cog_import(import_function, files)
+        )
+
+    def test_cog_regions(self) -> None:
+        self.assertCogImportBudget(25, import_regions_from_cog)
+
+    def test_cog_departements(self) -> None:
+        self.assertCogImportBudget(
+            20, import_departements_from_cog, [import_regions_from_cog]
+        )
+
+    def test_cog_communes(self) -> None:
+        self.assertCogImportBudget(
+            20,
+            import_communes_from_cog,
+            [import_regions_from_cog, import_departements_from_cog],
+        )
+
+    def populate_banatic(self, scale: float) -> dict:
+        dataset = SyntheticFrance(scale)
+        populate_database(dataset, [YEAR])
+        # The EPCIs are created by the import
+        Commune.objects.update(epci=None)
+        Epci.objects.all().delete()
+
+        files = write_banatic_files(dataset, self.directory.name, YEAR)
+        contents = {}
+        for level, path in files.items():
+            with open(path, "rb") as source_file:
+                contents[level] = source_file.read()
+        return contents
+
+    def test_banatic_communes(self) -> None:
+        def run_import(contents: dict) -> None:
+            with mock.patch("francedata.services.banatic.requests.get") as get:
+                get.return_value.content = contents["siren_insee"]
+                with redirect_stdout(StringIO()):
+                    import_commune_data_from_banatic(YEAR)
+
+        self.assertQueryBudget(15, self.populate_banatic, run_import)
+
+    def test_banatic_epcis(self) -> None:
+        def run_import(contents: dict) -> None:
+            datagouv_files = {YEAR: {"url": "https://www.data.gouv.fr/epci.xls"}}
+            with mock.patch(
+                "francedata.services.banatic.get_datagouv_file",
+                return_value=datagouv_files,
+            ), mock.patch("francedata.services.banatic.requests.get") as get:
+                get.return_value.content = contents["epcis"]
+                with redirect_stdout(StringIO()):
+                    import_epci_data_from_banatic(YEAR)
+
+        # Including the memberships of the year, replaced in bulk
+        self.assertQueryBudget(20, self.populate_banatic, run_import)
+
+    def assertFileImportBudget(self, budget: int, mapping: dict, keep_communes: bool):
+        def populate(scale: float) -> DataSourceFile:
+            dataset = SyntheticFrance(scale)
+            year_entry = populate_database(dataset, [YEAR])[0]
+            if not keep_communes:
+                Commune.objects.all().delete()
+
+            path = write_communes_data_file(dataset, self.directory.name, YEAR)
+            with open(path, "rb") as data_file:
+                content = ContentFile(data_file.read(), name="communes.csv")
+            return DataSourceFile(
+                data_file=content,
+                data_mapping=DataMapping.objects.create(
+                    name="Communes", file_format="csv", mapping=mapping
+                ),
+                source=DataSource.objects.create(title="Communes", year=year_entry),
+            )
+
+        def run_import(source_file: DataSourceFile) -> None:
+            self.assertTrue(source_file.import_file_data()["success"])
+
+        self.assertQueryBudget(budget, populate, run_import)
+
+    def test_file_import(self) -> None:
+        self.assertFileImportBudget(10, COMMUNES_DATA_MAPPING, keep_communes=True)
+
+    def test_file_import_with_communes_creation(self) -> None:
+        mapping = {
+            **COMMUNES_DATA_MAPPING,
+            "collectivity_create": True,
+            "collectivity_create_fields": {
+                "name": "NomCom",
+                "siren": "SIREN",
+                "population": "PopTot",
+                "dept": "CodeDep",
+            },
+        }
+        self.assertFileImportBudget(14, mapping, keep_communes=False)
+
+    def test_rollup(self) -> None:
+        def populate(scale: float) -> DataYear:
+            return populate_database(SyntheticFrance(scale), [YEAR], ["code_0"])[0]
+
+        def run_rollup(year_entry: DataYear) -> None:
+            rollup_commune_data(year_entry, {"population": "sum", "code_0": "avg"})
+
+        self.assertQueryBudget(20, populate, run_rollup)
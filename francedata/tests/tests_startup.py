@@ -0,0 +1,12 @@
+from django.test import SimpleTestCase
+
+from francedata.tests.startup import run_startup
+
+
+class StartupTestCase(SimpleTestCase):
+    def test_models_do_not_load_the_importers_dependencies(self) -> None:
+        # A new interpreter is needed, the test runner has already loaded everything
+        result = run_startup()
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), [])